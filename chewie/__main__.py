@@ -1,8 +1,11 @@
 import logging
+import multiprocessing
+import os
 import sys
 import argparse
 
 from chewie.chewie import Chewie
+from chewie.nfv_sockets import PromiscuousSocket
 
 
 def get_logger(name, log_level=logging.DEBUG):
@@ -45,15 +48,50 @@ def main():
     parser.add_argument('-rs', '--radius_secret', dest='radius_secret',
                         help='Set the Secret used for connecting to the RADIUS Server - Default: SECRET',
                         default='SECRET')
+    parser.add_argument('-w', '--workers', dest='workers', type=int,
+                        help='Set the number of Chewie worker processes, each taking a share of the '
+                             'supplicants with PACKET_FANOUT - Default: 1', default=1)
+    parser.add_argument('-fm', '--fanout_mode', dest='fanout_mode',
+                        choices=sorted(PromiscuousSocket.FANOUT_MODES),
+                        help='Set how the kernel shares supplicants between workers - Default: mac',
+                        default='mac')
     args = parser.parse_args()
 
     logger = get_logger("CHEWIE")
+    if args.workers > 1:
+        run_workers(args, logger)
+        return
+
     logger.info('Starting Chewie...')
+    run_chewie(args, None)
+
 
+def run_chewie(args, fanout_group):
+    """Run a Chewie, as a worker in fanout_group if it is not None"""
+    logger = get_logger("CHEWIE")
     chewie = Chewie(args.interface, logger, auth_handler, failure_handler, logoff_handler,
-                    radius_server_ip=args.radius_ip, radius_server_secret=args.radius_secret)
+                    radius_server_ip=args.radius_ip, radius_server_secret=args.radius_secret,
+                    fanout_group=fanout_group, fanout_mode=args.fanout_mode)
     chewie.run()
 
 
+def run_workers(args, logger):
+    """Run args.workers Chewie processes in one PACKET_FANOUT group, so the kernel gives each
+    a share of the supplicants. Each worker binds its own RADIUS client port, so replies
+    come back to the worker that sent the request."""
+    fanout_group = os.getpid() & 0xffff
+    logger.info('Starting %d Chewie workers in fanout group %d...', args.workers, fanout_group)
+    # spawn rather than fork, as ShardedChewie does, so a worker does not inherit the
+    # parent's eventlet hub.
+    context = multiprocessing.get_context('spawn')
+    workers = [context.Process(target=run_chewie, args=(args, fanout_group),
+                               name='chewie-worker-%d' % index)
+               for index in range(args.workers)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+
 if __name__ == '__main__':
     main()
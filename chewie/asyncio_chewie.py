@@ -0,0 +1,167 @@
+"""Chewie on an asyncio event loop, for embedding in asyncio applications.
+
+Frames are read when the loop reports a socket readable (loop.add_reader), RADIUS runs over
+a DatagramProtocol per client port, and timers use loop.call_later. Output from the state
+machines is sent as soon as it is produced, rather than going through queues and the
+greenlets that drain them.
+"""
+import asyncio
+
+from chewie.chewie import Chewie
+from chewie.nfv_sockets import CaptureSocket, MabSocket
+from chewie.timer_scheduler import AsyncioTimerScheduler
+
+
+class RadiusProtocol(asyncio.DatagramProtocol):
+    """Sends RADIUS requests from, and receives replies on, one client port"""
+
+    def __init__(self, chewie, client_port):
+        self.chewie = chewie
+        self.client_port = client_port
+        self.transport = None
+        self._pending = []  # (data, server_address) sent before the transport was ready
+
+    def connection_made(self, transport):
+        self.transport = transport
+        for data, server_address in self._pending:
+            transport.sendto(data, server_address)
+        self._pending = []
+
+    def datagram_received(self, data, addr):
+        # pylint: disable=protected-access
+        self.chewie._process_radius_message(data, self.client_port)
+
+    def error_received(self, exc):
+        self.chewie.logger.warning("RADIUS client port %d error: %s", self.client_port, exc)
+
+    def send(self, data, server_address):
+        """Send data to server_address, (ip, port)"""
+        if self.transport is None:
+            self._pending.append((data, server_address))
+            return
+        self.transport.sendto(data, server_address)
+
+    def close(self):
+        """Close the transport"""
+        if self.transport:
+            self.transport.close()
+
+
+class AsyncioChewie(Chewie):
+    """Chewie that runs on an asyncio event loop instead of eventlet greenlets.
+
+    Takes the same arguments as Chewie, except timer_backend as the loop runs the timers,
+    and dispatch which is always 'direct'.
+    Either await start() from a coroutine on the application's loop, or call run() to run
+    a loop of its own.
+    """
+
+    def __init__(self, *args, loop=None, **kwargs):
+        """
+        Args:
+            loop (asyncio.AbstractEventLoop): loop to run on, defaults to the running loop
+                when start() is awaited.
+        """
+        self.loop = loop
+        kwargs['dispatch'] = 'direct'
+        super().__init__(*args, **kwargs)
+        self._reader_fds = []
+        self._writer_fds = []
+        self._tasks = []
+        self._stopped = None
+
+    def _create_timer_scheduler(self, timer_backend):
+        return AsyncioTimerScheduler(self.logger, self.loop)
+
+    async def start(self):
+        """setup chewie and start handling frames on the running loop"""
+        self.loop = asyncio.get_event_loop()
+        self.timer_scheduler.loop = self.loop
+        self.logger.info("Starting")
+        self._setup_frame_sockets()
+        self._start_frame_readers()
+        self._setup_radius_socket()
+        if self.radius_status_server_interval:
+            self.radius_lifecycle.start_status_server_probes(self.radius_status_server_interval)
+
+    def run(self):
+        """setup chewie and run an asyncio event loop until shutdown()"""
+        own_loop = self.loop is None
+        loop = asyncio.new_event_loop() if own_loop else self.loop
+        try:
+            loop.run_until_complete(self._run_until_shutdown())
+        finally:
+            if own_loop:
+                loop.close()
+
+    async def _run_until_shutdown(self):
+        self._stopped = asyncio.get_event_loop().create_future()
+        await self.start()
+        await self._stopped
+
+    def shutdown(self):
+        """stop handling frames and close the RADIUS client ports"""
+        for reader_fd in self._reader_fds:
+            self.loop.remove_reader(reader_fd)
+        for writer_fd in self._writer_fds:
+            self.loop.remove_writer(writer_fd)
+        self._reader_fds = []
+        self._writer_fds = []
+        for radius_protocol in self._radius_sockets:
+            radius_protocol.close()
+        if self._stopped and not self._stopped.done():
+            self._stopped.set_result(None)
+
+    def _start_frame_readers(self):
+        """Handle frames from every EAP, MAB or capture socket when the loop sees them"""
+        for interface_name, eap_socket in self._eap_sockets.items():
+            if self.shared_socket:
+                self._add_frame_reader(eap_socket, CaptureSocket.is_wanted,
+                                       self._process_captured_frame, interface_name)
+            else:
+                self._add_frame_reader(eap_socket, None,
+                                       self._process_eap_frame, interface_name)
+        for interface_name, mab_socket in self._mab_sockets.items():
+            self._add_frame_reader(mab_socket, MabSocket.is_dhcp_request,
+                                   self._send_eth_to_state_machine, interface_name)
+
+    def _add_frame_reader(self, frame_socket, accept, handler, interface_name):
+        reader_fd = frame_socket.socket.fileno()
+        self.loop.add_reader(reader_fd, self._frames_ready,
+                             frame_socket, accept, handler, interface_name)
+        self._reader_fds.append(reader_fd)
+
+    @staticmethod
+    def _frames_ready(frame_socket, accept, handler, interface_name):
+        """Handle every frame queued on frame_socket"""
+        for packed_message in frame_socket.receive_ready_frames(accept):
+            handler(packed_message, interface_name)
+
+    def _flush_eap_socket_later(self, eap_socket):
+        writer_fd = eap_socket.socket.fileno()
+        self.loop.add_writer(writer_fd, self._flush_eap_socket, eap_socket)
+        self._writer_fds.append(writer_fd)
+
+    def _flush_eap_socket(self, eap_socket):
+        """Send the frames an EapSocket was too busy for, once it is writable"""
+        if eap_socket.flush_send_backlog():
+            writer_fd = eap_socket.socket.fileno()
+            self.loop.remove_writer(writer_fd)
+            self._writer_fds.remove(writer_fd)
+
+    def _setup_radius_socket(self):
+        """Setup a RadiusProtocol for the next client port.
+        Only the first client port uses radius_listen_port, the rest use ephemeral ports"""
+        client_port = len(self._radius_sockets)
+        listen_port = self.radius_listen_port if client_port == 0 else 0
+        radius_protocol = RadiusProtocol(self, client_port)
+        self._radius_sockets.append(radius_protocol)
+        task = self.loop.create_task(self.loop.create_datagram_endpoint(
+            lambda: radius_protocol, local_addr=(self.radius_listen_ip, listen_port)))
+        task.add_done_callback(self._radius_endpoint_created)
+        self._tasks.append(task)
+
+    def _radius_endpoint_created(self, task):
+        self._tasks.remove(task)
+        if not task.cancelled() and task.exception():
+            self.logger.error("Unable to setup RADIUS client port: %s", task.exception())
@@ -1,6 +1,7 @@
 """This module provides a way to parse and pack and EAPOL Packet using Auth8021x"""
 
 import struct
+from chewie.packet_structs import AUTH_8021X_HEADER
 from chewie.utils import MessageParseError
 
 
@@ -30,8 +31,7 @@ class Auth8021x:
             MessageParseException: if packed_message cannot be parsed successfully.
         """
         try:
-            version, packet_type, length = struct.unpack("!BBH",
-                                                         packed_message[:AUTH_8021X_HEADER_LENGTH])
+            version, packet_type, length = AUTH_8021X_HEADER.unpack_from(packed_message)
         except struct.error as exception:
             raise MessageParseError("Auth8021x unable to parse first 4 bytes") from exception
         data = packed_message[AUTH_8021X_HEADER_LENGTH:AUTH_8021X_HEADER_LENGTH + length]
@@ -42,7 +42,7 @@ class Auth8021x:
         Returns:
             bytes
         """
-        header = struct.pack("!BBH", self.version, self.packet_type, len(self.data))
+        header = AUTH_8021X_HEADER.pack(self.version, self.packet_type, len(self.data))
         return header + self.data
 
     def __repr__(self):
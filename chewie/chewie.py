@@ -1,32 +1,83 @@
 """ Entry point for 802.1X speaker. """
+from collections import deque
+
+import eventlet
 from eventlet import sleep, GreenPool
+from eventlet.event import Event
+from eventlet.hubs import trampoline
 from eventlet.queue import Queue
 
 from chewie import timer_scheduler
-from chewie.nfv_sockets import EapSocket, MabSocket
+from chewie.nfv_sockets import EapSocket, MabSocket, CaptureSocket
 from chewie.ethernet_packet import EthernetPacket
 from chewie.event import EventMessageReceived, EventPreemptiveEAPResponseMessageReceived
 from chewie.mac_address import MacAddress
 from chewie.message_parser import MessageParser, MessagePacker
+from chewie.radius import radius_request_id, RadiusAccessAccept, RadiusAccessReject
 from chewie.radius_lifecycle import RadiusLifecycle
+from chewie.radius_servers import RadiusServer, RadiusServerPool
 from chewie.radius_socket import RadiusSocket
 from chewie.state_machines.eap_state_machine import FullEAPStateMachine
 from chewie.state_machines.mab_state_machine import MacAuthenticationBypassStateMachine
-from chewie.utils import get_logger, MessageParseError
+from chewie.utils import get_logger, MessageParseError, DirectQueue
 from chewie.managed_port import ManagedPort
 
 
 class Chewie:
     """Facilitates EAP supplicant and RADIUS server communication"""
     _RADIUS_UDP_PORT = 1812
+    EAP_SEND_BATCH_SIZE = 256  # most EAP frames to send per wakeup
+    DISPATCH_MODES = ('queue', 'direct')
     PAE_GROUP_ADDRESS = MacAddress.from_string("01:80:C2:00:00:03")
 
     # pylint: disable=too-many-arguments
     def __init__(self, interface_name, logger=None,
                  auth_handler=None, failure_handler=None, logoff_handler=None,
                  radius_server_ip=None, radius_server_port=None, radius_server_secret=None,
-                 chewie_id=None):
-        self.interface_name = interface_name
+                 chewie_id=None, timer_backend='heap',
+                 radius_servers=None, radius_load_balancing='round_robin',
+                 radius_status_server_interval=None, rx_ring=False, shared_socket=False,
+                 fanout_group=None, fanout_mode='mac', dispatch='queue'):
+        """
+        Args:
+            interface_name (str or list of str): interface(s) to authenticate supplicants
+                on. All interfaces share one RADIUS client and timer scheduler.
+            radius_servers (list of RadiusServer): servers to balance RADIUS requests across,
+                all sharing radius_server_secret. Defaults to radius_server_ip and
+                radius_server_port.
+            radius_load_balancing (str): how RadiusServerPool picks a server for each
+                new conversation, 'round_robin' or 'least_outstanding'.
+            radius_status_server_interval (int): seconds between Status-Server probes to
+                each RADIUS server. Servers are not probed if None, as not all support it.
+            rx_ring (bool): receive EAP and MAB frames through a PACKET_MMAP ring where
+                the kernel supports it.
+            shared_socket (bool): capture EAP and MAB frames with one CaptureSocket rather
+                than an EapSocket and a MabSocket. Always True with fanout_group.
+            fanout_group (int): base PACKET_FANOUT group id, for several Chewie processes
+                that each take a share of the supplicants on the same interfaces. Each
+                interface's CaptureSocket joins its own group counting up from here.
+            fanout_mode (str): how the kernel shares frames out, see
+                PromiscuousSocket.FANOUT_MODES.
+            dispatch (str): 'queue' hands state machine output to eventlets that send it,
+                'direct' packs and sends it from the event handler that produced it (run
+                to completion), keeping only what the sockets cannot take yet.
+        Raises:
+            ValueError: if dispatch is unknown.
+        """
+        if dispatch not in self.DISPATCH_MODES:
+            raise ValueError("Unknown dispatch mode '%s', expected one of: %s"
+                             % (dispatch, ', '.join(self.DISPATCH_MODES)))
+        if isinstance(interface_name, str):
+            interface_name = [interface_name]
+        self.interface_names = list(interface_name)
+        self.interface_name = self.interface_names[0]  # for ports on an unknown interface
+        self.rx_ring = rx_ring
+        # A socket's place in a fanout group depends on when it joined, so an EapSocket and
+        # a MabSocket in separate groups could send one supplicant's EAP and DHCP frames to
+        # different workers. One socket per interface keeps them together.
+        self.shared_socket = shared_socket or fanout_group is not None
+        self.fanout_group = fanout_group
+        self.fanout_mode = fanout_mode
         self.log_name = Chewie.__name__
         if logger:
             self.log_name = logger.name + "." + Chewie.__name__
@@ -43,6 +94,7 @@ class Chewie:
             self.radius_server_port = radius_server_port
         self.radius_listen_ip = "0.0.0.0"
         self.radius_listen_port = 0
+        self.radius_status_server_interval = radius_status_server_interval
 
         self.chewie_id = "44-44-44-44-44-44:"  # used by the RADIUS Attribute
         # 'Called-Station' in Access-Request
@@ -53,25 +105,46 @@ class Chewie:
         # TODO for port_to_eapol_id - may want to set ID to null (-1...) if sent from the
         #  state machine.
         self._managed_ports = {}
-        self.eap_output_messages = Queue()
-        self.radius_output_messages = Queue()
-
-        self.radius_lifecycle = RadiusLifecycle(self.radius_secret, self.chewie_id, self.logger)
-        self.timer_scheduler = timer_scheduler.TimerScheduler(self.logger)
-
-        self._eap_socket = None
-        self._mab_socket = None
-        self._radius_socket = None
+        self.dispatch = dispatch
+        if dispatch == 'direct':
+            self.eap_output_messages = DirectQueue(self._send_eap_queue_message)
+            self.radius_output_messages = DirectQueue(self._send_radius_queue_message)
+        else:
+            self.eap_output_messages = Queue()
+            self.radius_output_messages = Queue()
+        self._radius_backlog = deque()  # RADIUS output waiting for a free packet id
+
+        self.timer_scheduler = self._create_timer_scheduler(timer_backend)
+        if not radius_servers:
+            radius_servers = [RadiusServer(self.radius_server_ip, self.radius_server_port)]
+        self.radius_server_pool = RadiusServerPool(radius_servers, self.logger,
+                                                   algorithm=radius_load_balancing,
+                                                   timer_scheduler=self.timer_scheduler)
+        self.radius_lifecycle = RadiusLifecycle(
+            self.radius_secret, self.chewie_id, self.logger,
+            packet_id_released_handler=self._radius_packet_id_released,
+            timer_scheduler=self.timer_scheduler,
+            send_handler=self._send_radius_packet,
+            server_pool=self.radius_server_pool)
+
+        self._eap_sockets = {}  # interface_name: EapSocket or CaptureSocket
+        self._mab_sockets = {}  # interface_name: MabSocket
+        self._radius_sockets = []  # client_port: RadiusSocket
+        self._radius_packet_id_waiter = None
 
         self.pool = None
         self.eventlets = []
 
+    def _create_timer_scheduler(self, timer_backend):
+        return timer_scheduler.TimerScheduler(self.logger, backend=timer_backend)
+
     def run(self):
         """setup chewie and start socket eventlet threads"""
         self.logger.info("Starting")
-        self._setup_eap_socket()
-        self._setup_mab_socket()
+        self._setup_frame_sockets()
         self._setup_radius_socket()
+        if self.radius_status_server_interval:
+            self.radius_lifecycle.start_status_server_probes(self.radius_status_server_interval)
         self._start_threads_and_wait()
 
     def running(self):  # pylint: disable=no-self-use
@@ -80,24 +153,33 @@ class Chewie:
 
     def shutdown(self):
         """kill eventlets and quit"""
-        for eventlet in self.eventlets:
-            eventlet.kill()
+        for thread in self.eventlets:
+            thread.kill()
 
     def _start_threads_and_wait(self):
         """Start the thread and wait until they complete (hopefully never)"""
         self.pool = GreenPool()
 
-        self.eventlets.append(self.pool.spawn(self._send_eap_messages))
-        self.eventlets.append(self.pool.spawn(self._receive_eap_messages))
-        self.eventlets.append(self.pool.spawn(self._receive_mab_messages))
+        if self.dispatch == 'queue':
+            self.eventlets.append(self.pool.spawn(self._send_eap_messages))
+        self._start_frame_receivers()
 
-        self.eventlets.append(self.pool.spawn(self._send_radius_messages))
-        self.eventlets.append(self.pool.spawn(self._receive_radius_messages))
+        if self.dispatch == 'queue':
+            self.eventlets.append(self.pool.spawn(self._send_radius_messages))
+        for client_port in range(len(self._radius_sockets)):
+            self.eventlets.append(self.pool.spawn(self._receive_radius_messages, client_port))
 
         self.eventlets.append(self.pool.spawn(self.timer_scheduler.run))
 
         self.pool.waitall()
 
+    def radius_server_status(self):
+        """
+        Returns:
+            list of dict - liveness and latency of each RADIUS server.
+        """
+        return self.radius_server_pool.server_status()
+
     def _auth_success(self, src_mac, port_id, period,
                       *args, **kwargs):  # pylint: disable=unused-variable
         """authentication shim between faucet and chewie
@@ -129,21 +211,47 @@ class Chewie:
             src_mac (MacAddress): the mac of the logoff supplicant
             port_id (MacAddress): the 'mac' identifier of what switch port
              the logoff is on"""
+        self.radius_lifecycle.end_conversation(src_mac)
         if self.logoff_handler:
             self.logoff_handler(src_mac, port_id)
         # TODO Need to stop sessions on Logoff
 
-    def _get_managed_port(self, port_id):
+    def _get_managed_port(self, port_id, interface_name=None):
+        """Gets or creates the ManagedPort for port_id.
+        Args:
+            port_id (MacAddress): ID of the port.
+            interface_name (str): interface the port was last heard on, None if unknown.
+        Returns:
+            ManagedPort
+        """
         port_id = str(port_id)
-        if port_id in self._managed_ports:
-            return self._managed_ports[port_id]
-
-        managed_port = ManagedPort(port_id, self.logger.name, self.timer_scheduler,
-                                   self.eap_output_messages,
-                                   self.radius_output_messages)
-        self._managed_ports[port_id] = managed_port
+        managed_port = self._managed_ports.get(port_id)
+        if managed_port is None:
+            managed_port = ManagedPort(port_id, self.logger.name, self.timer_scheduler,
+                                       self.eap_output_messages,
+                                       self.radius_output_messages,
+                                       interface_name,
+                                       self._reauth_port)
+            self._managed_ports[port_id] = managed_port
+        elif interface_name and managed_port.interface_name != interface_name:
+            self.logger.info("port %s is on interface %s", port_id, interface_name)
+            managed_port.interface_name = interface_name
         return managed_port
 
+    def _reauth_port(self, port_id):
+        """Start identity requests on port_id, so its supplicants reauthenticate"""
+        self._get_managed_port(port_id).start_identity_requests()
+
+    def _get_port_interface(self, port_id):
+        """
+        Returns:
+            str - name of the interface port_id is on, the first interface if unknown.
+        """
+        managed_port = self._managed_ports.get(str(port_id))
+        if managed_port and managed_port.interface_name:
+            return managed_port.interface_name
+        return self.interface_name
+
     def port_down(self, port_id):
         """
         should be called by faucet when port has gone down.
@@ -154,63 +262,160 @@ class Chewie:
         # faucet will remove the acls by itself.
         self.logger.info("port %s down", port_id)
         managed_port = self._get_managed_port(port_id)
+        for state_machine in managed_port.state_machines.values():
+            self.radius_lifecycle.end_conversation(state_machine.src_mac)
         managed_port.status = False
         managed_port.stop_identity_requests()
 
-    def port_up(self, port_id):
+    def port_up(self, port_id, interface_name=None):
         """
         should be called by faucet when port has come up
         Args:
             port_id (str): id of port.
+            interface_name (str): interface the port is reached through, if known.
         """
         self.logger.info("port %s up", port_id)
-        managed_port = self._get_managed_port(port_id)
+        managed_port = self._get_managed_port(port_id, interface_name)
         managed_port.status = True
         managed_port.start_identity_requests()
 
-    def _setup_eap_socket(self):
-        """Setup EAP socket"""
-        log_prefix = "%s.EapSocket" % self.logger.name
-        self._eap_socket = EapSocket(self.interface_name, log_prefix)
-        self._eap_socket.setup()
+    def _setup_frame_sockets(self):
+        """Setup the sockets EAP and MAB frames are received on, for every interface"""
+        for interface_name in self.interface_names:
+            if self.shared_socket:
+                self._setup_capture_socket(interface_name)
+            else:
+                self._setup_eap_socket(interface_name)
+                self._setup_mab_socket(interface_name)
+
+    def _start_frame_receivers(self):
+        """Spawn the eventlets receiving EAP and MAB frames, for every interface"""
+        for interface_name in self.interface_names:
+            if self.shared_socket:
+                self.eventlets.append(self.pool.spawn(self._receive_captured_frames,
+                                                      interface_name))
+            else:
+                self.eventlets.append(self.pool.spawn(self._receive_eap_messages,
+                                                      interface_name))
+                self.eventlets.append(self.pool.spawn(self._receive_mab_messages,
+                                                      interface_name))
+
+    def _fanout_group(self, interface_name):
+        """A fanout group only holds sockets bound alike, so every interface gets its own.
+        Returns:
+            int - PACKET_FANOUT group id for interface_name's socket, None if not using
+            fanout.
+        """
+        if self.fanout_group is None:
+            return None
+        interface_index = self.interface_names.index(interface_name)
+        return (self.fanout_group + interface_index) & 0xffff
 
-    def _setup_mab_socket(self):
+    def _setup_eap_socket(self, interface_name):
+        """Setup EAP socket"""
+        log_prefix = "%s.EapSocket.%s" % (self.logger.name, interface_name)
+        eap_socket = EapSocket(interface_name, log_prefix, rx_ring=self.rx_ring)
+        eap_socket.setup()
+        self._eap_sockets[interface_name] = eap_socket
+
+    def _setup_capture_socket(self, interface_name):
+        """Setup one socket for both EAP and MAB, it is also used to send EAP"""
+        log_prefix = "%s.CaptureSocket.%s" % (self.logger.name, interface_name)
+        capture_socket = CaptureSocket(interface_name, log_prefix, rx_ring=self.rx_ring,
+                                       fanout_group=self._fanout_group(interface_name),
+                                       fanout_mode=self.fanout_mode)
+        capture_socket.setup()
+        self._eap_sockets[interface_name] = capture_socket
+
+    def _setup_mab_socket(self, interface_name):
         """Setup Mab socket"""
-        log_prefix = "%s.MabSocket" % self.logger.name
-        self._mab_socket = MabSocket(self.interface_name, log_prefix)
-        self._mab_socket.setup()
+        log_prefix = "%s.MabSocket.%s" % (self.logger.name, interface_name)
+        mab_socket = MabSocket(interface_name, log_prefix, rx_ring=self.rx_ring)
+        mab_socket.setup()
+        self._mab_sockets[interface_name] = mab_socket
 
     def _setup_radius_socket(self):
-        """Setup Radius socket"""
+        """Setup Radius socket for the next client port.
+        Only the first client port uses radius_listen_port, the rest use ephemeral ports"""
+        client_port = len(self._radius_sockets)
+        listen_port = self.radius_listen_port if client_port == 0 else 0
         log_prefix = "%s.RadiusSocket" % self.logger.name
-        self._radius_socket = RadiusSocket(self.radius_listen_ip,
-                                           self.radius_listen_port,
-                                           self.radius_server_ip,
-                                           self.radius_server_port,
-                                           log_prefix)
-        self._radius_socket.setup()
-        self.logger.info("Radius Listening on %s:%d",
+        radius_socket = RadiusSocket(self.radius_listen_ip,
+                                     listen_port,
+                                     self.radius_server_ip,
+                                     self.radius_server_port,
+                                     log_prefix)
+        radius_socket.setup()
+        self._radius_sockets.append(radius_socket)
+        self.logger.info("Radius client port %d Listening on %s:%d",
+                         client_port,
                          self.radius_listen_ip,
-                         self.radius_listen_port)
+                         listen_port)
+
+    def _get_radius_socket(self, client_port):
+        """Gets the RadiusSocket for client_port, setting up any that do not exist yet"""
+        while len(self._radius_sockets) <= client_port:
+            self._setup_radius_socket()
+            if self.pool:
+                self.eventlets.append(self.pool.spawn(self._receive_radius_messages,
+                                                      len(self._radius_sockets) - 1))
+        return self._radius_sockets[client_port]
 
     def _send_eap_messages(self):
         """Send EAP messages to Supplicant forever."""
         while self.running():
             sleep(0)
-            eap_queue_message = self.eap_output_messages.get()
-            self.logger.info("Sending message %s from %s to %s",
-                             eap_queue_message.message,
-                             str(eap_queue_message.port_mac),
-                             str(eap_queue_message.src_mac))
-            self._eap_socket.send(MessagePacker.ethernet_pack(eap_queue_message.message,
-                                                              eap_queue_message.port_mac,
-                                                              eap_queue_message.src_mac))
-
-    def _send_eth_to_state_machine(self, packed_message):
+            eap_queue_messages = [self.eap_output_messages.get()]
+            # Send everything queued alongside it (e.g. identity requests for many ports)
+            # in one burst.
+            while len(eap_queue_messages) < self.EAP_SEND_BATCH_SIZE and \
+                    not self.eap_output_messages.empty():
+                eap_queue_messages.append(self.eap_output_messages.get_nowait())
+
+            interface_frames = {}  # interface_name: frames
+            for eap_queue_message in eap_queue_messages:
+                self.logger.debug("Sending message %s from %s to %s",
+                                  eap_queue_message.message,
+                                  eap_queue_message.port_mac,
+                                  eap_queue_message.src_mac)
+                interface_name = self._get_port_interface(eap_queue_message.port_mac)
+                interface_frames.setdefault(interface_name, []).append(
+                    MessagePacker.ethernet_pack(eap_queue_message.message,
+                                                eap_queue_message.port_mac,
+                                                eap_queue_message.src_mac))
+            for interface_name, frames in interface_frames.items():
+                self._eap_sockets[interface_name].send_batch(frames)
+
+    def _send_eap_queue_message(self, eap_queue_message):
+        """Pack and send an EapQueueMessage out of its port's interface now"""
+        self.logger.debug("Sending message %s from %s to %s",
+                          eap_queue_message.message,
+                          eap_queue_message.port_mac,
+                          eap_queue_message.src_mac)
+        interface_name = self._get_port_interface(eap_queue_message.port_mac)
+        eap_socket = self._eap_sockets[interface_name]
+        frame = MessagePacker.ethernet_pack(eap_queue_message.message,
+                                            eap_queue_message.port_mac,
+                                            eap_queue_message.src_mac)
+        if not eap_socket.send_nowait(frame) and len(eap_socket.send_backlog) == 1:
+            self._flush_eap_socket_later(eap_socket)
+
+    def _flush_eap_socket_later(self, eap_socket):
+        """Send eap_socket's send_backlog once it is writable"""
+        spawn = self.pool.spawn if self.pool else eventlet.spawn
+        spawn(self._flush_eap_socket_when_writable, eap_socket)
+
+    @staticmethod
+    def _flush_eap_socket_when_writable(eap_socket):
+        while not eap_socket.flush_send_backlog():
+            trampoline(eap_socket.socket.fileno(), write=True)
+
+    def _send_eth_to_state_machine(self, packed_message, interface_name=None):
         """Send an ethernet frame to MAB State Machine"""
         ethernet_packet = EthernetPacket.parse(packed_message)
         port_id = ethernet_packet.dst_mac
         src_mac = ethernet_packet.src_mac
+        self._get_managed_port(port_id, interface_name)
 
         self.logger.info("Sending MAC to MAB State Machine: %s", src_mac)
         message_id = -2
@@ -219,40 +424,75 @@ class Chewie:
         state_machine.event(event)
         # NOTE: Should probably throttle packets in once one is received
 
-    def _receive_eap_messages(self):
-        """receive eap messages from supplicant forever."""
+    def _receive_eap_messages(self, interface_name=None):
+        """receive eap messages from supplicant forever.
+        Args:
+            interface_name (str): interface to receive on, defaults to the first.
+        """
+        interface_name = interface_name or self.interface_name
+        eap_socket = self._eap_sockets[interface_name]
         while self.running():
             sleep(0)
             self.logger.info("waiting for eap.")
-            packed_message = self._eap_socket.receive()
-            self.logger.info("Received packed_message: %s", str(packed_message))
-            try:
-                eap, dst_mac = MessageParser.ethernet_parse(packed_message)
-            except MessageParseError as exception:
-                self.logger.warning(
-                    "MessageParser.ethernet_parse threw exception.\n"
-                    " packed_message: '%s'.\n"
-                    " exception: '%s'.",
-                    packed_message,
-                    exception)
-                continue
-
-            self.logger.info("Received eap message: %s", str(eap))
-            self._send_eap_to_state_machine(eap, dst_mac)
-
-    def _receive_mab_messages(self):
-        """Receive DHCP request for MAB."""
+            packed_message = eap_socket.receive()
+            self._process_eap_frame(packed_message, interface_name)
+
+    def _process_eap_frame(self, packed_message, interface_name=None):
+        """Parse a received EAPOL frame and send it to its state machine"""
+        self.logger.info("Received packed_message: %s", str(packed_message))
+        try:
+            eap, dst_mac = MessageParser.ethernet_parse(packed_message)
+        except MessageParseError as exception:
+            self.logger.warning(
+                "MessageParser.ethernet_parse threw exception.\n"
+                " packed_message: '%s'.\n"
+                " exception: '%s'.",
+                packed_message,
+                exception)
+            return
+
+        self.logger.info("Received eap message: %s", str(eap))
+        self._send_eap_to_state_machine(eap, dst_mac, interface_name)
+
+    def _receive_captured_frames(self, interface_name=None):
+        """Receive EAPOL frames and DHCP requests from the shared CaptureSocket forever,
+        and dispatch them to the EAP or MAB pipeline by ethertype.
+        Args:
+            interface_name (str): interface to receive on, defaults to the first.
+        """
+        interface_name = interface_name or self.interface_name
+        capture_socket = self._eap_sockets[interface_name]
+        while self.running():
+            sleep(0)
+            for packed_message in capture_socket.receive_batch():
+                self._process_captured_frame(packed_message, interface_name)
+
+    def _process_captured_frame(self, packed_message, interface_name=None):
+        """Send a frame from a CaptureSocket to the EAP or MAB pipeline, by ethertype"""
+        if CaptureSocket.is_eapol(packed_message):
+            self._process_eap_frame(packed_message, interface_name)
+        else:
+            self._send_eth_to_state_machine(packed_message, interface_name)
+
+    def _receive_mab_messages(self, interface_name=None):
+        """Receive DHCP request for MAB.
+        Args:
+            interface_name (str): interface to receive on, defaults to the first.
+        """
+        interface_name = interface_name or self.interface_name
+        mab_socket = self._mab_sockets[interface_name]
         while self.running():
             sleep(0)
             self.logger.info("waiting for MAB activity.")
-            packed_message = self._mab_socket.receive()
+            packed_message = mab_socket.receive()
             self.logger.info("Received DHCP packet for MAB. packed_message: %s",
                              str(packed_message))
-            self._send_eth_to_state_machine(packed_message)
+            self._send_eth_to_state_machine(packed_message, interface_name)
 
-    def _send_eap_to_state_machine(self, eap, dst_mac):
+    def _send_eap_to_state_machine(self, eap, dst_mac, interface_name=None):
         """sends an eap message to the state machine"""
         self.logger.info("eap EAP(): %s", eap)
+        self._get_managed_port(dst_mac, interface_name)
         message_id = getattr(eap, 'message_id', -1)
         state_machine = self.get_state_machine(eap.src_mac, dst_mac, message_id)
 
@@ -272,40 +512,92 @@ class Chewie:
         while self.running():
             sleep(0)
             radius_output_bits = self.radius_output_messages.get()
-            packed_message = self.radius_lifecycle.process_outbound(radius_output_bits)
-            self._radius_socket.send(packed_message)
+            self._wait_for_radius_packet_id()
+            self._send_radius_output(radius_output_bits)
             self.logger.info("sent radius message.")
 
-    def _receive_radius_messages(self):
-        """receive RADIUS messages from RADIUS server forever."""
+    def _send_radius_queue_message(self, radius_output_bits):
+        """Send a RadiusQueueMessage now, or keep it until a RADIUS packet id is free"""
+        if self._radius_backlog or not self.radius_lifecycle.packet_id_available():
+            if not self._radius_backlog:
+                self.logger.warning("All RADIUS packet ids are in use, waiting for a reply")
+            self._radius_backlog.append(radius_output_bits)
+            return
+        self._send_radius_output(radius_output_bits)
+
+    def _send_radius_output(self, radius_output_bits):
+        client_port, server, packed_message = self.radius_lifecycle.process_outbound(
+            radius_output_bits)
+        self._send_radius_packet(client_port, server, packed_message)
+
+    def _send_radius_packet(self, client_port, server, packed_message):
+        """Send a packed RADIUS packet from client_port to server (RadiusServer)"""
+        self._get_radius_socket(client_port).send(packed_message, server.address)
+
+    def _wait_for_radius_packet_id(self):
+        """Block until there is a free RADIUS packet id to send a request with"""
+        while not self.radius_lifecycle.packet_id_available():
+            self.logger.warning("All RADIUS packet ids are in use, waiting for a reply")
+            self._radius_packet_id_waiter = Event()
+            self._radius_packet_id_waiter.wait()
+            self._radius_packet_id_waiter = None
+
+    def _radius_packet_id_released(self):
+        """Wake _send_radius_messages() if it is waiting for a packet id, or send the RADIUS
+        output that was waiting for one"""
+        if self._radius_packet_id_waiter and not self._radius_packet_id_waiter.ready():
+            self._radius_packet_id_waiter.send()
+        while self._radius_backlog and self.radius_lifecycle.packet_id_available():
+            self._send_radius_output(self._radius_backlog.popleft())
+
+    def _receive_radius_messages(self, client_port=0):
+        """receive RADIUS messages from RADIUS server forever.
+        Args:
+            client_port (int): index of the client port (RadiusSocket) to receive on.
+        """
+        radius_socket = self._radius_sockets[client_port]
         while self.running():
             sleep(0)
-            self.logger.info("waiting for radius.")
-            packed_message = self._radius_socket.receive()
-            try:
-                radius = MessageParser.radius_parse(packed_message, self.radius_secret,
-                                                    self.radius_lifecycle)
-            except MessageParseError as exception:
-                self.logger.warning(
-                    "MessageParser.radius_parse threw exception.\n"
-                    " packed_message: '%s'.\n"
-                    " exception: '%s'.",
-                    packed_message,
-                    exception)
-                continue
-            self.logger.info("Received RADIUS message: %s", str(radius))
-            self._send_radius_to_state_machine(radius)
-
-    def _send_radius_to_state_machine(self, radius):
+            self.logger.debug("waiting for radius.")
+            packed_messages = radius_socket.receive_batch()
+            self.logger.debug("Received %d RADIUS messages", len(packed_messages))
+            for packed_message in packed_messages:
+                self._process_radius_message(packed_message, client_port)
+
+    def _process_radius_message(self, packed_message, client_port):
+        """Parse a received RADIUS message and send it to its state machine"""
+        try:
+            radius = MessageParser.radius_parse(packed_message, self.radius_secret,
+                                                self.radius_lifecycle, client_port)
+        except MessageParseError as exception:
+            self.logger.warning(
+                "MessageParser.radius_parse threw exception.\n"
+                " packed_message: '%s'.\n"
+                " exception: '%s'.",
+                packed_message,
+                exception)
+            return
+        self.logger.debug("Received RADIUS message: %s", radius)
+        self._send_radius_to_state_machine(radius, client_port)
+
+    def _send_radius_to_state_machine(self, radius, client_port=0):
         """sends a radius message to the state machine"""
+        request_id = radius_request_id(radius.packet_id, client_port)
+        if self.radius_lifecycle.is_status_server_request(request_id):
+            self.logger.debug("RADIUS server answered Status-Server %d", request_id)
+            self.radius_lifecycle.reply_received(request_id)
+            return
         event = self.radius_lifecycle.build_event_radius_message_received(radius)
-        state_machine = self._get_state_machine_from_radius_packet_id(radius.packet_id)
+        state_machine = self._get_state_machine_from_radius_packet_id(request_id)
+        self.radius_lifecycle.reply_received(
+            request_id, conversation_over=isinstance(radius, (RadiusAccessAccept,
+                                                              RadiusAccessReject)))
         state_machine.event(event)
 
     def _get_state_machine_from_radius_packet_id(self, packet_id):
         """Gets a FullEAPStateMachine from the RADIUS message packet_id
         Args:
-            packet_id (int): id of the received RADIUS message
+            packet_id (int): radius_request_id() of the received RADIUS message
         Returns:
             FullEAPStateMachine
         """
@@ -4,6 +4,7 @@
 # pylint: disable=arguments-differ
 
 import struct
+from chewie.packet_structs import EAP_HEADER, EAP_TYPE_HEADER, UINT8
 from chewie.utils import MessageParseError
 
 EAP_HEADER_LENGTH = 1 + 1 + 2
@@ -43,15 +44,13 @@ class Eap:
             MessageParseError if packed_message cannot be parsed.
         """
         try:
-            code, packet_id, length = struct.unpack("!BBH", packed_message[:EAP_HEADER_LENGTH])
+            code, packet_id, length = EAP_HEADER.unpack_from(packed_message)
         except struct.error as exception:
             raise MessageParseError("unable to unpack EAP header (4 bytes)") from exception
 
         if code in (Eap.REQUEST, Eap.RESPONSE):
             try:
-                packet_type, = struct.unpack("!B",
-                                             packed_message[EAP_HEADER_LENGTH:
-                                                            EAP_HEADER_LENGTH + EAP_TYPE_LENGTH])
+                packet_type, = UINT8.unpack_from(packed_message, EAP_HEADER_LENGTH)
             except struct.error as exception:
                 raise MessageParseError("EAP unable to unpack packet_type byte") \
                     from exception
@@ -70,9 +69,9 @@ class Eap:
 
     def pack(self, packed_body):
         """Pack an EAP Message"""
-        header = struct.pack("!BBHB", self.code, self.packet_id,
-                             EAP_HEADER_LENGTH + EAP_TYPE_LENGTH + len(packed_body),
-                             self.PACKET_TYPE)
+        header = EAP_TYPE_HEADER.pack(self.code, self.packet_id,
+                                      EAP_HEADER_LENGTH + EAP_TYPE_LENGTH + len(packed_body),
+                                      self.PACKET_TYPE)
         return header + packed_body
 
 
@@ -136,7 +135,7 @@ class EapMd5Challenge(Eap):
             MessageParseError if cannot unpack packed_message
         """
         try:
-            value_length, = struct.unpack("!B", packed_message[:1])
+            value_length, = UINT8.unpack_from(packed_message)
         except struct.error as exception:
             raise MessageParseError("%s unable to unpack first byte" % cls.__name__) \
                 from exception
@@ -145,7 +144,7 @@ class EapMd5Challenge(Eap):
         return cls(code, packet_id, challenge, extra_data)
 
     def pack(self):
-        value_length = struct.pack("!B", len(self.challenge))
+        value_length = UINT8.pack(len(self.challenge))
         packed_md5_challenge = value_length + self.challenge + self.extra_data
         return super(EapMd5Challenge, self).pack(packed_md5_challenge)
 
@@ -164,7 +163,7 @@ class EapSuccess(Eap):
         return cls(packet_id)
 
     def pack(self):
-        return struct.pack("!BBH", Eap.SUCCESS, self.packet_id, EAP_HEADER_LENGTH)
+        return EAP_HEADER.pack(Eap.SUCCESS, self.packet_id, EAP_HEADER_LENGTH)
 
     def __repr__(self):
         return "%s(packet_id=%s)" % \
@@ -181,7 +180,7 @@ class EapFailure(Eap):
         return cls(packet_id)
 
     def pack(self):
-        return struct.pack("!BBH", Eap.FAILURE, self.packet_id, EAP_HEADER_LENGTH)
+        return EAP_HEADER.pack(Eap.FAILURE, self.packet_id, EAP_HEADER_LENGTH)
 
     def __repr__(self):
         return "%s(packet_id=%s)" % \
@@ -203,19 +202,11 @@ class EapLegacyNak(Eap):
         """
         Returns:
             EapLegacyNak.
-        Raises:
-            MessageParseError if cannot unpack packed_message
         """
-        value_len = len(packed_msg)
-        try:
-            desired_auth_types = struct.unpack("!%ds" % value_len, packed_msg)
-        except struct.error as exception:
-            raise MessageParseError("%s unable to unpack." % cls.__name__) from exception
-        return cls(code, packet_id, desired_auth_types)
+        return cls(code, packet_id, (bytes(packed_msg),))
 
     def pack(self):
-        packed_legacy_nak = struct.pack("!%ds" % len(self.desired_auth_types),
-                                        *self.desired_auth_types)  # pytype: disable=wrong-arg-types
+        packed_legacy_nak = b"".join(self.desired_auth_types)
         return super(EapLegacyNak, self).pack(packed_legacy_nak)
 
     def __repr__(self):
@@ -240,28 +231,14 @@ class EapTLSBase(Eap):
         Raises:
             MessageParseError if cannot unpack packed_message
         """
-        value_len = len(packed_msg)
-        fmt_str = "!B"
-        if value_len > 1:
-            fmt_str += "%ds" % (value_len - 1)
         try:
-            unpacked = struct.unpack(fmt_str, packed_msg)
+            flags, = UINT8.unpack_from(packed_msg)
         except struct.error as exception:
             raise MessageParseError("%s unable to unpack" % cls.__name__) from exception
-        extra_data = b""
-        if value_len > 1:
-            flags, extra_data = unpacked
-        else:
-            flags = unpacked[0]
-
-        return cls(code, packet_id, flags, extra_data)
+        return cls(code, packet_id, flags, bytes(packed_msg[1:]))
 
     def pack(self):
-        if self.extra_data:
-            packed = struct.pack("!B%ds" % len(self.extra_data), self.flags, self.extra_data)
-        else:
-            packed = struct.pack("!B", self.flags)
-        return super().pack(packed)
+        return super().pack(UINT8.pack(self.flags) + (self.extra_data or b""))
 
     def __repr__(self):
         return "%s(packet_id=%s, flags=%s, extra_data=%s)" % \
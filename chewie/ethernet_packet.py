@@ -2,6 +2,7 @@
 import struct
 
 from chewie.mac_address import MacAddress
+from chewie.packet_structs import ETHERNET_HEADER
 from chewie.utils import MessageParseError
 
 ETHERNET_HEADER_LENGTH = 6 + 6 + 2
@@ -27,8 +28,7 @@ class EthernetPacket:
             MessageParseError: if packed_message cannot be successfully parsed.
         """
         try:
-            dst_mac, src_mac, ethertype = struct.unpack("!6s6sH",
-                                                        packed_message[:ETHERNET_HEADER_LENGTH])
+            dst_mac, src_mac, ethertype = ETHERNET_HEADER.unpack_from(packed_message)
         except struct.error as exception:
             raise MessageParseError("Unable to parse Ethernet header (14bytes)") from exception
         data = packed_message[ETHERNET_HEADER_LENGTH:]
@@ -39,7 +39,7 @@ class EthernetPacket:
         Returns:
             bytes
         """
-        header = struct.pack("!6s6sH", self.dst_mac.address, self.src_mac.address, self.ethertype)
+        header = ETHERNET_HEADER.pack(self.dst_mac.address, self.src_mac.address, self.ethertype)
         return header + self.data
 
     def __repr__(self):
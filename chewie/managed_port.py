@@ -13,8 +13,15 @@ class ManagedPort:
     PAE_GROUP_ADDRESS = MacAddress.from_string("01:80:C2:00:00:03")
 
     def __init__(self, port_id, log_prefix, timer_scheduler, eap_output_messages,
-                 radius_output_messages):
+                 radius_output_messages, interface_name=None, reauth_handler=None):
+        """
+        Args:
+            interface_name (str): interface the port is reached through, None if unknown.
+            reauth_handler (callable): called with port_id when a supplicant on the port is
+                due to reauthenticate, starts identity requests on the port if None.
+        """
         self.port_id = port_id
+        self.interface_name = interface_name
         self.logger = get_logger(log_prefix)
         self.supplicant_output_messages = eap_output_messages
         self.radius_output_messages = radius_output_messages
@@ -25,6 +32,7 @@ class ManagedPort:
         self.identity_job = None  # timerJob
         self.session_job = None   # timerJob
         self.timer_scheduler = timer_scheduler
+        self.reauth_handler = reauth_handler
 
     @property
     def status(self):
@@ -67,6 +75,8 @@ class ManagedPort:
 
     def start_identity_requests(self):
         """Start Sending Preemptive Identity Requests"""
+        if self.identity_job:
+            self.identity_job.cancel()
         self.identity_job = self.timer_scheduler.call_later(
             self.DEFAULT_PORT_UP_IDENTITY_REQUEST_WAIT_PERIOD,
             self.send_preemptive_identity_request)
@@ -122,7 +132,10 @@ class ManagedPort:
         if state_machine and state_machine.is_success():
             self.logger.info(
                 'reauthenticating src_mac: %s on port: %s', src_mac, self.port_id)
-            self.start_identity_requests()
+            if self.reauth_handler:
+                self.reauth_handler(self.port_id)
+            else:
+                self.start_identity_requests()
 
         elif state_machine is None:
             self.logger.debug('not reauthing. state machine on port: %s, mac: %s is none',
@@ -1,10 +1,13 @@
 """"""
-
 from chewie.auth_8021x import Auth8021x
 from chewie.eap import Eap, EapIdentity, EapMd5Challenge, EapSuccess, EapFailure, EapLegacyNak, \
     EapTTLS, EapTLS, EapPEAP, PARSERS_TYPES
 from chewie.ethernet_packet import EthernetPacket
-from chewie.radius import RadiusAttributesList, RadiusAccessRequest, Radius
+from chewie.mac_address import MacAddress
+from chewie.packet_structs import EAP_FRAME_HEADER, EAPOL_FRAME_HEADER, RADIUS_ATTRIBUTE_HEADER, \
+    RADIUS_HEADER
+from chewie.radius import RadiusAttributesList, RadiusAccessRequest, RadiusStatusServer, Radius, \
+    RadiusSigner, RADIUS_HEADER_LENGTH
 from chewie.radius_attributes import CallingStationId, UserName, MessageAuthenticator, EAPMessage, \
     NASPort, UserPassword
 from chewie.utils import MessageParseError
@@ -52,6 +55,15 @@ class IdentityMessage(EapMessage):
     def build(cls, src_mac, eap):
         return cls(src_mac, eap.packet_id, eap.code, eap.identity)
 
+    @classmethod
+    def from_type_data(cls, src_mac, message_id, code, type_data):
+        """Build from the EAP Type-Data, as build() would from an EapIdentity"""
+        try:
+            identity = type_data.decode()
+        except UnicodeDecodeError as exception:
+            raise MessageParseError("EapIdentity unable to decode identity") from exception
+        return cls(src_mac, message_id, code, identity)
+
 
 class LegacyNakMessage(EapMessage):
     def __init__(self, src_mac, message_id, code, desired_auth_types):
@@ -67,6 +79,11 @@ class LegacyNakMessage(EapMessage):
     def build(cls, src_mac, eap):
         return cls(src_mac, eap.packet_id, eap.code, eap.desired_auth_types)
 
+    @classmethod
+    def from_type_data(cls, src_mac, message_id, code, type_data):
+        """Build from the EAP Type-Data, as build() would from an EapLegacyNak"""
+        return cls(src_mac, message_id, code, (type_data,))
+
 
 class Md5ChallengeMessage(EapMessage):
     def __init__(self, src_mac, message_id, code, challenge, extra_data):
@@ -83,6 +100,15 @@ class Md5ChallengeMessage(EapMessage):
     def build(cls, src_mac, eap):
         return cls(src_mac, eap.packet_id, eap.code, eap.challenge, eap.extra_data)
 
+    @classmethod
+    def from_type_data(cls, src_mac, message_id, code, type_data):
+        """Build from the EAP Type-Data, as build() would from an EapMd5Challenge"""
+        if not type_data:
+            raise MessageParseError("EapMd5Challenge unable to unpack first byte")
+        value_length = type_data[0]
+        return cls(src_mac, message_id, code, type_data[1:1 + value_length],
+                   type_data[1 + value_length:])
+
 
 class TlsMessageBase(EapMessage):
     """TLS and TTLS will extend this class, but TTLS cannot be same type as TLS"""
@@ -101,6 +127,13 @@ class TlsMessageBase(EapMessage):
     def build(cls, src_mac, eap):
         return cls(src_mac, eap.packet_id, eap.code, eap.flags, eap.extra_data)
 
+    @classmethod
+    def from_type_data(cls, src_mac, message_id, code, type_data):
+        """Build from the EAP Type-Data, as build() would from an EapTLSBase"""
+        if not type_data:
+            raise MessageParseError("%s unable to unpack" % EAP_PARSER_NAMES[cls])
+        return cls(src_mac, message_id, code, type_data[0], type_data[1:])
+
 
 class TlsMessage(TlsMessageBase):
     pass
@@ -141,6 +174,11 @@ EAP_MESSAGES = {
     Eap.PEAP: PeapMessage,
 }
 
+EAP_PARSER_NAMES = {message_class: PARSERS_TYPES[packet_type].__name__
+                    for packet_type, message_class in EAP_MESSAGES.items()}
+EAPOL_DATA_OFFSET = 6 + 6 + 2 + 4
+EAPOL_ETHERTYPE = 0x888e
+
 AUTH_8021X_MESSAGES = {
     0: "eap",
     1: "eapol start",
@@ -186,7 +224,33 @@ class MessageParser:
 
     @staticmethod
     def ethernet_parse(packed_message):
-        """Parses the ethernet header part, and payload
+        """Parses the ethernet header part, and payload.
+        EAP Requests and Responses are decoded in one pass, with a single unpack of the
+        headers and one copy of the Type-Data. Other frames go through
+        layered_ethernet_parse(), the results are the same either way.
+        Args:
+            packed_message (bytes-like):
+        Returns:
+            ***Message & destination mac address.
+        Raises:
+            MessageParseError: the packed_message cannot be parsed."""
+        if len(packed_message) >= EAP_FRAME_HEADER.size:
+            (dst_mac, src_mac, ethertype, _version, packet_type, length, code, message_id,
+             eap_length, eap_type) = EAP_FRAME_HEADER.unpack_from(packed_message)
+            if ethertype == EAPOL_ETHERTYPE and packet_type == 0 and length > 4 and \
+                    code in (Eap.REQUEST, Eap.RESPONSE):
+                message_class = EAP_MESSAGES.get(eap_type)
+                if message_class is None:
+                    raise MessageParseError("EAP packet_type: %s not supported" % eap_type)
+                type_data = bytes(packed_message[EAP_FRAME_HEADER.size:
+                                                 EAPOL_DATA_OFFSET + min(length, eap_length)])
+                return message_class.from_type_data(MacAddress(src_mac), message_id, code,
+                                                    type_data), MacAddress(dst_mac)
+        return MessageParser.layered_ethernet_parse(packed_message)
+
+    @staticmethod
+    def layered_ethernet_parse(packed_message):
+        """Parses the ethernet header part, and payload, one protocol layer at a time
         Args:
             packed_message:
         Returns:
@@ -202,14 +266,17 @@ class MessageParser:
                ethernet_packet.dst_mac
 
     @staticmethod
-    def radius_parse(packed_message, secret, radius_lifecycle):
+    def radius_parse(packed_message, secret, radius_lifecycle, client_port=0):
         """Parses a RADIUS packet
+        Args:
+            client_port (int): index of the client port packed_message was received on.
         Returns:
             RadiusPacket
         Raises:
             MessageParseError: the packed_message cannot be parsed"""
         parsed_radius = Radius.parse(packed_message, secret,
-                                     radius_lifecycle=radius_lifecycle)
+                                     radius_lifecycle=radius_lifecycle,
+                                     client_port=client_port)
         return parsed_radius
 
 
@@ -224,10 +291,9 @@ class MessagePacker:
         Returns:
             packed ethernet packet (bytes)
         """
-        data = MessagePacker.pack(message)
-        ethernet_packet = EthernetPacket(dst_mac=dst_mac, src_mac=src_mac,
-                                         ethertype=0x888e, data=data)
-        return ethernet_packet.pack()
+        version, packet_type, data = MessagePacker.eap_pack(message)
+        return EAPOL_FRAME_HEADER.pack(dst_mac.address, src_mac.address, EAPOL_ETHERTYPE,
+                                       version, packet_type, len(data)) + data
 
     @staticmethod
     def radius_mab_pack(src_mac, radius_packet_id, request_authenticator, secret, nas_port):
@@ -241,7 +307,9 @@ class MessagePacker:
         if nas_port:
             attr_list.append(NASPort.create(nas_port))
 
-        ciphertext = UserPassword.encrypt(secret, request_authenticator, no_dots_mac)
+        signer = RadiusSigner.for_secret(secret)
+        ciphertext = UserPassword.encrypt(signer.encoded_secret, request_authenticator,
+                                          no_dots_mac)
         attr_list.append(UserPassword.create(ciphertext))
 
         attr_list.append(MessageAuthenticator.create(
@@ -249,7 +317,29 @@ class MessagePacker:
 
         attributes = RadiusAttributesList(attr_list)
         access_request = RadiusAccessRequest(radius_packet_id, request_authenticator, attributes)
-        return access_request.build(secret)
+        return access_request.build(signer)
+
+    @staticmethod
+    def radius_status_server_pack(radius_packet_id, request_authenticator, secret,
+                                  extra_attributes=None):
+        """
+        Packs up a RFC 5997 Status-Server request.
+        Args:
+            radius_packet_id (int):
+            request_authenticator (bytes):
+            secret (str or RadiusSigner): RADIUS secret used between Chewie and RADIUS Server
+            extra_attributes (list): list of extra RADIUS attributes, e.g. NAS-Identifier.
+
+        Returns:
+            packed RADIUS packet (bytes)
+        """
+        attr_list = list(extra_attributes or [])
+        attr_list.append(MessageAuthenticator.create(
+            bytes.fromhex("00000000000000000000000000000000")))
+
+        attributes = RadiusAttributesList(attr_list)
+        status_server = RadiusStatusServer(radius_packet_id, request_authenticator, attributes)
+        return status_server.build(secret)
 
     @staticmethod
     def radius_pack(eap_message, src_mac, username, radius_packet_id,
@@ -263,35 +353,14 @@ class MessagePacker:
             radius_packet_id (int):
             request_authenticator (bytes):
             state (State): RADIUS State
-            secret (str): RADIUS secret used between Chewie and RADIUS Server
+            secret (str or RadiusSigner): RADIUS secret used between Chewie and RADIUS Server
             extra_attributes (list): list of extra RADIUS attributes to send along with the above.
 
         Returns:
             packed RADIUS packet (bytes)
         """
-        if not extra_attributes:
-            extra_attributes = []
-
-        attr_list = []
-        attr_list.append(UserName.create(username))
-        attr_list.append(CallingStationId.create(str(src_mac)))
-
-        if nas_port:
-            attr_list.append(NASPort.create(nas_port))
-
-        attr_list.extend(extra_attributes)
-
-        attr_list.append(EAPMessage.create(eap_message))
-
-        if state:
-            attr_list.append(state)
-
-        attr_list.append(MessageAuthenticator.create(
-            bytes.fromhex("00000000000000000000000000000000")))
-
-        attributes = RadiusAttributesList(attr_list)
-        access_request = RadiusAccessRequest(radius_packet_id, request_authenticator, attributes)
-        return access_request.build(secret)
+        template = RadiusRequestTemplate(src_mac, username, nas_port, extra_attributes)
+        return template.pack(eap_message, radius_packet_id, request_authenticator, state, secret)
 
     @staticmethod
     def eap_pack(message):
@@ -370,3 +439,68 @@ class MessagePacker:
         version, packet_type, data = MessagePacker.eap_pack(message)
         auth_8021x = Auth8021x(version=version, packet_type=packet_type, data=data)
         return auth_8021x.pack()
+
+
+class RadiusRequestTemplate:
+    """Packs the Access-Requests for one supplicant's conversation.
+    The attributes that are the same in every request (User-Name, Calling-Station-Id,
+    NAS-Port and the extra attributes) are packed once. Each request only packs its
+    EAP-Message and State, and the Message-Authenticator."""
+    MESSAGE_AUTHENTICATOR_LENGTH = RADIUS_ATTRIBUTE_HEADER.size + 16
+
+    def __init__(self, src_mac, username, nas_port=None, extra_attributes=None):
+        """
+        Args:
+            src_mac (MacAddress): supplicants mac address
+            username (str): supplicants username
+            nas_port (int): NAS-Port, not sent if None.
+            extra_attributes (list): list of extra RADIUS attributes to send in every request.
+        """
+        self.src_mac = src_mac
+        self.username = username
+        self.nas_port = nas_port
+
+        attr_list = [UserName.create(username), CallingStationId.create(str(src_mac))]
+        if nas_port:
+            attr_list.append(NASPort.create(nas_port))
+        attr_list.extend(extra_attributes or [])
+        self.static_attributes = RadiusAttributesList(attr_list).pack()
+
+    def matches(self, username, nas_port):
+        """
+        Returns:
+            True if this template packs requests for username on nas_port.
+        """
+        return self.username == username and self.nas_port == nas_port
+
+    def pack(self, eap_message, radius_packet_id, request_authenticator, state, secret):
+        """
+        Packs up an Access-Request, as MessagePacker.radius_pack() would.
+        Args:
+            eap_message (Message): e.g. IdentityMessage
+            radius_packet_id (int):
+            request_authenticator (bytes):
+            state (State): RADIUS State
+            secret (str or RadiusSigner): RADIUS secret used between Chewie and RADIUS Server
+
+        Returns:
+            packed RADIUS packet (bytearray)
+        """
+        packed_eap_message = EAPMessage.create(eap_message).pack()
+        packed_state = state.pack() if state else b""
+        length = RADIUS_HEADER_LENGTH + len(self.static_attributes) + len(packed_eap_message) + \
+            len(packed_state) + self.MESSAGE_AUTHENTICATOR_LENGTH
+
+        packed = bytearray(length)
+        RADIUS_HEADER.pack_into(packed, 0, Radius.ACCESS_REQUEST, radius_packet_id, length,
+                                request_authenticator)
+        position = RADIUS_HEADER_LENGTH
+        for packed_attributes in (self.static_attributes, packed_eap_message, packed_state):
+            packed[position:position + len(packed_attributes)] = packed_attributes
+            position += len(packed_attributes)
+        RADIUS_ATTRIBUTE_HEADER.pack_into(packed, position, MessageAuthenticator.TYPE,
+                                          self.MESSAGE_AUTHENTICATOR_LENGTH)
+        # the Message-Authenticator is zeros while it is calculated
+        if secret:
+            packed[-16:] = RadiusSigner.for_secret(secret).hmac_md5(packed).digest()
+        return packed
@@ -1,20 +1,209 @@
 """Supplicant-Facing Sockets"""
 
+import ctypes
+import mmap
 import struct
 from abc import ABC, abstractmethod
+from collections import deque
 from fcntl import ioctl
 from eventlet.green import socket
+from eventlet.hubs import trampoline
 
 from chewie.mac_address import MacAddress
 from chewie.utils import get_logger
 
 
+# Classic BPF opcodes (linux/filter.h)
+BPF_LD_W_ABS = 0x20
+BPF_LD_H_ABS = 0x28
+BPF_LD_B_ABS = 0x30
+BPF_LD_H_IND = 0x48
+BPF_LDX_B_MSH = 0xb1
+BPF_JEQ_K = 0x15
+BPF_JSET_K = 0x45
+BPF_RET_K = 0x06
+BPF_RET_A = 0x16
+SKF_LL_OFF = -0x200000  # loads relative to the link layer header
+
+
+def source_mac_fanout_program():
+    """Classic BPF program for PACKET_FANOUT_CBPF that picks a socket from the low four bytes
+    of the source MAC address, so every frame from a supplicant goes to the same socket.
+    Returns:
+        list of (code, jt, jf, k) instructions.
+    """
+    return [
+        (BPF_LD_W_ABS, 0, 0, (SKF_LL_OFF + 8) & 0xffffffff),
+        (BPF_RET_A, 0, 0, 0),
+    ]
+
+
+def dhcp_request_filter(accept_ethertypes=()):
+    """Classic BPF program that accepts DHCP client to server (UDP 68 -> 67) IPv4 packets,
+    untagged or with one 802.1Q tag, and with or without IP options. Fragments other than
+    the first are dropped, as they have no UDP header.
+    Args:
+        accept_ethertypes (tuple): untagged frames of these ethertypes are accepted too.
+    Returns:
+        list of (code, jt, jf, k) instructions.
+    """
+    def ipv4_dhcp_request(eth_len, accept, drop):
+        """Instructions for an IPv4 packet starting at eth_len, that jump to the absolute
+        instruction numbers accept or drop"""
+        return [
+            (BPF_LD_B_ABS, eth_len + 9, None),  # IP protocol
+            (BPF_JEQ_K, 17, ('next', drop)),  # UDP
+            (BPF_LD_H_ABS, eth_len + 6, None),  # flags and fragment offset
+            (BPF_JSET_K, 0x1fff, (drop, 'next')),
+            (BPF_LDX_B_MSH, eth_len, None),  # X = IP header length
+            (BPF_LD_H_IND, eth_len, None),  # UDP source port
+            (BPF_JEQ_K, MabSocket.DHCP_UDP_SRC, ('next', drop)),
+            (BPF_LD_H_IND, eth_len + 2, None),  # UDP destination port
+            (BPF_JEQ_K, MabSocket.DHCP_UDP_DST, (accept, drop)),
+        ]
+
+    untagged, tagged = 14, 18
+    block_len = len(ipv4_dhcp_request(0, 0, 0))
+    untagged_start = 3 + len(accept_ethertypes)
+    vlan_start = untagged_start + block_len
+    accept = vlan_start + 2 + block_len
+    drop = accept + 1
+    program = [(BPF_LD_H_ABS, 12, None)]  # ethertype
+    program += [(BPF_JEQ_K, ethertype, (accept, 'next')) for ethertype in accept_ethertypes]
+    program += [
+        (BPF_JEQ_K, MabSocket.VLAN_ETHERTYPE, (vlan_start, 'next')),
+        (BPF_JEQ_K, MabSocket.IP_ETHERTYPE, ('next', drop)),
+    ]
+    program += ipv4_dhcp_request(untagged, accept, drop)
+    program += [
+        (BPF_LD_H_ABS, 16, None),  # ethertype after the VLAN tag
+        (BPF_JEQ_K, MabSocket.IP_ETHERTYPE, ('next', drop)),
+    ]
+    program += ipv4_dhcp_request(tagged, accept, drop)
+    program += [
+        (BPF_RET_K, 0x40000, None),  # accept the whole frame
+        (BPF_RET_K, 0, None),  # drop
+    ]
+
+    instructions = []
+    for position, (code, k, jumps) in enumerate(program):
+        jt = jf = 0
+        if jumps:
+            jt, jf = [position + 1 if target == 'next' else target for target in jumps]
+            # jumps are relative to the next instruction
+            jt, jf = jt - position - 1, jf - position - 1
+        instructions.append((code, jt, jf, k))
+    return instructions
+
+
+class PacketRxRing:
+    """A PACKET_MMAP TPACKET_V3 receive ring for an AF_PACKET socket.
+
+    The kernel writes frames into blocks of a memory mapped ring, and hands over a block at a
+    time, so frames can be read (and rejected) without a syscall or copy each.
+    See https://www.kernel.org/doc/Documentation/networking/packet_mmap.txt
+    """
+    SOL_PACKET = 263
+    PACKET_RX_RING = 5
+    PACKET_VERSION = 10
+    TPACKET_V3 = 2
+    TP_STATUS_KERNEL = 0
+    TP_STATUS_USER = 1
+
+    BLOCK_SIZE = 1 << 16
+    BLOCK_COUNT = 32
+    FRAME_SIZE = 2048
+    BLOCK_TIMEOUT = 10  # Milliseconds before the kernel hands over a part filled block
+
+    # struct tpacket_block_desc / tpacket_hdr_v1
+    _BLOCK_HEADER = struct.Struct('=III')  # block_status, num_pkts, offset_to_first_pkt
+    _BLOCK_HEADER_OFFSET = 8
+    # struct tpacket3_hdr
+    _FRAME_HEADER = struct.Struct('=I8xI8xH')  # tp_next_offset, tp_snaplen, tp_mac
+
+    def __init__(self, packet_socket, block_size=None, block_count=None):
+        self.socket = packet_socket
+        self.block_size = block_size or self.BLOCK_SIZE
+        self.block_count = block_count or self.BLOCK_COUNT
+        self.ring = None
+        self.current_block = 0
+
+    def setup(self):
+        """Switch the socket to TPACKET_V3 and map the ring.
+        Raises:
+            OSError: if the kernel or socket does not support it.
+        """
+        self.socket.setsockopt(self.SOL_PACKET, self.PACKET_VERSION, self.TPACKET_V3)
+        frame_count = self.block_size // self.FRAME_SIZE * self.block_count
+        # struct tpacket_req3
+        request = struct.pack('=7I', self.block_size, self.block_count, self.FRAME_SIZE,
+                              frame_count, self.BLOCK_TIMEOUT, 0, 0)
+        self.socket.setsockopt(self.SOL_PACKET, self.PACKET_RX_RING, request)
+        self.ring = mmap.mmap(self.socket.fileno(), self.block_size * self.block_count,
+                              mmap.MAP_SHARED, mmap.PROT_READ | mmap.PROT_WRITE)
+
+    def _block_offset(self):
+        return self.current_block * self.block_size
+
+    def _block_ready(self):
+        status, _, _ = self._BLOCK_HEADER.unpack_from(
+            self.ring, self._block_offset() + self._BLOCK_HEADER_OFFSET)
+        return status & self.TP_STATUS_USER
+
+    def receive(self, accept=None):
+        """Wait for at least one block of frames, and return the frames from every ready block.
+        Args:
+            accept (callable): accept(frame) is called with a memoryview of each frame in the
+                ring, only frames it returns True for are copied out.
+        Returns:
+            list of bytes - accepted frames, may be empty if none were accepted.
+        """
+        while not self._block_ready():
+            trampoline(self.socket.fileno(), read=True)
+        return self.receive_ready(accept)
+
+    def receive_ready(self, accept=None):
+        """Return the frames from every ready block without waiting.
+        Args:
+            accept (callable): as for receive().
+        Returns:
+            list of bytes - accepted frames, empty if no block is ready.
+        """
+        frames = []
+        with memoryview(self.ring) as ring:
+            while self._block_ready():
+                block_offset = self._block_offset()
+                _, frame_count, offset = self._BLOCK_HEADER.unpack_from(
+                    ring, block_offset + self._BLOCK_HEADER_OFFSET)
+                frame_offset = block_offset + offset
+                for _ in range(frame_count):
+                    next_offset, snaplen, mac_offset = self._FRAME_HEADER.unpack_from(
+                        ring, frame_offset)
+                    start = frame_offset + mac_offset
+                    with ring[start:start + snaplen] as frame:
+                        if accept is None or accept(frame):
+                            frames.append(bytes(frame))
+                    frame_offset += next_offset
+                # hand the block back to the kernel.
+                struct.pack_into('=I', ring, block_offset + self._BLOCK_HEADER_OFFSET,
+                                 self.TP_STATUS_KERNEL)
+                self.current_block = (self.current_block + 1) % self.block_count
+        return frames
+
+
 class PromiscuousSocket(ABC):
     """Abstract Raw Socket in Promiscuous Mode"""
     SIOCGIFINDEX = 0x8933
     PACKET_MR_PROMISC = 1
     SOL_PACKET = 263
     PACKET_ADD_MEMBERSHIP = 1
+    SO_ATTACH_FILTER = 26
+    PACKET_FANOUT = 18
+    PACKET_FANOUT_DATA = 22
+    # PACKET_FANOUT_HASH, PACKET_FANOUT_LB, PACKET_FANOUT_CPU and PACKET_FANOUT_CBPF with
+    # source_mac_fanout_program().
+    FANOUT_MODES = {'hash': 0, 'lb': 1, 'cpu': 2, 'mac': 6}
+    RECEIVE_BATCH_SIZE = 64
     EAP_ADDRESS = MacAddress.from_string("01:80:c2:00:00:03")
 
     @abstractmethod
@@ -29,11 +218,32 @@ class PromiscuousSocket(ABC):
     def setup(self):  # pylint: disable=missing-docstring
         pass
 
-    def __init__(self, interface_name, log_prefix):
+    def __init__(self, interface_name, log_prefix, rx_ring=False,
+                 fanout_group=None, fanout_mode='mac'):
+        """
+        Args:
+            rx_ring (bool): receive through a PacketRxRing, falling back to recv() if it
+                cannot be set up.
+            fanout_group (int): PACKET_FANOUT group (0-65535) to join, so each socket in
+                the group receives a share of the frames. None to receive every frame.
+            fanout_mode (str): how the kernel shares frames out, one of FANOUT_MODES.
+                'mac' keeps every frame from a supplicant on one socket, 'hash' and 'cpu'
+                only do so for IP flows.
+        Raises:
+            ValueError: if fanout_mode is unknown.
+        """
+        if fanout_mode not in self.FANOUT_MODES:
+            raise ValueError("Unknown fanout mode '%s', expected one of: %s"
+                             % (fanout_mode, ', '.join(self.FANOUT_MODES)))
         self.socket = None
         self.interface_index = None
         self.interface_name = interface_name
         self.logger = get_logger(log_prefix)
+        self.use_rx_ring = rx_ring
+        self.rx_ring = None
+        self._ring_frames = deque()
+        self.fanout_group = fanout_group
+        self.fanout_mode = fanout_mode
 
     def _setup(self, socket_filter):
         """Set up the socket"""
@@ -45,6 +255,118 @@ class PromiscuousSocket(ABC):
         except socket.error as err:
             self.logger.error("Unable to setup socket: %s", str(err))
             raise err
+        if self.use_rx_ring:
+            self.setup_rx_ring()
+
+    def attach_filter(self, instructions):
+        """Attach a classic BPF program to the socket so the kernel drops unwanted frames.
+        Args:
+            instructions (list): (code, jt, jf, k) tuples.
+        Returns:
+            True if the filter was attached.
+        """
+        try:
+            self._set_bpf_program(socket.SOL_SOCKET, self.SO_ATTACH_FILTER, instructions)
+        except OSError as err:
+            self.logger.warning("Unable to attach socket filter: %s", err)
+            return False
+        return True
+
+    def _set_bpf_program(self, level, option, instructions):
+        """setsockopt() a classic BPF program"""
+        program = b''.join(struct.pack('HBBI', *instruction) for instruction in instructions)
+        program_buffer = ctypes.create_string_buffer(program)
+        # struct sock_fprog
+        fprog = struct.pack('HL', len(instructions), ctypes.addressof(program_buffer))
+        self.socket.setsockopt(level, option, fprog)
+
+    def join_fanout(self):
+        """Join fanout_group, if there is one. Must be done after the socket's final bind().
+        Raises:
+            OSError: if the group cannot be joined, e.g. its other sockets use another mode.
+        """
+        if self.fanout_group is None:
+            return
+        self.logger.info("Joining fanout group %d (%s) on %s",
+                         self.fanout_group, self.fanout_mode, self.interface_name)
+        mode = self.FANOUT_MODES[self.fanout_mode]
+        try:
+            self.socket.setsockopt(self.SOL_PACKET, self.PACKET_FANOUT,
+                                   self.fanout_group | (mode << 16))
+            if self.fanout_mode == 'mac':
+                self._set_bpf_program(self.SOL_PACKET, self.PACKET_FANOUT_DATA,
+                                      source_mac_fanout_program())
+        except OSError as err:
+            self.logger.error("Unable to join fanout group %d: %s", self.fanout_group, err)
+            raise err
+
+    def receive_frame_batch(self, accept=None, max_frames=None):
+        """Wait for a frame, then receive any others already queued without waiting.
+        Args:
+            accept (callable): as for receive_frame().
+            max_frames (int): most frames to read from a plain socket, defaults to
+                RECEIVE_BATCH_SIZE. A PacketRxRing returns every ready block.
+        Returns:
+            list of bytes
+        """
+        max_frames = max_frames or self.RECEIVE_BATCH_SIZE
+        frames = [self.receive_frame(accept)]
+        frames.extend(self.receive_ready_frames(accept, max_frames - 1))
+        return frames
+
+    def receive_ready_frames(self, accept=None, max_frames=None):
+        """Receive the frames already queued on the socket, without waiting.
+        Args:
+            accept (callable): as for receive_frame().
+            max_frames (int): most frames to read from a plain socket, defaults to
+                RECEIVE_BATCH_SIZE. A PacketRxRing returns every ready block.
+        Returns:
+            list of bytes - may be empty.
+        """
+        if self.rx_ring is not None:
+            frames = list(self._ring_frames)
+            self._ring_frames.clear()
+            frames.extend(self.rx_ring.receive_ready(accept))
+            return frames
+        frames = []
+        if max_frames is None:
+            max_frames = self.RECEIVE_BATCH_SIZE
+        while len(frames) < max_frames:
+            try:
+                # the green socket's underlying socket is non-blocking.
+                frame = self.socket.fd.recv(4096)
+            except (BlockingIOError, InterruptedError):
+                break
+            if accept is None or accept(frame):
+                frames.append(frame)
+        return frames
+
+    def setup_rx_ring(self):
+        """Receive through a PacketRxRing, or stay with recv() if that is not possible"""
+        rx_ring = PacketRxRing(self.socket)
+        try:
+            rx_ring.setup()
+        except (OSError, ValueError) as err:
+            self.logger.warning("Unable to setup PACKET_MMAP ring, using recv(): %s", err)
+            return
+        self.rx_ring = rx_ring
+
+    def receive_frame(self, accept=None):
+        """Receive the next frame.
+        Args:
+            accept (callable): accept(frame) returns False for frames to skip. With a
+                PacketRxRing it is called on a memoryview of the frame before it is copied.
+        Returns:
+            bytes
+        """
+        if self.rx_ring is None:
+            while True:
+                frame = self.socket.recv(4096)
+                if accept is None or accept(frame):
+                    return frame
+        while not self._ring_frames:
+            self._ring_frames.extend(self.rx_ring.receive(accept))
+        return self._ring_frames.popleft()
 
     def open(self, socket_filter):
         """Setup EAP socket"""
@@ -68,30 +390,84 @@ class PromiscuousSocket(ABC):
 class EapSocket(PromiscuousSocket):
     """Handle the EAP socket"""
 
+    def __init__(self, interface_name, log_prefix, **kwargs):
+        super().__init__(interface_name, log_prefix, **kwargs)
+        self.send_backlog = deque()  # frames send_nowait() could not send yet
+
     def setup(self):
         """Set up the socket"""
         self._setup(socket.htons(0x888e))
+        self.join_fanout()
 
     def send(self, data):
         """send on eap socket.
             data (bytes): data to send"""
         self.socket.send(data)
 
+    def send_batch(self, frames):
+        """send several frames on the eap socket in one burst.
+        Frames are written straight to the underlying non-blocking socket, only waiting
+        (and yielding to other green threads) if its send buffer is full.
+            frames (list of bytes): frames to send, in order"""
+        for frame in frames:
+            try:
+                self.socket.fd.send(frame)
+            except (BlockingIOError, InterruptedError):
+                self.socket.send(frame)
+
+    def send_nowait(self, frame):
+        """send a frame without waiting, keeping it in send_backlog if the socket is busy.
+        Call flush_send_backlog() once the socket is writable again.
+        Returns:
+            True if the frame was sent, False if it was added to send_backlog.
+        """
+        if not self.send_backlog:
+            try:
+                self.socket.fd.send(frame)
+                return True
+            except (BlockingIOError, InterruptedError):
+                pass
+        self.send_backlog.append(frame)
+        return False
+
+    def flush_send_backlog(self):
+        """send frames from send_backlog, in order, until the socket is busy.
+        Returns:
+            True if send_backlog is now empty.
+        """
+        while self.send_backlog:
+            try:
+                self.socket.fd.send(self.send_backlog[0])
+            except (BlockingIOError, InterruptedError):
+                return False
+            self.send_backlog.popleft()
+        return True
+
     def receive(self):
         """receive from eap socket"""
-        return self.socket.recv(4096)
+        return self.receive_frame()
 
 
 class MabSocket(PromiscuousSocket):
-    """Handle the Mab socket for DHCP Requests"""
+    """Handle the Mab socket for DHCP Requests
+
+    The socket listens to every ethertype, so 802.1Q tagged frames are seen, with a BPF
+    filter (dhcp_request_filter()) so only DHCP requests leave the kernel. If the filter
+    cannot be attached it falls back to untagged IPv4 frames filtered in userspace.
+    """
+    ETH_P_ALL = 0x0003
     IP_ETHERTYPE = 0x0800
+    VLAN_ETHERTYPE = 0x8100
     DHCP_UDP_SRC = 68
     DHCP_UDP_DST = 67
-    UDP_IPTYPE = b'\x11'
+    UDP_IPTYPE = 17
 
     def setup(self):
         """Set up the socket"""
-        self._setup(socket.htons(self.IP_ETHERTYPE))
+        self._setup(socket.htons(self.ETH_P_ALL))
+        if not self.attach_filter(dhcp_request_filter()):
+            self.socket.bind((self.interface_name, self.IP_ETHERTYPE))
+        self.join_fanout()
 
     def send(self, data):
         """Not Implemented -- This socket is purely for Listening"""
@@ -100,12 +476,73 @@ class MabSocket(PromiscuousSocket):
     def receive(self):
         """Receive activity from supplicant-facing socket"""
         # Skip all packets that are not DHCP requests
-        while True:
-            ret_val = self.socket.recv(4096)
+        return self.receive_frame(self.is_dhcp_request)
+
+    @classmethod
+    def is_dhcp_request(cls, frame):
+        """
+        Args:
+            frame (bytes or memoryview): ethernet frame.
+        Returns:
+            True if frame is a UDP packet from the DHCP client to the DHCP server port.
+        """
+        ip_start = 14
+        if len(frame) < ip_start + 20:
+            return False
+        ethertype = struct.unpack_from('>H', frame, 12)[0]
+        if ethertype == cls.VLAN_ETHERTYPE:
+            ip_start += 4
+            ethertype = struct.unpack_from('>H', frame, 16)[0]
+        if ethertype != cls.IP_ETHERTYPE or len(frame) < ip_start + 20:
+            return False
+        version_ihl, protocol = frame[ip_start], frame[ip_start + 9]
+        fragment_offset = struct.unpack_from('>H', frame, ip_start + 6)[0] & 0x1fff
+        if protocol != cls.UDP_IPTYPE or fragment_offset:
+            return False
+        udp_start = ip_start + (version_ihl & 0xf) * 4
+        if len(frame) < udp_start + 4:
+            return False
+        src_port, dst_port = struct.unpack_from('>HH', frame, udp_start)
+        return src_port == cls.DHCP_UDP_SRC and dst_port == cls.DHCP_UDP_DST
+
 
-            if ret_val[23:24] == self.UDP_IPTYPE:
-                src_port = struct.unpack('>H', ret_val[34:36])[0]
-                dst_port = struct.unpack('>H', ret_val[36:38])[0]
+class CaptureSocket(EapSocket):
+    """One socket for both the EAP and MAB pipelines.
+
+    Receives EAPOL frames and DHCP requests (see MabSocket) through a single BPF filter,
+    and sends EAP like an EapSocket. Use is_eapol() to tell which pipeline a frame is for.
+    """
+    EAPOL_ETHERTYPE = 0x888e
+
+    def setup(self):
+        """Set up the socket"""
+        self._setup(socket.htons(MabSocket.ETH_P_ALL))
+        if not self.attach_filter(dhcp_request_filter((self.EAPOL_ETHERTYPE,))):
+            self.logger.warning("Filtering every frame on %s in userspace", self.interface_name)
+        self.join_fanout()
+
+    @classmethod
+    def is_eapol(cls, frame):
+        """
+        Args:
+            frame (bytes or memoryview): ethernet frame.
+        Returns:
+            True if frame is an (untagged) EAPOL frame.
+        """
+        return len(frame) >= 14 and struct.unpack_from('>H', frame, 12)[0] == cls.EAPOL_ETHERTYPE
+
+    @classmethod
+    def is_wanted(cls, frame):
+        """
+        Returns:
+            True if frame is for either the EAP or MAB pipeline.
+        """
+        return cls.is_eapol(frame) or MabSocket.is_dhcp_request(frame)
+
+    def receive(self):
+        """receive the next EAPOL frame or DHCP request"""
+        return self.receive_frame(self.is_wanted)
 
-                if src_port == self.DHCP_UDP_SRC and dst_port == self.DHCP_UDP_DST:
-                    return ret_val
+    def receive_batch(self):
+        """receive every EAPOL frame and DHCP request ready, waiting for at least one"""
+        return self.receive_frame_batch(self.is_wanted)
@@ -0,0 +1,22 @@
+"""Precompiled struct.Struct codecs for the fixed size headers of the packets chewie packs
+and parses, shared by the EAP and RADIUS packet classes so no format string is parsed on
+the hot path."""
+import struct
+
+# Ethernet: destination mac, source mac, ethertype
+ETHERNET_HEADER = struct.Struct("!6s6sH")
+# 802.1X: version, packet type, length
+AUTH_8021X_HEADER = struct.Struct("!BBH")
+# Ethernet and 802.1X headers of an EAPOL frame
+EAPOL_FRAME_HEADER = struct.Struct("!6s6sHBBH")
+# EAP: code, identifier, length
+EAP_HEADER = struct.Struct("!BBH")
+# EAP Request/Response: code, identifier, length, type
+EAP_TYPE_HEADER = struct.Struct("!BBHB")
+# Ethernet, 802.1X and EAP headers and the EAP type of an EAP Request or Response frame
+EAP_FRAME_HEADER = struct.Struct("!6s6sHBBHBBHB")
+# RADIUS: code, identifier, length, authenticator
+RADIUS_HEADER = struct.Struct("!BBH16s")
+# RADIUS attribute: type, length
+RADIUS_ATTRIBUTE_HEADER = struct.Struct("!BB")
+UINT8 = struct.Struct("!B")
@@ -1,19 +1,71 @@
 """RADIUS Packets"""
-import copy
 import hashlib
 import hmac
 import struct
 
 import binascii
+from chewie.packet_structs import RADIUS_ATTRIBUTE_HEADER, RADIUS_HEADER
 from chewie.radius_attributes import ATTRIBUTE_TYPES, Attribute, MessageAuthenticator
 from chewie.radius_datatypes import Concat
 from chewie.utils import MessageParseError
 
 RADIUS_HEADER_LENGTH = 1 + 1 + 2 + 16
+RADIUS_PACKET_ID_SPACE = 256  # packet ids available per client (source) UDP port
 
 PACKET_TYPE_PARSERS = {}
 
 
+def radius_request_id(packet_id, client_port=0):
+    """Key for an outstanding RADIUS request. Each client port (source UDP port chewie sends
+    from) has its own packet id space, so the packet id alone is not unique.
+    Args:
+        packet_id (int): RADIUS packet id (0-255)
+        client_port (int): index of the client port the request was sent from.
+    Returns:
+        int - the packet_id for client_port 0.
+    """
+    return client_port * RADIUS_PACKET_ID_SPACE + packet_id
+
+
+class RadiusSigner:
+    """Hashes RADIUS packets with one shared secret. The secret is encoded and the
+    HMAC-MD5 keyed once, each packet's HMAC starts from a copy of the keyed one."""
+    _signers = {}  # secret: RadiusSigner
+
+    def __init__(self, secret):
+        """
+        Args:
+            secret (str): Shared secret between chewie and RADIUS server.
+        """
+        self.secret = secret
+        self.encoded_secret = secret.encode()
+        self._keyed_hmac = hmac.new(self.encoded_secret, digestmod='md5')
+
+    @classmethod
+    def for_secret(cls, secret):
+        """
+        Args:
+            secret (str or RadiusSigner): Shared secret between chewie and RADIUS server.
+        Returns:
+            RadiusSigner - the one shared by everything using secret.
+        """
+        if isinstance(secret, cls):
+            return secret
+        signer = cls._signers.get(secret)
+        if signer is None:
+            signer = cls._signers[secret] = cls(secret)
+        return signer
+
+    def hmac_md5(self, data=b""):
+        """
+        Returns:
+            HMAC-MD5 keyed with the secret, that has been fed data.
+        """
+        keyed_hmac = self._keyed_hmac.copy()
+        keyed_hmac.update(data)
+        return keyed_hmac
+
+
 class InvalidResponseAuthenticatorError(Exception):
     """To be used when the ResponseAuthenticator hashes
      (received in packet, and calculated) do not match."""
@@ -39,12 +91,13 @@ class Radius:
     STATUS_CLIENT = 13
 
     @staticmethod
-    def parse(packed_message, secret, radius_lifecycle=None):
+    def parse(packed_message, secret, radius_lifecycle=None, client_port=0):
         """
         Args:
             packed_message:
-            secret (str): Shared sceret between chewie and RADIUS server.
+            secret (str or RadiusSigner): Shared sceret between chewie and RADIUS server.
             radius_lifecycle: RadiusLifecycle object
+            client_port (int): index of the client port packed_message was received on.
         Returns:
             RadiusPacket - RadiusAccessChallenge/RadiusAccessRequest/
                             RadiusAccessAccept/RadiusAccessFailure
@@ -52,9 +105,7 @@ class Radius:
             MessageParseError: if packed_message cannot be parsed
         """
         try:
-            code, packet_id, length, authenticator = struct.unpack("!BBH16s",
-                                                                   packed_message[
-                                                                   :RADIUS_HEADER_LENGTH])
+            code, packet_id, length, authenticator = RADIUS_HEADER.unpack_from(packed_message)
         except struct.error as exception:
             raise MessageParseError('Unable to unpack first 20 bytes of RADIUS header') \
                 from exception
@@ -62,13 +113,15 @@ class Radius:
         if code in PACKET_TYPE_PARSERS.keys():
             radius_packet = PACKET_TYPE_PARSERS[code](packet_id, authenticator,
                                                       RadiusAttributesList.parse(
-                                                          packed_message[RADIUS_HEADER_LENGTH:]))
-            if code == Radius.ACCESS_REQUEST:
+                                                          memoryview(packed_message)
+                                                          [RADIUS_HEADER_LENGTH:]))
+            radius_packet.packed = packed_message
+            if code in (Radius.ACCESS_REQUEST, Radius.STATUS_SERVER):
                 request_authenticator = authenticator
             else:
                 try:
                     request_authenticator = radius_lifecycle.packet_id_to_request_authenticator[
-                        packet_id]
+                        radius_request_id(packet_id, client_port)]
                 except KeyError as exception:
                     raise MessageParseError('Unknown RAIDUS packet_id: %s' % packet_id, ) \
                         from exception
@@ -106,18 +159,28 @@ class RadiusPacket(Radius):
         return cls(packet_id, request_authenticator, attributes)
 
     def pack(self):
-        header = struct.pack("!BBH16s", self.CODE, self.packet_id,
-                             RADIUS_HEADER_LENGTH + self.attributes.__len__(),
-                             self.authenticator)
         packed_attributes = self.attributes.pack()
-        self.packed = bytearray(header + packed_attributes)
+        self.packed = bytearray(RADIUS_HEADER_LENGTH + len(packed_attributes))
+        RADIUS_HEADER.pack_into(self.packed, 0, self.CODE, self.packet_id,
+                                RADIUS_HEADER_LENGTH + len(self.attributes), self.authenticator)
+        self.packed[RADIUS_HEADER_LENGTH:] = packed_attributes
         return self.packed
 
+    def pack_header(self, authenticator):
+        """
+        Args:
+            authenticator (bytes): 16 byte authenticator to pack in place of this packet's.
+        Returns:
+            packed RADIUS header (bytes)
+        """
+        return RADIUS_HEADER.pack(self.CODE, self.packet_id,
+                                  RADIUS_HEADER_LENGTH + len(self.attributes), authenticator)
+
     def build(self, secret=None):
         """Only call this once, or else the MessageAuthenticator will not be zeros,
          resulting in the wrong hash
          Args:
-             secret (str): Shared sceret between chewie and RADIUS server.
+             secret (str or RadiusSigner): Shared sceret between chewie and RADIUS server.
         Returns:
             packed packet (bytes)"""
         if not self.packed:
@@ -130,19 +193,17 @@ class RadiusPacket(Radius):
             return self.packed
 
         if secret:
-            message_authenticator = bytearray(hmac.new(secret.encode(), self.packed, 'md5')
-                                              .digest())
-
-            for i in range(16):
-                self.packed[i + position] = message_authenticator[i]
+            message_authenticator = RadiusSigner.for_secret(secret).hmac_md5(self.packed).digest()
+            self.packed[position:position + len(message_authenticator)] = message_authenticator
         return self.packed
 
     def validate_packet(self, secret, request_authenticator=None, code=None):
         """Calculates the Response Authenticator (in Radius Header) and
         MessageAuthenticator (a Radius Attribute) hashes and compares with what was provided.
+        The hashes are calculated over packed, which is the received bytes for a parsed packet.
         Args:
             code (int): The RADIUS Code (e.g. Access-Challenge)
-            secret (str): secret shared between RADIUS and chewie.
+            secret (str or RadiusSigner): secret shared between RADIUS and chewie.
             request_authenticator (): the original request authenticator for this
              packet (which is a response)
         Raises:
@@ -150,50 +211,47 @@ class RadiusPacket(Radius):
             InvalidResponseAuthenticatorError: if Response Authenticator does not match calculated.
             InvalidMessageAuthenticatorError: if MessageAuthenticator does not match calculated.
         """
-        # Copy this packet so we can modify the 'Authenticator' and 'Message-Authenticator'
-        radius_packet = copy.deepcopy(self)
-
         if not secret:
             raise ValueError("secret cannot be None for hashing")
+        if self.packed is None:
+            self.pack()
+        signer = RadiusSigner.for_secret(secret)
 
-        self.validate_response_authenticator(radius_packet, request_authenticator, secret, code)
+        self.validate_response_authenticator(request_authenticator, signer, code)
 
-        self.validate_message_authenticator(radius_packet, secret, request_authenticator)
+        self.validate_message_authenticator(signer, request_authenticator)
         return self
 
-    @staticmethod
-    def validate_response_authenticator(radius_packet, request_authenticator, secret, code):
+    def validate_response_authenticator(self, request_authenticator, signer, code):
         if request_authenticator and code in [Radius.ACCESS_REJECT,
                                               Radius.ACCESS_ACCEPT,
                                               Radius.ACCESS_CHALLENGE]:
-            response_authenticator = radius_packet.authenticator
-            radius_packet.authenticator = request_authenticator
-            radius_packet.pack()
-            calculated_response_authenticator = hashlib.md5(radius_packet.packed +
-                                                            bytearray(secret, 'utf-8')).digest()
-            if calculated_response_authenticator != response_authenticator:
+            # hash the packet with the request authenticator in place of the response's
+            response_hash = hashlib.md5(self.pack_header(request_authenticator))
+            response_hash.update(memoryview(self.packed)[RADIUS_HEADER_LENGTH:])
+            response_hash.update(signer.encoded_secret)
+            calculated_response_authenticator = response_hash.digest()
+            if calculated_response_authenticator != self.authenticator:
                 raise InvalidResponseAuthenticatorError(
                     "Original ResponseAuthenticator: '%s', does not match calculated: '%s' %s" % (
-                        response_authenticator,
+                        self.authenticator,
                         calculated_response_authenticator,
-                        binascii.hexlify(radius_packet.packed)))
+                        binascii.hexlify(self.packed)))
 
-    @staticmethod
-    def validate_message_authenticator(radius_packet, secret, request_authenticator):
-        message_authenticator = radius_packet.attributes.find(MessageAuthenticator.DESCRIPTION)
+    def validate_message_authenticator(self, signer, request_authenticator):
+        message_authenticator = self.attributes.find(MessageAuthenticator.DESCRIPTION)
         if message_authenticator:
-
-            radius_packet.authenticator = request_authenticator
-
             original_ma = message_authenticator.bytes_data
-            # Replace the Original Message Authenticator
-            message_authenticator.bytes_data = bytes.fromhex(
-                "00000000000000000000000000000000")
-
-            radius_packet.pack()
+            position = self.attributes.indexof(MessageAuthenticator.DESCRIPTION) + \
+                RADIUS_HEADER_LENGTH + Attribute.HEADER_SIZE
 
-            # calculate new hash message authenticator
-            new_ma = hmac.new(secret.encode(), radius_packet.packed, 'md5').digest()
+            # hash the packet with the request authenticator and a zeroed Message-Authenticator
+            packed = memoryview(self.packed)
+            ma_hash = signer.hmac_md5(self.pack_header(request_authenticator))
+            ma_hash.update(packed[RADIUS_HEADER_LENGTH:position])
+            ma_hash.update(bytes(len(original_ma)))
+            ma_hash.update(packed[position + len(original_ma):])
+            new_ma = ma_hash.digest()
 
             # compare old and new message authenticator
             if original_ma != new_ma:
@@ -222,109 +280,117 @@ class RadiusAccessChallenge(RadiusPacket):
     CODE = Radius.ACCESS_CHALLENGE
 
 
+@register_packet_type_parser
+class RadiusStatusServer(RadiusPacket):
+    """RFC 5997 Status-Server, answered with an Access-Accept by a live server"""
+    CODE = Radius.STATUS_SERVER
+
+
 class RadiusAttributesList:
-    """Container class for the Radius Attribute Value Pairs"""
+    """Container class for the Radius Attribute Value Pairs.
+    Lookups by description, byte offsets, the packed length and to_dict() are worked out
+    once and cached. Assigning attributes or calling append() drops the cache; call
+    invalidate() after changing the list or an attribute's length in place."""
 
     def __init__(self, attributes):
+        self._attributes = None
+        self._index = None  # description: first attribute with it
+        self._offsets = None  # description: number of bytes to the first attribute with it
+        self._length = None
+        self._dict = None
         self.attributes = attributes
 
+    @property
+    def attributes(self):
+        """list of the attributes, in packet order"""
+        return self._attributes
+
+    @attributes.setter
+    def attributes(self, attributes):
+        self._attributes = attributes
+        self.invalidate()
+
+    def invalidate(self):
+        """Drop the cached index, offsets, length and dict"""
+        self._index = None
+        self._offsets = None
+        self._length = None
+        self._dict = None
+
+    def append(self, attribute):
+        """Add attribute to the end of the list"""
+        self._attributes.append(attribute)
+        self.invalidate()
+
+    def _build_index(self):
+        index = {}
+        offsets = {}
+        length = 0
+        for attr in self._attributes:
+            if attr.DESCRIPTION not in index:
+                index[attr.DESCRIPTION] = attr
+                offsets[attr.DESCRIPTION] = length
+            length += attr.full_length()
+        self._index = index
+        self._offsets = offsets
+        self._length = length
+
     @classmethod
     def parse(cls, attributes_data):
-        """
-
+        """Decode the attributes in one pass over attributes_data.
+        The values of the attributes of a Concat type (e.g. EAP-Message) are joined into one
+        attribute, at the position of the first of them. indexof() gives the offsets in
+        attributes_data, however the values were fragmented.
         Args:
-            attributes_data:
-
+            attributes_data (bytes-like):
         Returns:
             RadiusAttributeList
         Raises:
             MessageParseError: if unable to parse an attribute's data.
         """
+        data = memoryview(attributes_data)
+        total_length = len(data)
         attributes = []
-        attributes_to_concat = {}
-        cls.extract_attributes(attributes_data, attributes, attributes_to_concat)
-
-        attributes = cls.merge_concat_attributes(attributes, attributes_to_concat)
-
-        return cls(attributes)
-
-    @classmethod
-    def merge_concat_attributes(cls, attributes, attributes_to_concat):
-        """
-        Removes concat attributes for attributes list, and inserts a single new master attribute
-        for all concat attributes of the same type (e.g. EAPMessage, EAPMessage, = 1 EAPMessage)
-        Args:
-            attributes (list):
-            attributes_to_concat (dict): attribute - position.
-        Returns:
-            attributes (list)
-        Raises:
-            MessageParseError: RadiusAttribute.parse will raise error
-            if it cannot parse the attribute's data
-        """
-        # Join Attributes that's datatype is Concat into one attribute.
-        concatenated_attributes = []
-        for value, list_ in attributes_to_concat.items():
-            concatenated_data = b""
-            for d, i in list_:
-                concatenated_data += d.bytes_data
-            concatenated_attributes.append(tuple((ATTRIBUTE_TYPES[value].parse(concatenated_data),
-                                                  i)))
-        # Remove old Attributes that were concatenated.
-        for ca, _ in concatenated_attributes:
-            attributes = [x for x in attributes if x.TYPE != ca.TYPE]
-
-        # need to put them back in the same position.
-        for ca, i in concatenated_attributes:
-            attributes.insert(i, ca)
-
-        return attributes
-
-    @classmethod
-    def extract_attributes(cls, attributes_data, attributes, attributes_to_concat):
-        """
-        Extracts Radius Attributes from a packed payload.
-        Keeps track of attribute ordering.
-        Args:
-            attributes_data (): data to extract from (input).
-            attributes: attributes extracted (output variable).
-            attributes_to_concat (dict): (output variable).
-        Raises:
-            MessageParseError: RadiusAttribute.parse will raise error
-            if it cannot parse the attribute's data
-        """
-        total_length = len(attributes_data)
+        concat_values = {}  # attribute type: (position in attributes, [values])
+        offsets = {}
         pos = 0
-        index = -1
-        last_attribute = -1
         while pos < total_length:
             try:
-                type_, attr_length = struct.unpack("!BB",
-                                                   attributes_data[pos:pos + Attribute.HEADER_SIZE])
+                type_, attr_length = RADIUS_ATTRIBUTE_HEADER.unpack_from(data, pos)
             except struct.error as exception:
                 raise MessageParseError('Unable to unpack first 2 bytes of attribute header') \
                     from exception
-            data = attributes_data[pos + Attribute.HEADER_SIZE: pos + attr_length]
-            pos += attr_length
-
-            packed_value = data[:attr_length - Attribute.HEADER_SIZE]
+            if attr_length < Attribute.HEADER_SIZE:
+                raise MessageParseError('RADIUS attribute %s has bad length: %d' %
+                                        (type_, attr_length))
             try:
-                attribute = ATTRIBUTE_TYPES[type_].parse(packed_value)
+                attribute_type = ATTRIBUTE_TYPES[type_]
             except KeyError as exception:
                 raise MessageParseError('Cannot find parser for RADIUS attribute %s' %
                                         type_) from exception
-            # keep track of where the concated AVP should be in the attributes list.
-            # required so the hashing gives correct hash.
-            if attribute.DATA_TYPE != Concat or last_attribute != attribute.TYPE:
-                index += 1
-            last_attribute = attribute.TYPE
-
-            if attribute.DATA_TYPE.DATA_TYPE_VALUE == Concat.DATA_TYPE_VALUE:
-                if attribute.TYPE not in attributes_to_concat:
-                    attributes_to_concat[attribute.TYPE] = []
-                attributes_to_concat[attribute.TYPE].append((attribute, index))
+            packed_value = data[pos + Attribute.HEADER_SIZE:pos + attr_length]
+            offsets.setdefault(attribute_type.DESCRIPTION, pos)
+            pos += attr_length
 
-            attributes.append(attribute)
+            if attribute_type.DATA_TYPE is Concat:
+                if type_ in concat_values:
+                    concat_values[type_][1].append(packed_value)
+                else:
+                    # keep the joined attribute's place, so the hashing gives correct hash.
+                    concat_values[type_] = (len(attributes), [packed_value])
+                    attributes.append(None)
+            else:
+                attributes.append(attribute_type.parse(packed_value))
+
+        for type_, (position, values) in concat_values.items():
+            attributes[position] = ATTRIBUTE_TYPES[type_].parse(b"".join(values))
+        attributes_list = cls(attributes)
+        attributes_list._index = {}
+        for attr in attributes:
+            attributes_list._index.setdefault(attr.DESCRIPTION, attr)
+        attributes_list._offsets = offsets
+        attributes_list._length = total_length
+        return attributes_list
 
     def find(self, item):
         """Find first attribute that has the matching description
@@ -332,10 +398,9 @@ class RadiusAttributesList:
             item (str): description of attribute to find
         Returns:
             attribute or None if not found"""
-        for attr in self.attributes:
-            if item == attr.DESCRIPTION:
-                return attr
-        return None
+        if self._index is None:
+            self._build_index()
+        return self._index.get(item)
 
     def indexof(self, item):
         """Finds the position (number of bytes) that item is at in list.
@@ -346,29 +411,27 @@ class RadiusAttributesList:
         Raises:
             ValueErrpr: if cannot find item
         """
-        i = 0
-        for attr in self.attributes:
-            if item == attr.DESCRIPTION:
-                break
-            i += attr.full_length()
-        else:
-            raise ValueError("Cannot find item: %s in attributes list" % item)
-        return i
+        if self._offsets is None:
+            self._build_index()
+        try:
+            return self._offsets[item]
+        except KeyError as exception:
+            raise ValueError("Cannot find item: %s in attributes list" % item) from exception
 
     def __len__(self):
-        total = 0
-        for attr in self.attributes:
-            total = total + attr.full_length()
-        return total
+        if self._length is None:
+            self._build_index()
+        return self._length
 
     def pack(self):
-        packed_attributes = bytes()
-        for attr in self.attributes:
-            packed_attributes += attr.pack()
-        return packed_attributes
+        return b"".join([attr.pack() for attr in self.attributes])
 
     def to_dict(self):
-        ret = {}
-        for a in self.attributes:
-            ret[a.DESCRIPTION] = a.data()
-        return ret
+        """
+        Returns:
+            dict - description: data() of the last attribute with it. Worked out once, so
+            must not be modified.
+        """
+        if self._dict is None:
+            self._dict = {a.DESCRIPTION: a.data() for a in self._attributes}
+        return self._dict
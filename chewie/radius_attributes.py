@@ -2,10 +2,10 @@
 # TODO if attributes have requirements e.g. length must be above minimum, can enforce that here.
 # TODO could we auto generate this from the radius-types-2.csv available from iana.org?
 
-import struct
 from hashlib import md5
 
 import math
+from chewie.packet_structs import RADIUS_ATTRIBUTE_HEADER
 from chewie.radius_datatypes import Concat, Enum, Integer, String, Text, Vsa
 ATTRIBUTE_TYPES = {}
 
@@ -50,7 +50,7 @@ class Attribute():
         Returns:
             packed attribute (including header) bytes
         """
-        tl = struct.pack("!BB", self.TYPE, self.full_length())
+        tl = RADIUS_ATTRIBUTE_HEADER.pack(self.TYPE, self.full_length())
         v = self._data_type.pack(self.TYPE)
         return tl + v
 
@@ -1,7 +1,7 @@
 """Radius Attribute Datatypes"""
-import struct
-
 import math
+
+from chewie.packet_structs import RADIUS_ATTRIBUTE_HEADER
 from chewie.utils import MessageParseError
 
 
@@ -78,12 +78,12 @@ class Integer(DataType):
 
         try:
             cls.is_valid_length(packed_value)
-            return cls(bytes_data=struct.unpack("!4s", packed_value)[0])
-        except (ValueError, struct.error)as exception:
+            return cls(bytes_data=bytes(packed_value))
+        except ValueError as exception:
             raise MessageParseError("%s unable to unpack." % cls.__name__) from exception
 
     def pack(self, attribute_type):
-        return struct.pack("!4s", self.bytes_data)
+        return self.bytes_data
 
     def data(self):
         return int.from_bytes(self.bytes_data, 'big')  # pytype: disable=attribute-error
@@ -109,12 +109,12 @@ class Enum(DataType):
     def parse(cls, packed_value):
         try:
             cls.is_valid_length(packed_value)
-            return cls(bytes_data=struct.unpack("!4s", packed_value)[0])
-        except (ValueError, struct.error)as exception:
+            return cls(bytes_data=bytes(packed_value))
+        except ValueError as exception:
             raise MessageParseError("%s unable to unpack." % cls.__name__) from exception
 
     def pack(self, attribute_type):
-        return struct.pack("!4s", self.bytes_data)
+        return self.bytes_data
 
     def data(self):
         return int.from_bytes(self.bytes_data, 'big')  # pytype: disable=attribute-error
@@ -136,12 +136,12 @@ class Text(DataType):
     def parse(cls, packed_value):
         try:
             cls.is_valid_length(packed_value)
-            return cls(struct.unpack("!%ds" % len(packed_value), packed_value)[0])
-        except (ValueError, struct.error) as exception:
+            return cls(bytes(packed_value))
+        except ValueError as exception:
             raise MessageParseError("%s unable to unpack." % cls.__name__) from exception
 
     def pack(self, attribute_type):
-        return struct.pack("!%ds" % len(self.bytes_data), self.bytes_data)
+        return self.bytes_data
 
     def data(self):
         return self.bytes_data.decode("UTF-8")
@@ -167,12 +167,12 @@ class String(DataType):
     def parse(cls, packed_value):
         try:
             cls.is_valid_length(packed_value)
-            return cls(struct.unpack("!%ds" % len(packed_value), packed_value)[0])
-        except (ValueError, struct.error) as exception:
+            return cls(bytes(packed_value))
+        except ValueError as exception:
             raise MessageParseError("%s unable to unpack." % cls.__name__) from exception
 
     def pack(self, attribute_type):
-        return struct.pack("!%ds" % len(self.bytes_data), self.bytes_data)
+        return self.bytes_data
 
     def data_length(self):
         return len(self.bytes_data)
@@ -197,31 +197,17 @@ class Concat(DataType):
         # Packing is (generally) for packets going to the radius server.
         #
         # Therefore we error out if length is too long (you are not allowed to have AVP that are too long)
-        try:
-            return cls(struct.unpack("!%ds" % len(packed_value), packed_value)[0])
-        except struct.error as exception:
-            raise MessageParseError("%s unable to unpack." % cls.__name__) from exception
+        return cls(bytes(packed_value))
 
     def pack(self, attribute_type):
-
-        def chunks(data):
-            length = self.MAX_DATA_LENGTH
-            list_length = len(data)
-            return_chunks = []
-            for i in range(0, list_length, self.MAX_DATA_LENGTH):
-                if i + self.MAX_DATA_LENGTH > list_length:
-                    length = list_length % self.MAX_DATA_LENGTH
-
-                chunk = data[i:i + length]
-                chunk_length = len(chunk)
-                packed = struct.pack("!BB%ds" % chunk_length, attribute_type,
-                                     chunk_length + self.AVP_HEADER_LEN,
-                                     chunk)
-                return_chunks.append(packed)
-            return return_chunks
-
-        packed = b"".join(chunks(self.bytes_data))
-        return packed
+        data = self.bytes_data
+        packed = []
+        for i in range(0, len(data), self.MAX_DATA_LENGTH):
+            chunk = data[i:i + self.MAX_DATA_LENGTH]
+            packed.append(RADIUS_ATTRIBUTE_HEADER.pack(attribute_type,
+                                                       len(chunk) + self.AVP_HEADER_LEN))
+            packed.append(chunk)
+        return b"".join(packed)
 
     def data(self):
         return self.bytes_data
@@ -252,12 +238,12 @@ class Vsa(DataType):
         # we could do that at some point (e.g. if we wanted to use Vendor-Specific)
         try:
             cls.is_valid_length(packed_value)
-            return cls(struct.unpack("!%ds" % len(packed_value), packed_value)[0])
-        except (ValueError, struct.error) as exception:
+            return cls(bytes(packed_value))
+        except ValueError as exception:
             raise MessageParseError("%s unable to unpack." % cls.__name__) from exception
 
     def pack(self, attribute_type):
-        return struct.pack("!%ds" % (self.data_length()), self.bytes_data)
+        return self.bytes_data
 
     def data_length(self):
         return len(self.bytes_data)
@@ -1,12 +1,17 @@
 """A placeholder object for RADIUS logic extracted from Chewie"""
 
 import os
+import random
 import struct
+import time
+from collections import deque
 
 from chewie.event import EventRadiusMessageReceived
 from chewie.mac_address import MacAddress
-from chewie.message_parser import MessagePacker
+from chewie.message_parser import MessagePacker, RadiusRequestTemplate
+from chewie.radius import radius_request_id, RADIUS_PACKET_ID_SPACE
 from chewie.radius_attributes import State, CalledStationId, NASIdentifier, NASPortType
+from chewie.radius_servers import RadiusServer, RadiusServerPool
 
 
 def port_id_to_int(port_id):
@@ -18,22 +23,107 @@ def port_id_to_int(port_id):
 
 
 
+class OutstandingRequest:
+    """A RADIUS request that has been sent, and not yet replied to or expired"""
+
+    def __init__(self, client_port, server):
+        self.client_port = client_port
+        self.server = server
+        self.packed_message = None
+        self.first_sent_time = None
+        self.sent_time = None
+        self.retransmit_count = 0
+        self.retransmit_timeout = None  # seconds
+        self.retransmit_job = None
+        self.expiry_job = None
+        self.status_server = False  # True for Status-Server probes
+
+    def cancel_timers(self):
+        """Cancel any pending retransmission and expiry"""
+        for job in (self.retransmit_job, self.expiry_job):
+            if job:
+                job.cancel()
+        self.retransmit_job = None
+        self.expiry_job = None
+
+
 class RadiusLifecycle:
-    """A placeholder object for RADIUS logic extracted from Chewie"""
+    """A placeholder object for RADIUS logic extracted from Chewie
+
+    Requests are sent from up to max_client_ports client (source) UDP ports, each with its own
+    256 packet ids (RFC 5080 section 2.2.2). Client ports are added as they are needed, and a
+    packet id is not reused until the reply to the request using it has been received, or the
+    request has been outstanding for REQUEST_TTL seconds.
+
+    Unanswered requests are retransmitted unchanged (same packet id and authenticator) with
+    the backoff from RFC 5080 section 2.2.1. The first timeout is taken from the measured
+    round trip time to the server, or IRT until there is a measurement.
+
+    Which server each request goes to is decided by a RadiusServerPool. Servers can also be
+    probed with Status-Server (RFC 5997), so the pool learns a server is dead or alive again
+    without waiting on requests from supplicants.
+    """
+    MAX_CLIENT_PORTS = 16
 
-    def __init__(self, radius_secret, server_id, logger):
+    # RFC 5080 section 2.2.1 retransmission parameters
+    IRT = 2  # Initial retransmission timeout, Number of Seconds
+    MRC = 5  # Maximum retransmission count
+    MRT = 16  # Maximum retransmission timeout, Number of Seconds
+    MRD = 30  # Maximum retransmission duration, Number of Seconds
+    RAND = 0.1  # Randomisation factor
+    MIN_RETRANSMIT_TIMEOUT = 1  # Number of Seconds
+
+    # The last retransmission can go out just before MRD, so wait for its reply too.
+    REQUEST_TTL = MRD + MRT  # Number of Seconds
+
+    STATUS_SERVER_INTERVAL = 30  # Number of Seconds
+    STATUS_SERVER_TIMEOUT = 5  # Number of Seconds
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, radius_secret, server_id, logger, max_client_ports=None,
+                 packet_id_released_handler=None, timer_scheduler=None, request_ttl=None,
+                 send_handler=None, server_pool=None):
+        """
+        Args:
+            max_client_ports (int): most client ports to send requests from.
+            packet_id_released_handler (callable): called when a packet id becomes free.
+            timer_scheduler (TimerScheduler): used to retransmit and expire requests that
+                get no reply.
+            request_ttl (int): seconds to wait for a reply before forgetting a request.
+            send_handler (callable): send_handler(client_port, server, packed_message)
+                retransmits a request. Requests are not retransmitted without it.
+            server_pool (RadiusServerPool): servers to send requests to.
+        """
         self.radius_secret = radius_secret
         self.server_id = server_id
         self.logger = logger
+        self.max_client_ports = max_client_ports or self.MAX_CLIENT_PORTS
+        self.packet_id_released_handler = packet_id_released_handler
+        self.timer_scheduler = timer_scheduler
+        self.request_ttl = request_ttl or self.REQUEST_TTL
+        self.send_handler = send_handler
+        self.server_pool = server_pool or RadiusServerPool([RadiusServer(None)], logger)
+        self.status_server_interval = None  # seconds, None when not probing
 
-        self.next_radius_id = 0
+        self.free_packet_ids = []  # client_port: deque of unused packet ids
         self.extra_radius_request_attributes = self.prepare_extra_radius_attributes()
+        self.request_templates = {}  # src_mac: RadiusRequestTemplate
 
-        self.packet_id_to_mac = {}  # radius_packet_id: mac
-        self.packet_id_to_request_authenticator = {}
+        self.packet_id_to_mac = {}  # radius_request_id: mac
+        self.packet_id_to_request_authenticator = {}  # radius_request_id: request_authenticator
+        self.outstanding_requests = {}  # radius_request_id: OutstandingRequest
+        self.expired_request_count = 0
+        self.retransmitted_request_count = 0
 
     def process_outbound(self, radius_output_bits):
-        """Placeholder method extracted from Chewie._send_radius_messages()"""
+        """Placeholder method extracted from Chewie._send_radius_messages()
+        Callers should check packet_id_available() first.
+        Returns:
+            tuple (client_port, RadiusServer, packed RADIUS packet) - client port to send the
+            packet from, and server to send it to.
+        Raises:
+            RuntimeError: if there are no free packet ids.
+        """
         radius_payload = radius_output_bits.message
         src_mac = radius_output_bits.src_mac
         username = radius_output_bits.identity
@@ -52,17 +142,30 @@ class RadiusLifecycle:
         self.logger.info("Sending to RADIUS payload %s with state %s",
                          radius_payload.__dict__, state_dict)
 
-        radius_packet_id = self.get_next_radius_packet_id()
-        self.packet_id_to_mac[radius_packet_id] = {'src_mac': src_mac, 'port_id': port_id}
-
+        client_port, radius_packet_id = self.get_next_radius_packet_id()
+        request_id = radius_request_id(radius_packet_id, client_port)
         request_authenticator = self.generate_request_authenticator()
-        self.packet_id_to_request_authenticator[radius_packet_id] = request_authenticator
+        request = self.track_request(request_id, src_mac, port_id, request_authenticator,
+                                     new_conversation=state is None)
+
+        packed_message = self.get_request_template(src_mac, username, port_id).pack(
+            radius_payload, radius_packet_id, request_authenticator, state, self.radius_secret)
+        self.request_sent(request_id, packed_message)
+        return client_port, request.server, packed_message
 
-        return MessagePacker.radius_pack(radius_payload, src_mac, username,
-                                         radius_packet_id, request_authenticator, state,
-                                         self.radius_secret,
-                                         port_id_to_int(port_id),
-                                         self.extra_radius_request_attributes)
+    def get_request_template(self, src_mac, username, port_id):
+        """
+        Returns:
+            RadiusRequestTemplate - for src_mac's requests, made when the supplicant is new or
+            its username or port has changed.
+        """
+        nas_port = port_id_to_int(port_id)
+        template = self.request_templates.get(src_mac)
+        if template is None or not template.matches(username, nas_port):
+            template = RadiusRequestTemplate(src_mac, username, nas_port,
+                                             self.extra_radius_request_attributes)
+            self.request_templates[src_mac] = template
+        return template
 
     def build_event_radius_message_received(self, radius):
         """Build a EventRadiusMessageReceived from a radius message"""
@@ -76,27 +179,240 @@ class RadiusLifecycle:
         port_id = radius_output_bits.port_mac
         self.logger.info("Sending MAB to RADIUS: %s", src_mac)
 
-        radius_packet_id = self.get_next_radius_packet_id()
-        self.packet_id_to_mac[radius_packet_id] = {'src_mac': src_mac, 'port_id': port_id}
+        client_port, radius_packet_id = self.get_next_radius_packet_id()
+        request_id = radius_request_id(radius_packet_id, client_port)
         request_authenticator = self.generate_request_authenticator()
-        self.packet_id_to_request_authenticator[radius_packet_id] = request_authenticator
-        return MessagePacker.radius_mab_pack(src_mac, radius_packet_id,
-                                             request_authenticator, self.radius_secret,
-                                             port_id_to_int(port_id))
+        request = self.track_request(request_id, src_mac, port_id, request_authenticator)
+        packed_message = MessagePacker.radius_mab_pack(src_mac, radius_packet_id,
+                                                       request_authenticator,
+                                                       self.radius_secret,
+                                                       port_id_to_int(port_id))
+        self.request_sent(request_id, packed_message)
+        return client_port, request.server, packed_message
 
     def generate_request_authenticator(self):
         """Workaround until we get this extracted for easy mocking"""
         return os.urandom(16)
 
+    @property
+    def outstanding_request_count(self):
+        """Number of requests sent that are still waiting for a reply"""
+        return len(self.outstanding_requests)
+
+    # pylint: disable=too-many-arguments
+    def track_request(self, request_id, src_mac, port_id, request_authenticator,
+                      new_conversation=True):
+        """Record an outstanding request so its reply can be validated and routed,
+        and choose the server to send it to.
+        Args:
+            request_id (int): radius_request_id() of the request.
+            src_mac (MacAddress): supplicant the request is for.
+            port_id (MacAddress): port the supplicant is on.
+            request_authenticator (bytes): the Request Authenticator the request was sent with.
+            new_conversation (bool): False if the request carries a State attribute.
+        Returns:
+            OutstandingRequest
+        """
+        self.packet_id_to_mac[request_id] = {'src_mac': src_mac, 'port_id': port_id}
+        server = self.server_pool.select_server(src_mac, new_conversation)
+        return self._add_outstanding_request(request_id, request_authenticator, server,
+                                             self.request_ttl)
+
+    def _add_outstanding_request(self, request_id, request_authenticator, server, ttl):
+        self.packet_id_to_request_authenticator[request_id] = request_authenticator
+        self.server_pool.request_sent(server)
+        request = OutstandingRequest(request_id // RADIUS_PACKET_ID_SPACE, server)
+        self.outstanding_requests[request_id] = request
+        if self.timer_scheduler:
+            request.expiry_job = self.timer_scheduler.call_later(
+                ttl, self.expire_request, request_id)
+        return request
+
+    def start_status_server_probes(self, interval=None):
+        """Probe every server with Status-Server every interval seconds, starting now.
+        A probe that has no reply within STATUS_SERVER_TIMEOUT counts as a failed request.
+        Args:
+            interval (int): seconds between probes to each server.
+        Raises:
+            ValueError: if there is no timer_scheduler or send_handler to probe with.
+        """
+        if not (self.timer_scheduler and self.send_handler):
+            raise ValueError("Status-Server probes need a timer_scheduler and a send_handler")
+        self.status_server_interval = interval or self.STATUS_SERVER_INTERVAL
+        for server in self.server_pool.servers:
+            self.send_status_server(server)
+
+    def send_status_server(self, server):
+        """Send a Status-Server probe to server, and schedule the next one.
+        Probes are not retransmitted, each uses a new packet id (RFC 5997 section 4.1)."""
+        if not (self.timer_scheduler and self.send_handler):
+            self.logger.warning("Cannot probe %s without a timer_scheduler and send_handler",
+                                server)
+            return
+        if self.status_server_interval:
+            self.timer_scheduler.call_later(self.status_server_interval,
+                                            self.send_status_server, server)
+        if not self.packet_id_available():
+            self.logger.warning("No free RADIUS packet id to probe %s with", server)
+            return
+
+        client_port, radius_packet_id = self.get_next_radius_packet_id()
+        request_id = radius_request_id(radius_packet_id, client_port)
+        request_authenticator = self.generate_request_authenticator()
+        request = self._add_outstanding_request(request_id, request_authenticator, server,
+                                                self.STATUS_SERVER_TIMEOUT)
+        request.status_server = True
+        request.packed_message = MessagePacker.radius_status_server_pack(
+            radius_packet_id, request_authenticator, self.radius_secret,
+            [NASIdentifier.create(self.server_id)])
+        request.first_sent_time = request.sent_time = time.time()
+        self.logger.debug("Sending Status-Server %d to %s", request_id, server)
+        self.send_handler(client_port, server, request.packed_message)
+
+    def is_status_server_request(self, request_id):
+        """
+        Returns:
+            True if request_id is an outstanding Status-Server probe, rather than a request
+            for a supplicant.
+        """
+        request = self.outstanding_requests.get(request_id)
+        return bool(request and request.status_server)
+
+    def request_sent(self, request_id, packed_message):
+        """Record that a tracked request has been packed and sent, and start retransmitting
+        it if no reply is received.
+        Args:
+            request_id (int): radius_request_id() of the request.
+            packed_message (bytes): the request as sent.
+        """
+        request = self.outstanding_requests[request_id]
+        request.packed_message = packed_message
+        request.first_sent_time = request.sent_time = time.time()
+        if self.timer_scheduler and self.send_handler:
+            timeout = request.server.rtt_estimator.retransmit_timeout()
+            if timeout is None:
+                timeout = self.IRT
+            timeout = min(max(timeout, self.MIN_RETRANSMIT_TIMEOUT), self.MRT)
+            self._schedule_retransmit(request_id, request, self._randomise(timeout))
+
+    def _randomise(self, timeout):
+        return timeout + random.uniform(-self.RAND, self.RAND) * timeout
+
+    def _schedule_retransmit(self, request_id, request, timeout):
+        if request.retransmit_count >= self.MRC or \
+                request.sent_time + timeout - request.first_sent_time > self.MRD:
+            # give up, the request is forgotten when it expires.
+            return
+        request.retransmit_timeout = timeout
+        request.retransmit_job = self.timer_scheduler.call_later(
+            timeout, self.retransmit_request, request_id)
+
+    def retransmit_request(self, request_id):
+        """Resend a request that has not been replied to, and back off the next timeout"""
+        request = self.outstanding_requests.get(request_id)
+        if request is None:
+            return
+        request.retransmit_job = None
+        request.retransmit_count += 1
+        request.sent_time = time.time()
+        self.retransmitted_request_count += 1
+        self.logger.info("Retransmitting RADIUS request %d to %s (attempt %d)",
+                         request_id, request.server, request.retransmit_count + 1)
+        self.send_handler(request.client_port, request.server, request.packed_message)
+
+        timeout = 2 * request.retransmit_timeout + \
+            random.uniform(-self.RAND, self.RAND) * request.retransmit_timeout
+        if timeout > self.MRT:
+            timeout = self._randomise(self.MRT)
+        self._schedule_retransmit(request_id, request, timeout)
+
+    def reply_received(self, request_id, conversation_over=False):
+        """Forget a request that has been replied to, measuring the round trip time if the
+        request was only sent once.
+        Args:
+            request_id (int): radius_request_id() of the reply.
+            conversation_over (bool): True if the reply is an Access-Accept or Access-Reject.
+        """
+        request = self.outstanding_requests.get(request_id)
+        if request and request.sent_time and not request.retransmit_count:
+            request.server.rtt_estimator.update(time.time() - request.sent_time)
+        if conversation_over and request_id in self.packet_id_to_mac:
+            self.end_conversation(self.packet_id_to_mac[request_id]['src_mac'])
+        self.release_packet_id(request_id)
+
+    def end_conversation(self, src_mac):
+        """Forget what is kept about src_mac between requests, once its conversation
+        has ended (or been given up on).
+        Args:
+            src_mac (MacAddress): supplicant whose conversation has ended.
+        """
+        self.request_templates.pop(src_mac, None)
+        self.server_pool.end_conversation(src_mac)
+
+    def expire_request(self, request_id):
+        """Forget a request that has not been replied to within request_ttl"""
+        request = self.outstanding_requests.get(request_id)
+        if request is None:
+            return
+        if request.status_server:
+            self.logger.warning("Status-Server %d to %s has had no reply", request_id,
+                                request.server)
+        else:
+            src_mac = self.packet_id_to_mac[request_id]['src_mac']
+            self.logger.warning("RADIUS request %d for %s has had no reply after %d seconds",
+                                request_id, src_mac, self.request_ttl)
+            self.expired_request_count += 1
+            self.end_conversation(src_mac)
+        self.release_packet_id(request_id, answered=False)
+
+    def packet_id_available(self):
+        """
+        Returns:
+            True if get_next_radius_packet_id() can allocate a packet id.
+        """
+        return len(self.free_packet_ids) < self.max_client_ports or \
+            any(self.free_packet_ids)
+
     def get_next_radius_packet_id(self):
-        """Calulate the next RADIUS Packet ID
+        """Allocate the next free RADIUS Packet ID, from the lowest client port that has one.
         Returns:
-            int
+            tuple (client_port, packet_id)
+        Raises:
+            RuntimeError: if every client port has run out of packet ids.
         """
-        radius_id = self.next_radius_id
-        self.next_radius_id = (self.next_radius_id + 1) % 256
+        for client_port, free_ids in enumerate(self.free_packet_ids):
+            if free_ids:
+                return client_port, free_ids.popleft()
+
+        if len(self.free_packet_ids) >= self.max_client_ports:
+            raise RuntimeError("No free RADIUS packet ids on any of the %d client ports" %
+                               self.max_client_ports)
+        client_port = len(self.free_packet_ids)
+        self.logger.info("Adding RADIUS client port %d", client_port)
+        self.free_packet_ids.append(deque(range(RADIUS_PACKET_ID_SPACE)))
+        return client_port, self.free_packet_ids[client_port].popleft()
 
-        return radius_id
+    def release_packet_id(self, request_id, answered=True):
+        """Forget an outstanding request and allow its packet id to be reused.
+        Once forgotten, any further (duplicate) replies to the request fail to parse.
+        Released ids go to the back of the free list so they are reused as late as possible.
+        Args:
+            request_id (int): radius_request_id() of the request.
+            answered (bool): False if the request is being given up on.
+        """
+        request = self.outstanding_requests.pop(request_id, None)
+        if request is None:
+            return
+        request.cancel_timers()
+        self.server_pool.request_finished(request.server, answered)
+        self.packet_id_to_mac.pop(request_id, None)
+        self.packet_id_to_request_authenticator.pop(request_id, None)
+        client_port, packet_id = divmod(request_id, RADIUS_PACKET_ID_SPACE)
+        if client_port >= len(self.free_packet_ids):
+            return
+        self.free_packet_ids[client_port].append(packet_id)
+        if self.packet_id_released_handler:
+            self.packet_id_released_handler()
 
     def prepare_extra_radius_attributes(self):
         """Create RADIUS Attirbutes to be sent with every RADIUS request"""
@@ -0,0 +1,199 @@
+"""RADIUS servers that requests can be sent to, and how to choose between them"""
+
+
+class RadiusRttEstimator:
+    """Smoothed round trip time to a RADIUS server (RFC 6298 section 2)"""
+    ALPHA = 1 / 8
+    BETA = 1 / 4
+    K = 4
+
+    def __init__(self):
+        self.srtt = None  # seconds
+        self.rttvar = None  # seconds
+
+    def update(self, rtt):
+        """Add a round trip time measurement.
+        Only requests that were not retransmitted should be measured (Karn's algorithm).
+        Args:
+            rtt (float): seconds between sending a request and receiving its reply.
+        """
+        if self.srtt is None:
+            self.srtt = rtt
+            self.rttvar = rtt / 2
+            return
+        self.rttvar = (1 - self.BETA) * self.rttvar + self.BETA * abs(self.srtt - rtt)
+        self.srtt = (1 - self.ALPHA) * self.srtt + self.ALPHA * rtt
+
+    def retransmit_timeout(self):
+        """
+        Returns:
+            float - seconds to wait for a reply before retransmitting, None if unmeasured.
+        """
+        if self.srtt is None:
+            return None
+        return self.srtt + self.K * self.rttvar
+
+
+class RadiusServer:
+    """A RADIUS server, and what is known about its health"""
+    DEFAULT_PORT = 1812
+
+    def __init__(self, ip, port=None, weight=1):
+        """
+        Args:
+            ip (str): address of the server.
+            port (int): UDP port of the server.
+            weight (int): share of new conversations to send to this server, relative to
+                the other servers.
+        """
+        self.ip = ip
+        self.port = port or self.DEFAULT_PORT
+        self.weight = weight
+        self.alive = True
+        self.outstanding_request_count = 0
+        self.consecutive_failures = 0
+        self.rtt_estimator = RadiusRttEstimator()
+        self.current_weight = 0  # used by RadiusServerPool's weighted round robin
+        self.revive_job = None  # brings the server back into rotation while it is dead
+
+    @property
+    def address(self):
+        """(ip, port) tuple for socket.sendto()"""
+        return self.ip, self.port
+
+    def __str__(self):
+        return "%s:%d" % (self.ip, self.port)
+
+
+class RadiusServerPool:
+    """Chooses which RadiusServer each RADIUS request is sent to.
+
+    Requests that start a conversation (have no State attribute) are balanced across the
+    alive servers by either 'round_robin' (smooth weighted round robin) or
+    'least_outstanding' (fewest outstanding requests per unit of weight). The rest of the
+    conversation sticks to the same server, even once it is dead, as the State attribute it
+    returns is only valid there. A server that leaves MAX_FAILURES requests in a row unanswered is marked dead,
+    and taken out of rotation for DEAD_TIME seconds.
+    """
+    MAX_FAILURES = 3
+    DEAD_TIME = 60  # Number of Seconds
+    ALGORITHMS = ('round_robin', 'least_outstanding')
+
+    def __init__(self, servers, logger, algorithm='round_robin', timer_scheduler=None):
+        """
+        Args:
+            servers (list of RadiusServer): servers to send requests to.
+            algorithm (str): 'round_robin' or 'least_outstanding'.
+            timer_scheduler (TimerScheduler): used to bring dead servers back into rotation.
+        Raises:
+            ValueError: if there are no servers or the algorithm is unknown.
+        """
+        if not servers:
+            raise ValueError("At least one RADIUS server is required")
+        if algorithm not in self.ALGORITHMS:
+            raise ValueError("Unknown RADIUS load balancing algorithm '%s', expected one of: %s"
+                             % (algorithm, ', '.join(self.ALGORITHMS)))
+        self.servers = list(servers)
+        self.logger = logger
+        self.algorithm = algorithm
+        self.timer_scheduler = timer_scheduler
+        self.conversation_servers = {}  # src_mac: RadiusServer
+
+    def select_server(self, src_mac, new_conversation):
+        """Choose the server to send a request for src_mac to.
+        Args:
+            src_mac (MacAddress): supplicant the request is for.
+            new_conversation (bool): True if the request does not continue an earlier
+                conversation with a server (has no State attribute).
+        Returns:
+            RadiusServer
+        """
+        server = self.conversation_servers.get(src_mac)
+        if server and not new_conversation:
+            # Only this server knows the request's State, so stay with it even if it has
+            # been marked dead. If it is gone the request expires, ending the conversation,
+            # and the supplicant's next one goes to a live server.
+            if not server.alive:
+                self.logger.warning("RADIUS server %s is dead, keeping conversation for %s "
+                                    "on it", server, src_mac)
+            return server
+        server = self._choose_server()
+        self.conversation_servers[src_mac] = server
+        return server
+
+    def end_conversation(self, src_mac):
+        """Release the server src_mac's conversation was stuck to"""
+        self.conversation_servers.pop(src_mac, None)
+
+    def _choose_server(self):
+        candidates = [server for server in self.servers if server.alive]
+        if not candidates:
+            # Better to try a dead server than not send the request at all.
+            candidates = self.servers
+        if len(candidates) == 1:
+            return candidates[0]
+
+        if self.algorithm == 'least_outstanding':
+            return min(candidates,
+                       key=lambda server: server.outstanding_request_count / server.weight)
+
+        total_weight = 0
+        for server in candidates:
+            server.current_weight += server.weight
+            total_weight += server.weight
+        server = max(candidates, key=lambda server: server.current_weight)
+        server.current_weight -= total_weight
+        return server
+
+    def server_status(self):
+        """
+        Returns:
+            list of dict - the health of each server. srtt and rttvar (seconds) are None
+            until a reply has been measured.
+        """
+        return [{'server': str(server),
+                 'alive': server.alive,
+                 'srtt': server.rtt_estimator.srtt,
+                 'rttvar': server.rtt_estimator.rttvar,
+                 'outstanding_requests': server.outstanding_request_count,
+                 'consecutive_failures': server.consecutive_failures}
+                for server in self.servers]
+
+    def request_sent(self, server):
+        """Record that a new request has been sent to server"""
+        server.outstanding_request_count += 1
+
+    def request_finished(self, server, answered):
+        """Record that a request to server has been answered, or given up on.
+        Args:
+            server (RadiusServer): server the request was sent to.
+            answered (bool): True if a reply was received.
+        """
+        server.outstanding_request_count = max(server.outstanding_request_count - 1, 0)
+        if answered:
+            server.consecutive_failures = 0
+            if not server.alive:
+                self.mark_alive(server)
+            return
+        server.consecutive_failures += 1
+        if server.alive and server.consecutive_failures >= self.MAX_FAILURES:
+            self.mark_dead(server)
+
+    def mark_dead(self, server):
+        """Take server out of rotation"""
+        self.logger.warning("RADIUS server %s is not responding, marking it dead", server)
+        server.alive = False
+        if self.timer_scheduler:
+            server.revive_job = self.timer_scheduler.call_later(self.DEAD_TIME,
+                                                                self.mark_alive, server)
+
+    def mark_alive(self, server):
+        """Put server back into rotation"""
+        if server.alive:
+            return
+        self.logger.info("RADIUS server %s is back in rotation", server)
+        server.alive = True
+        server.consecutive_failures = 0
+        if server.revive_job:
+            server.revive_job.cancel()
+            server.revive_job = None
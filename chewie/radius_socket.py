@@ -6,10 +6,14 @@ from chewie.utils import get_logger
 
 class RadiusSocket:
     """Handle the RADIUS socket"""
+    MAX_PACKET_SIZE = 4096  # RFC 2865 section 3
+    RECEIVE_BATCH_SIZE = 64
 
     def __init__(self, listen_ip, listen_port, server_ip,  # pylint: disable=too-many-arguments
                  server_port, log_prefix):
         self.socket = None
+        self._receive_buffer = bytearray(self.MAX_PACKET_SIZE)
+        self._receive_view = memoryview(self._receive_buffer)
         self.listen_ip = listen_ip
         self.listen_port = listen_port
         self.server_ip = server_ip
@@ -27,11 +31,35 @@ class RadiusSocket:
             self.logger.error("Unable to setup socket: %s", str(err))
             raise err
 
-    def send(self, data):
+    def send(self, data, server_address=None):
         """Sends on the radius socket
-            data (bytes): what to send"""
-        self.socket.sendto(data, (self.server_ip, self.server_port))
+            data (bytes): what to send
+            server_address (tuple): (ip, port) to send to, defaults to server_ip:server_port"""
+        if server_address is None:
+            server_address = (self.server_ip, self.server_port)
+        self.socket.sendto(data, server_address)
 
     def receive(self):
         """Receives from the radius socket"""
-        return self.socket.recv(4096)
+        return self.socket.recv(self.MAX_PACKET_SIZE)
+
+    def receive_batch(self, max_messages=None):
+        """Waits for a datagram on the radius socket, then drains any others already queued
+        without waiting, so a backlog is handled in one wakeup.
+        Args:
+            max_messages (int): most datagrams to return, defaults to RECEIVE_BATCH_SIZE.
+        Returns:
+            list of bytes - the datagrams in the order received.
+        """
+        max_messages = max_messages or self.RECEIVE_BATCH_SIZE
+        # Each datagram is received into the same buffer and copied out at its real size.
+        nbytes = self.socket.recv_into(self._receive_buffer)
+        messages = [bytes(self._receive_view[:nbytes])]
+        while len(messages) < max_messages:
+            try:
+                # the green socket's underlying socket is non-blocking.
+                nbytes = self.socket.fd.recv_into(self._receive_buffer)
+            except (BlockingIOError, InterruptedError):
+                break
+            messages.append(bytes(self._receive_view[:nbytes]))
+        return messages
@@ -0,0 +1,353 @@
+"""Spread supplicants over several worker processes, so Chewie can use more than one core.
+
+The front end (ShardedChewie) owns the EAP and MAB sockets. It hands each received frame
+to the ShardWorker that owns the frame's source MAC address, and delivers the auth,
+failure and logoff callbacks from every worker in the front end's process. Each
+ShardWorker runs the state machines for its supplicants and its own RADIUS client.
+
+Preemptive identity requests go to the PAE group address, so only the port owning shard
+(shard 0) sends them. The other shards ask it to send them when one of their supplicants
+is due to reauthenticate.
+"""
+import multiprocessing
+import pickle
+import socket
+import zlib
+from collections import deque
+from itertools import islice
+
+from eventlet import GreenPool
+from eventlet.greenio import GreenSocket
+
+from chewie.chewie import Chewie
+from chewie.utils import get_logger
+
+
+def shard_for_mac(mac_address, shard_count):
+    """
+    Args:
+        mac_address (bytes): 6 byte MAC address of a supplicant.
+        shard_count (int): number of shards.
+    Returns:
+        int - index of the shard that owns mac_address.
+    """
+    return zlib.crc32(mac_address) % shard_count
+
+
+class ShardLink:
+    """One end of the connection between the front end and a ShardWorker.
+    Messages are tuples, pickled into one SOCK_SEQPACKET datagram each."""
+    MAX_MESSAGE_SIZE = 1 << 17
+
+    def __init__(self, link_socket):
+        """
+        Args:
+            link_socket (socket.socket): a plain socket, so the link can be pickled into a
+                worker process.
+        """
+        self.link_socket = link_socket
+        self.socket = GreenSocket(link_socket)
+
+    def __reduce__(self):
+        return self.__class__, (self.link_socket,)
+
+    @classmethod
+    def pair(cls):
+        """
+        Returns:
+            (ShardLink, ShardLink) - the front end's and the worker's ends of a connection.
+        """
+        front_end_socket, worker_socket = socket.socketpair(socket.AF_UNIX,
+                                                            socket.SOCK_SEQPACKET)
+        return cls(front_end_socket), cls(worker_socket)
+
+    def send(self, *message):
+        """Send a message to the other end"""
+        self.socket.send(pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
+
+    def send_nowait(self, *message):
+        """Send a message to the other end without waiting.
+        Returns:
+            True if the message was sent, False if the socket is busy.
+        """
+        try:
+            self.socket.fd.send(pickle.dumps(message, pickle.HIGHEST_PROTOCOL))
+        except (BlockingIOError, InterruptedError):
+            return False
+        return True
+
+    def receive(self):
+        """Block until the other end sends a message.
+        Returns:
+            tuple - the message.
+        Raises:
+            EOFError: if the other end has gone away.
+        """
+        data = self.socket.recv(self.MAX_MESSAGE_SIZE)
+        if not data:
+            raise EOFError("Shard link closed")
+        return pickle.loads(data)
+
+    def close(self):
+        """Close this end"""
+        self.socket.close()
+
+
+class ShardEapSocket:
+    """Stands in for a ShardWorker's EapSocket, passing the frames to send to the front end"""
+    MAX_FRAMES_PER_MESSAGE = 64  # keeps a message well inside the socket buffer
+
+    def __init__(self, shard_link, interface_name):
+        self.shard_link = shard_link
+        self.interface_name = interface_name
+        self.send_backlog = deque()  # frames send_nowait() could not send yet
+
+    @property
+    def socket(self):
+        """The link's socket, to wait on until flush_send_backlog() can send"""
+        return self.shard_link.socket
+
+    def send_batch(self, frames):
+        """Have the front end send frames out of interface_name"""
+        for start in range(0, len(frames), self.MAX_FRAMES_PER_MESSAGE):
+            self.shard_link.send('eap', self.interface_name,
+                                 frames[start:start + self.MAX_FRAMES_PER_MESSAGE])
+
+    def send_nowait(self, frame):
+        """Have the front end send a frame without waiting, keeping it in send_backlog if
+        the link is busy. Call flush_send_backlog() once the link is writable again.
+        Returns:
+            True if the frame was sent, False if it was added to send_backlog.
+        """
+        if not self.send_backlog and \
+                self.shard_link.send_nowait('eap', self.interface_name, [frame]):
+            return True
+        self.send_backlog.append(frame)
+        return False
+
+    def flush_send_backlog(self):
+        """Send frames from send_backlog, in order, until the link is busy.
+        Returns:
+            True if send_backlog is now empty.
+        """
+        while self.send_backlog:
+            frames = list(islice(self.send_backlog, self.MAX_FRAMES_PER_MESSAGE))
+            if not self.shard_link.send_nowait('eap', self.interface_name, frames):
+                return False
+            for _ in frames:
+                self.send_backlog.popleft()
+        return True
+
+
+class ShardWorker(Chewie):
+    """Runs the state machines and a RADIUS client for the supplicants of one shard.
+    Frames arrive from the front end, and EAP frames and callbacks go back to it. Each
+    worker binds its own RADIUS client ports, so the RADIUS packet id space is not shared
+    with other workers and replies come back to the worker that sent the request."""
+
+    def __init__(self, shard_index, shard_link, interface_name, logger=None, *args, **kwargs):
+        """
+        Args:
+            shard_index (int): index of this worker's shard.
+            shard_link (ShardLink): worker's end of the connection to the front end.
+        """
+        super().__init__(interface_name, logger, self._forward_auth_success,
+                         self._forward_auth_failure, self._forward_auth_logoff,
+                         *args, **kwargs)
+        self.shard_index = shard_index
+        self.shard_link = shard_link
+
+    def run(self):
+        """setup the RADIUS client and start eventlet threads"""
+        self.logger.info("Starting shard %d", self.shard_index)
+        self._eap_sockets = {interface_name: ShardEapSocket(self.shard_link, interface_name)
+                             for interface_name in self.interface_names}
+        self._setup_radius_socket()
+        if self.radius_status_server_interval:
+            self.radius_lifecycle.start_status_server_probes(self.radius_status_server_interval)
+        self._start_threads_and_wait()
+
+    def _start_frame_receivers(self):
+        self.eventlets.append(self.pool.spawn(self._receive_front_end_messages))
+
+    PORT_OWNER_SHARD = 0
+
+    def port_up(self, port_id, interface_name=None):
+        if self.shard_index == self.PORT_OWNER_SHARD:
+            super().port_up(port_id, interface_name)
+            return
+        self.logger.info("port %s up", port_id)
+        self._get_managed_port(port_id, interface_name).status = True
+
+    def _reauth_port(self, port_id):
+        if self.shard_index == self.PORT_OWNER_SHARD:
+            super()._reauth_port(port_id)
+        else:
+            self.shard_link.send('reauth', port_id)
+
+    def _receive_front_end_messages(self):
+        """Receive frames and port events from the front end forever"""
+        while self.running():
+            try:
+                message = self.shard_link.receive()
+            except EOFError:
+                self.logger.error("Front end has gone away, stopping shard %d",
+                                  self.shard_index)
+                self.shutdown()
+                return
+            kind = message[0]
+            if kind == 'eap':
+                self._process_eap_frame(message[2], message[1])
+            elif kind == 'mab':
+                self._send_eth_to_state_machine(message[2], message[1])
+            elif kind == 'port_up':
+                self.port_up(message[1], message[2])
+            elif kind == 'port_down':
+                self.port_down(message[1])
+            elif kind == 'reauth':
+                self._reauth_port(message[1])
+            else:
+                self.logger.warning("Unknown message from front end: %s", kind)
+
+    def _forward_auth_success(self, src_mac, port_id, *args, **kwargs):
+        self.shard_link.send('auth', src_mac, port_id, args, kwargs)
+
+    def _forward_auth_failure(self, src_mac, port_id):
+        self.shard_link.send('failure', src_mac, port_id)
+
+    def _forward_auth_logoff(self, src_mac, port_id):
+        self.shard_link.send('logoff', src_mac, port_id)
+
+
+def run_shard_worker(shard_index, shard_link, interface_name, log_name, *args, **kwargs):
+    """Entry point of a worker process, takes the same arguments as ShardWorker except the
+    logger's name (log_name) in place of the logger, as loggers cannot always be pickled."""
+    logger = get_logger(log_name) if log_name else None
+    ShardWorker(shard_index, shard_link, interface_name, logger, *args, **kwargs).run()
+
+
+class ShardedChewie(Chewie):
+    """Chewie that spreads supplicants over shard_count ShardWorker processes by a hash of
+    their MAC address. It takes the same arguments as Chewie, and calls auth_handler,
+    failure_handler and logoff_handler from its own process."""
+    DEFAULT_SHARD_COUNT = 2
+
+    # pylint: disable=too-many-arguments
+    def __init__(self, interface_name, logger=None,
+                 auth_handler=None, failure_handler=None, logoff_handler=None,
+                 *args, shard_count=None, **kwargs):
+        """
+        Args:
+            shard_count (int): number of worker processes, defaults to DEFAULT_SHARD_COUNT.
+        """
+        super().__init__(interface_name, logger, auth_handler, failure_handler,
+                         logoff_handler, *args, **kwargs)
+        self.shard_count = shard_count or self.DEFAULT_SHARD_COUNT
+        self._worker_args = (interface_name, logger.name if logger else None) + args
+        self._worker_kwargs = kwargs
+        self._shard_links = [ShardLink.pair() for _ in range(self.shard_count)]
+        self._workers = []
+
+    def run(self):
+        """start the workers, setup the EAP and MAB sockets and start eventlet threads"""
+        self.logger.info("Starting %d shards", self.shard_count)
+        self._start_workers()
+        self._setup_frame_sockets()
+        self._start_threads_and_wait()
+
+    def shutdown(self):
+        """kill eventlets and workers and quit"""
+        super().shutdown()
+        for worker in self._workers:
+            worker.terminate()
+
+    def _start_workers(self):
+        # spawn rather than fork, so a worker does not inherit the front end's eventlet hub
+        # and the greenlets scheduled on it.
+        context = multiprocessing.get_context('spawn')
+        for shard_index, (_, worker_link) in enumerate(self._shard_links):
+            worker = context.Process(target=run_shard_worker,
+                                     args=(shard_index, worker_link) + self._worker_args,
+                                     kwargs=self._worker_kwargs,
+                                     name="chewie-shard-%d" % shard_index,
+                                     daemon=True)
+            worker.start()
+            self._workers.append(worker)
+        for _, worker_link in self._shard_links:
+            worker_link.close()
+
+    def _start_threads_and_wait(self):
+        """Start the thread and wait until they complete (hopefully never)"""
+        self.pool = GreenPool()
+        self._start_frame_receivers()
+        for shard_index in range(self.shard_count):
+            self.eventlets.append(self.pool.spawn(self._receive_shard_messages, shard_index))
+        self.pool.waitall()
+
+    def port_up(self, port_id, interface_name=None):
+        """
+        should be called by faucet when port has come up
+        Args:
+            port_id (str): id of port.
+            interface_name (str): interface the port is reached through, if known.
+        """
+        self.logger.info("port %s up", port_id)
+        self._send_to_all_shards('port_up', port_id, interface_name)
+
+    def port_down(self, port_id):
+        """
+        should be called by faucet when port has gone down.
+        Args:
+            port_id (str): id of port.
+        """
+        self.logger.info("port %s down", port_id)
+        self._send_to_all_shards('port_down', port_id)
+
+    def _send_to_all_shards(self, *message):
+        for shard_index in range(self.shard_count):
+            self._send_to_shard(shard_index, *message)
+
+    def _send_to_shard(self, shard_index, *message):
+        try:
+            self._shard_links[shard_index][0].send(*message)
+        except OSError as exception:
+            self.logger.warning("Dropping %s message for shard %d: %s",
+                                message[0], shard_index, exception)
+
+    def _process_eap_frame(self, packed_message, interface_name=None):
+        self._send_frame_to_shard('eap', packed_message, interface_name)
+
+    def _send_eth_to_state_machine(self, packed_message, interface_name=None):
+        self._send_frame_to_shard('mab', packed_message, interface_name)
+
+    def _send_frame_to_shard(self, kind, packed_message, interface_name):
+        """Send a received frame to the worker owning its source MAC address"""
+        shard_index = shard_for_mac(bytes(packed_message[6:12]), self.shard_count)
+        self._send_to_shard(shard_index, kind, interface_name or self.interface_name,
+                            bytes(packed_message))
+
+    def _receive_shard_messages(self, shard_index):
+        """Send EAP frames and deliver callbacks from a worker forever"""
+        front_end_link = self._shard_links[shard_index][0]
+        while self.running():
+            try:
+                message = front_end_link.receive()
+            except EOFError:
+                self.logger.error("Shard %d has gone away", shard_index)
+                return
+            kind = message[0]
+            if kind == 'eap':
+                self._eap_sockets[message[1]].send_batch(message[2])
+            elif kind == 'auth':
+                if self.auth_handler:
+                    self.auth_handler(message[1], message[2], *message[3], **message[4])
+            elif kind == 'failure':
+                if self.failure_handler:
+                    self.failure_handler(message[1], message[2])
+            elif kind == 'logoff':
+                if self.logoff_handler:
+                    self.logoff_handler(message[1], message[2])
+            elif kind == 'reauth':
+                self._send_to_shard(ShardWorker.PORT_OWNER_SHARD, *message)
+            else:
+                self.logger.warning("Unknown message from shard %d: %s", shard_index, kind)
@@ -13,6 +13,7 @@ from chewie.message_parser import SuccessMessage, FailureMessage, EapolStartMess
 import chewie.radius_attributes as radius_attributes
 from chewie.utils import get_logger, log_method, RadiusQueueMessage, EapQueueMessage
 from chewie.radius import RadiusPacket
+from chewie.radius_lifecycle import RadiusLifecycle
 from chewie.state_machines.abstract_state_machine import AbstractStateMachine
 
 
@@ -109,7 +110,10 @@ class FullEAPStateMachine(AbstractStateMachine):
     DEFAULT_TIMEOUT = 5  # Number of Seconds
     DEFAULT_SESSION_TIMEOUT = 3600  # Number of Seconds
 
-    RADIUS_RETRANSMIT_TIMEOUT = 5
+    # RadiusLifecycle retransmits lost RADIUS requests, so only give up on the server
+    # once it has given up on the request (RadiusLifecycle.REQUEST_TTL).
+    RADIUS_RETRANSMIT_TIMEOUT = \
+        RadiusLifecycle.REQUEST_TTL + RadiusLifecycle.IRT  # Number of Seconds
 
     state = None
     eap_output_messages = None
@@ -119,6 +123,7 @@ class FullEAPStateMachine(AbstractStateMachine):
     radius_state_attribute = None  # the last state from radius server
     sent_count = 0
     session_timeout_job = None
+    retransmit_timer_job = None
 
     session_timeout = DEFAULT_SESSION_TIMEOUT
     radius_tunnel_private_group_id = None
@@ -827,6 +832,10 @@ class FullEAPStateMachine(AbstractStateMachine):
         if self.eap_logoff:
             self.handle_logoff()
 
+        if self.retransmit_timer_job and not self.is_in_progress():
+            self.retransmit_timer_job.cancel()
+            self.retransmit_timer_job = None
+
     def handle_logoff(self):
         """Notify the logoff callback"""
         self.logger.info('client is logging off %s', self.src_mac)
@@ -964,16 +973,18 @@ class FullEAPStateMachine(AbstractStateMachine):
 
     def set_timer(self, timeout):
         """Sets a timer to trigger a retransmit if no packet received.
+        Any previous retransmit timer is cancelled, as it has been superseded by this packet.
         """
+        if self.retransmit_timer_job:
+            self.retransmit_timer_job.cancel()
+            self.retransmit_timer_job = None
+
         # These messages should not expect a reply, so set the timer.
         if self.state not in [self.SUCCESS, self.SUCCESS2,
                               self.FAILURE, self.FAILURE2,
                               self.TIMEOUT_FAILURE, self.TIMEOUT_FAILURE2]:
-            self.timer_scheduler.call_later(timeout,
-                                            self.event,
-                                            EventTimerExpired(self, self.sent_count))
-            # TODO could cancel the scheduled events when
-            # they're no longer needed (i.e. response received)
+            self.retransmit_timer_job = self.timer_scheduler.call_later(
+                timeout, self.event, EventTimerExpired(self, self.sent_count))
 
     def is_in_progress(self):
         return self.state not in [FullEAPStateMachine.LOGOFF, FullEAPStateMachine.LOGOFF2,
@@ -1,7 +1,11 @@
 """Homebrew Event scheduler, as sched.scheduler was not working outside of unittests"""
+import asyncio
 import heapq
+import itertools
+import math
 
 import eventlet
+from eventlet.event import Event
 import time
 
 
@@ -13,14 +17,19 @@ class TimerJob:
     func = None
     args = None
 
-    def __init__(self, expiry_time, func, args):
+    def __init__(self, expiry_time, func, args, timer_queue=None):
         self.expiry_time = expiry_time
         self.func = func
         self.args = args
+        self._timer_queue = timer_queue  # set while the job is waiting in a timer queue
 
     def cancel(self):
         """Cancel the callback."""
+        if self.is_cancelled:
+            return
         self.is_cancelled = True
+        if self._timer_queue:
+            self._timer_queue.job_cancelled(self)
 
     def cancelled(self):
         """
@@ -37,12 +46,234 @@ class TimerJob:
         return self.expiry_time
 
 
+class HeapTimerQueue:
+    """Stores TimerJobs in a heap.
+
+    Cancelled jobs stay in the heap until they expire, unless they make up more than
+    COMPACT_RATIO of it, in which case they are removed and the heap rebuilt.
+    """
+    COMPACT_RATIO = 0.5
+    COMPACT_MIN_JOBS = 64  # Don't bother compacting heaps smaller than this
+
+    def __init__(self):
+        self.timer_heap = []
+        self._job_sequence = itertools.count()  # tie breaker for jobs with equal expiry_time
+        self.cancelled_job_count = 0  # cancelled jobs still in timer_heap
+
+    def __len__(self):
+        return len(self.timer_heap)
+
+    @property
+    def live_job_count(self):
+        """Number of jobs waiting to run that have not been cancelled"""
+        return len(self.timer_heap) - self.cancelled_job_count
+
+    def push(self, job):
+        """Add a TimerJob to the queue"""
+        job._timer_queue = self  # pylint: disable=protected-access
+        heapq.heappush(self.timer_heap, (job.expiry_time, next(self._job_sequence), job))
+
+    def next_expiry(self):
+        """
+        Returns:
+            time (float seconds) that the next job is due, or None if the queue is empty
+        """
+        if self.timer_heap:
+            return self.timer_heap[0][0]
+        return None
+
+    def pop_expired(self, now):
+        """Remove and return the jobs due at or before now, cancelled jobs are dropped.
+        Args:
+            now (float): current time.
+        Returns:
+            list of TimerJob in expiry order.
+        """
+        expired = []
+        while self.timer_heap and self.timer_heap[0][0] <= now:
+            _, _, job = heapq.heappop(self.timer_heap)
+            job._timer_queue = None  # pylint: disable=protected-access
+            if job.cancelled():
+                self.cancelled_job_count -= 1
+                continue
+            expired.append(job)
+        return expired
+
+    def job_cancelled(self, job):  # pylint: disable=unused-argument
+        """Called by TimerJob.cancel() for jobs still in the queue"""
+        self.cancelled_job_count += 1
+        if len(self.timer_heap) >= self.COMPACT_MIN_JOBS and \
+                self.cancelled_job_count > len(self.timer_heap) * self.COMPACT_RATIO:
+            self.compact()
+
+    def compact(self):
+        """Remove all cancelled jobs from timer_heap"""
+        self.timer_heap = [entry for entry in self.timer_heap if not entry[2].cancelled()]
+        heapq.heapify(self.timer_heap)
+        self.cancelled_job_count = 0
+
+
+class TimingWheelTimerQueue:
+    """Stores TimerJobs in a hierarchical timing wheel, with O(1) push and cancel.
+
+    Time is split into ticks of TICK seconds. Each of the LEVELS wheels has WHEEL_SIZE slots,
+    a slot on level n covering WHEEL_SIZE ** n ticks. Jobs are placed on the lowest level that
+    can hold them, and are moved down a level (cascaded) when the wheel below wraps around.
+    Jobs run up to one tick late, but never early.
+    """
+    TICK = 0.1  # Number of Seconds
+    WHEEL_BITS = 8
+    WHEEL_SIZE = 1 << WHEEL_BITS
+    WHEEL_MASK = WHEEL_SIZE - 1
+    LEVELS = 4
+
+    def __init__(self, tick=None, start_time=None):
+        self.tick = tick or self.TICK
+        if start_time is None:
+            start_time = time.time()
+        self.current_tick = self._to_tick(start_time)  # the next tick to be processed
+        # slots are dicts used as insertion ordered sets
+        self.wheels = [[{} for _ in range(self.WHEEL_SIZE)] for _ in range(self.LEVELS)]
+        self.level_job_counts = [0] * self.LEVELS
+        self.cancelled_job_count = 0  # cancelled jobs are removed immediately
+
+    def __len__(self):
+        return sum(self.level_job_counts)
+
+    @property
+    def live_job_count(self):
+        """Number of jobs waiting to run that have not been cancelled"""
+        return len(self)
+
+    def _to_tick(self, timestamp):
+        # the small offset stops floating point error putting a tick boundary in the last tick.
+        return math.floor(timestamp / self.tick + 1e-9)
+
+    def push(self, job):
+        """Add a TimerJob to the queue"""
+        job._timer_queue = self  # pylint: disable=protected-access
+        job._expiry_tick = math.ceil(job.expiry_time / self.tick - 1e-9)  # pylint: disable=protected-access
+        self._place(job)
+
+    def _place(self, job):
+        delta = max(job._expiry_tick - self.current_tick, 0)  # pylint: disable=protected-access
+        for level in range(self.LEVELS):
+            if delta < 1 << (self.WHEEL_BITS * (level + 1)):
+                break
+        else:
+            # Further out than the wheels can hold, park it in the furthest slot,
+            # it gets placed again from its real expiry when that slot is cascaded.
+            delta = (1 << (self.WHEEL_BITS * self.LEVELS)) - 1
+        index = ((self.current_tick + delta) >> (self.WHEEL_BITS * level)) & self.WHEEL_MASK
+        slot = self.wheels[level][index]
+        slot[job] = None
+        self.level_job_counts[level] += 1
+        job._wheel_slot = (level, slot)  # pylint: disable=protected-access
+
+    def _take_slot(self, level, index):
+        slot = self.wheels[level][index]
+        jobs = list(slot)
+        slot.clear()
+        self.level_job_counts[level] -= len(jobs)
+        return jobs
+
+    def _cascade(self, tick):
+        """Move the jobs in the slots that start at tick down to lower levels"""
+        for level in range(1, self.LEVELS):
+            index = (tick >> (self.WHEEL_BITS * level)) & self.WHEEL_MASK
+            for job in self._take_slot(level, index):
+                self._place(job)
+            if index:
+                break
+
+    def next_expiry(self):
+        """
+        Returns:
+            time (float seconds) that the queue next needs servicing, either for a job that is
+            due or to cascade jobs to a lower level. None if the queue is empty.
+        """
+        next_tick = None
+        for level in range(self.LEVELS):
+            if not self.level_job_counts[level]:
+                continue
+            shift = self.WHEEL_BITS * level
+            start = self.current_tick >> shift
+            # Level 0 starts from the current tick. Higher levels start from the next slot,
+            # unless current_tick is on the current slot's boundary, as that slot has not been
+            # cascaded yet.
+            first = 0 if self.current_tick & ((1 << shift) - 1) == 0 else 1
+            for offset in range(first, self.WHEEL_SIZE + first):
+                if self.wheels[level][(start + offset) & self.WHEEL_MASK]:
+                    tick = (start + offset) << shift
+                    if next_tick is None or tick < next_tick:
+                        next_tick = tick
+                    break
+        if next_tick is None:
+            return None
+        return next_tick * self.tick
+
+    def pop_expired(self, now):
+        """Remove and return the jobs due at or before now.
+        Args:
+            now (float): current time.
+        Returns:
+            list of TimerJob in expiry order.
+        """
+        expired = []
+        target_tick = self._to_tick(now)
+        while self.current_tick <= target_tick:
+            tick = self.current_tick
+            index = tick & self.WHEEL_MASK
+            if index == 0:
+                self._cascade(tick)
+            if not any(self.level_job_counts):
+                self.current_tick = target_tick + 1
+                break
+            if not self.level_job_counts[0]:
+                # nothing to run until the next cascade.
+                self.current_tick = min(target_tick + 1, (tick | self.WHEEL_MASK) + 1)
+                continue
+            for job in sorted(self._take_slot(0, index), key=TimerJob.when):
+                job._timer_queue = None  # pylint: disable=protected-access
+                expired.append(job)
+            self.current_tick = tick + 1
+        return expired
+
+    def job_cancelled(self, job):
+        """Called by TimerJob.cancel() for jobs still in the queue"""
+        level, slot = job._wheel_slot  # pylint: disable=protected-access
+        slot.pop(job, None)
+        self.level_job_counts[level] -= 1
+        job._timer_queue = None  # pylint: disable=protected-access
+
+
+TIMER_QUEUES = {
+    'heap': HeapTimerQueue,
+    'wheel': TimingWheelTimerQueue,
+}
+
+
 class TimerScheduler:
-    """wraps a heapbased queue with a similar api to asyncio.loop"""
+    """wraps a timer queue with a similar api to asyncio.loop
 
-    def __init__(self, logger, sleep=None):
+    By default run() sleeps until the next job is due, and call_later() wakes it early if
+    the new job expires before the one it is waiting on. With wakeup=False run() polls the
+    queue every POLL_INTERVAL seconds instead.
+
+    backend selects how jobs are stored, 'heap' (HeapTimerQueue) or 'wheel'
+    (TimingWheelTimerQueue) which keeps scheduling cost flat with many timers.
+    """
+    POLL_INTERVAL = 1  # Number of Seconds
+
+    def __init__(self, logger, sleep=None, wakeup=True, backend='heap'):
         self.logger = logger
-        self.timer_heap = []
+        if backend not in TIMER_QUEUES:
+            raise ValueError("Unknown timer backend '%s', expected one of: %s" %
+                             (backend, ', '.join(sorted(TIMER_QUEUES))))
+        self.timer_queue = TIMER_QUEUES[backend]()
+        self.wakeup = wakeup
+        self._wakeup_event = None
+        self._wakeup_time = None  # when run() is next due to wake, None for never
 
         self.sleep = eventlet.sleep
         if sleep:
@@ -57,7 +288,7 @@ class TimerScheduler:
             *args: arguments for func
 
         Returns:
-            tuple (expiry_time, dict) - can be used for cancelling the job
+            TimerJob - can be used for cancelling the job
         """
         if not args:
             args = []
@@ -65,25 +296,109 @@ class TimerScheduler:
         expiry_time = time.time() + timeout
 
         job = TimerJob(expiry_time, func, args)
-        heapq.heappush(self.timer_heap, (expiry_time, job))
+        self.timer_queue.push(job)
+
+        if self._wakeup_time is None or expiry_time < self._wakeup_time:
+            self._wake()
         return job
 
+    @property
+    def live_job_count(self):
+        """Number of jobs waiting to run that have not been cancelled"""
+        return self.timer_queue.live_job_count
+
+    @property
+    def cancelled_job_count(self):
+        """Number of cancelled jobs still held by the timer queue"""
+        return self.timer_queue.cancelled_job_count
+
+    def _wake(self):
+        """Wake run() so it can recalculate how long to sleep for"""
+        if self._wakeup_event and not self._wakeup_event.ready():
+            self._wakeup_event.send()
+
+    def _wait(self, timeout):
+        """Block until timeout seconds have passed, or until woken by call_later().
+        Args:
+            timeout (float): seconds to wait for, None to wait until woken.
+        """
+        if not self.wakeup:
+            self.sleep(self.POLL_INTERVAL)
+            return
+
+        self._wakeup_event = Event()
+        if timeout is None:
+            self._wakeup_event.wait()
+        else:
+            self._wakeup_time = time.time() + timeout
+            with eventlet.Timeout(timeout, False):
+                self._wakeup_event.wait()
+        self._wakeup_event = None
+        self._wakeup_time = None
+
+    def run_pending(self):
+        """Run every job that has expired.
+
+        Returns:
+            float - seconds until the next job is due, or None if there are no jobs.
+        """
+        for job in self.timer_queue.pop_expired(time.time()):
+            if job.cancelled():
+                # cancelled by an earlier job in this batch
+                self.logger.debug('job %s has been cancelled', job.func.__name__)
+                continue
+            self.logger.info('running job %s %s', job.func.__name__, job.args)
+            try:
+                job.func(*job.args)
+            except Exception as e:
+                self.logger.exception(e)
+
+        next_expiry = self.timer_queue.next_expiry()
+        if next_expiry is None:
+            return None
+        return max(next_expiry - time.time(), 0)
+
     def run(self):
         """Main loop. should run forever"""
         while True:
             try:
-                if self.timer_heap:
-                    if self.timer_heap[0][0] < time.time():
-                        _, job = heapq.heappop(self.timer_heap)
-                        if not job.cancelled():
-                            self.logger.info('running job %s %s', job.func.__name__, job.args)
-                            job.func(*job.args)
-                        else:
-                            self.logger.debug('job %s has been cancelled', job.func.__name__)
-                    else:
-                        self.sleep(1)
-                else:
-                    self.sleep(1)
+                self._wait(self.run_pending())
             except Exception as e:
                 self.logger.exception(e)
         self.logger.warning('timer_scheduler finished quuee')
+
+
+class AsyncioTimerScheduler:
+    """TimerScheduler api on an asyncio event loop, jobs are the loop's asyncio.TimerHandles.
+    There is no run(), the loop runs the jobs."""
+
+    def __init__(self, logger, loop=None):
+        """
+        Args:
+            loop (asyncio.AbstractEventLoop): loop to schedule jobs on, defaults to the
+                running loop.
+        """
+        self.logger = logger
+        self.loop = loop
+
+    def call_later(self, timeout, func, *args):
+        """Scheduler callback.
+
+        Args:
+            timeout: number of seconds to delay executing func
+            func: function to execute
+            *args: arguments for func
+
+        Returns:
+            asyncio.TimerHandle - can be used for cancelling the job
+        """
+        self.logger.debug("submitted job %s expire in %d, args: %s", func.__name__, timeout, args)
+        loop = self.loop or asyncio.get_event_loop()
+        return loop.call_later(timeout, self._run_job, func, args)
+
+    def _run_job(self, func, args):
+        self.logger.info('running job %s %s', func.__name__, args)
+        try:
+            func(*args)
+        except Exception as e:
+            self.logger.exception(e)
@@ -38,3 +38,14 @@ class EapQueueMessage(namedtuple('EapQueueMessage',
 class RadiusQueueMessage(namedtuple('RadiusQueueMessage',
                                     'message src_mac identity state port_mac')):
     pass
+
+
+class DirectQueue:
+    """Stands in for an output Queue, handing each message to handler as it is put"""
+
+    def __init__(self, handler):
+        self.handler = handler
+
+    def put_nowait(self, item):
+        """Handle item now"""
+        self.handler(item)
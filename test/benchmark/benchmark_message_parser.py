@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+
+"""Compare MessageParser.ethernet_parse() with the layer by layer parser.
+
+Run from the top of the repository:
+    PYTHONPATH=. python3 test/benchmark/benchmark_message_parser.py
+"""
+
+import timeit
+
+from chewie.message_parser import MessageParser
+
+FRAMES = {
+    'identity response': bytes.fromhex(
+        "0180c2000003001422e9545e888e0100001102000011014a6f686e2e4d63477569726b"),
+    'md5 challenge response': bytes.fromhex(
+        "0180c2000003001906eab88c888e01000016020100160410824788d693e2adac6ce15641418228cf"),
+    'ttls response': bytes.fromhex(
+        "0180c2000003000000111111888e010000a0020600a0158000000096160301009101000"
+        "08d03015ba1a6fbf1d5b8c5b5a9b7bbc6b04a27a1b7ee15ba0d84c2e5c3e6ac14db8c00"
+        "003ac02cc02bc030c02f009f009ec024c023c028c027c00ac009c014c013009d009c003"
+        "d003c0035002f000a006a0040003800320013000500040100002a000a00080006001d00"
+        "170018000b00020100000d001400120401050102010403050302030202060106030023"
+        "0000"),
+}
+ROUNDS = 5
+NUMBER = 20000
+
+
+def best_time(parser, packed_message):
+    """Returns the best time in microseconds of one parse"""
+    timer = timeit.Timer(lambda: parser(packed_message))
+    return min(timer.repeat(ROUNDS, NUMBER)) / NUMBER * 1e6
+
+
+def main():
+    """Print the time taken by each parser, and the speedup, for each frame"""
+    print("%-24s %10s %10s %8s" % ("frame", "layered us", "fast us", "speedup"))
+    for name, packed_message in FRAMES.items():
+        layered = best_time(MessageParser.layered_ethernet_parse, packed_message)
+        fast = best_time(MessageParser.ethernet_parse, packed_message)
+        print("%-24s %10.2f %10.2f %7.2fx" % (name, layered, fast, layered / fast))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,126 @@
+"""Unittests for chewie/asyncio_chewie.py"""
+# pylint: disable=missing-docstring,protected-access
+
+import asyncio
+import logging
+import socket
+import unittest
+from unittest.mock import patch, Mock
+
+from chewie.asyncio_chewie import AsyncioChewie
+from chewie.mac_address import MacAddress
+from chewie.message_parser import IdentityMessage
+from chewie.radius import Radius
+from chewie.radius_servers import RadiusServer
+from chewie.timer_scheduler import AsyncioTimerScheduler
+from chewie.utils import EapQueueMessage, RadiusQueueMessage
+
+
+def run(coroutine):
+    """asyncio.run() for Python 3.5 and 3.6"""
+    loop = asyncio.new_event_loop()
+    try:
+        return loop.run_until_complete(coroutine)
+    finally:
+        loop.close()
+
+
+class RadiusServerProtocol(asyncio.DatagramProtocol):
+
+    def __init__(self):
+        self.transport = None
+        self.requests = asyncio.Queue()
+
+    def connection_made(self, transport):
+        self.transport = transport
+
+    def datagram_received(self, data, addr):
+        self.requests.put_nowait((data, addr))
+
+
+class AsyncioChewieTestCase(unittest.TestCase):
+
+    SRC_MAC = MacAddress.from_string("02:42:ac:17:00:6f")
+    PORT_ID = MacAddress.from_string("00:00:00:00:00:01")
+
+    def setUp(self):
+        self.chewie = AsyncioChewie('lo', logging.getLogger(), None, None, None,
+                                    '127.0.0.1', 1812, 'SECRET')
+
+    def identity_output(self):
+        message = IdentityMessage(self.SRC_MAC, 1, 2, "host1user")
+        return RadiusQueueMessage(message, self.SRC_MAC, "host1user", None, self.PORT_ID)
+
+    def test_timer_scheduler(self):
+        ran = []
+
+        async def schedule():
+            timer_scheduler = AsyncioTimerScheduler(logging.getLogger())
+            timer_scheduler.call_later(0.01, ran.append, 'first')
+            timer_scheduler.call_later(0.01, ran.append, 'cancelled').cancel()
+            timer_scheduler.call_later(0.02, ran.append, 'second')
+            await asyncio.sleep(0.05)
+
+        run(schedule())
+        self.assertEqual(ran, ['first', 'second'])
+
+    @patch("chewie.asyncio_chewie.AsyncioChewie._process_radius_message")
+    def test_radius_round_trip(self, process_radius_message):
+        async def round_trip():
+            loop = asyncio.get_event_loop()
+            self.chewie.loop = loop
+            transport, server = await loop.create_datagram_endpoint(
+                RadiusServerProtocol, local_addr=('127.0.0.1', 0))
+            self.chewie.radius_server_pool.servers = [
+                RadiusServer(*transport.get_extra_info('sockname'))]
+            self.chewie._setup_radius_socket()
+            self.chewie.radius_output_messages.put_nowait(self.identity_output())
+            request, client_address = await asyncio.wait_for(server.requests.get(), 1)
+            transport.sendto(b'reply', client_address)
+            await asyncio.sleep(0.05)
+            transport.close()
+            self.chewie.shutdown()
+            return request
+
+        request = run(round_trip())
+        self.assertEqual(request[0], Radius.ACCESS_REQUEST)
+        process_radius_message.assert_called_once_with(b'reply', 0)
+
+    def test_radius_output_waits_for_packet_id(self):
+        self.chewie.radius_lifecycle = Mock(**{'packet_id_available.return_value': False})
+        self.chewie.radius_output_messages.put_nowait('first')
+        self.chewie.radius_output_messages.put_nowait('second')
+        self.chewie.radius_lifecycle.process_outbound.assert_not_called()
+
+        self.chewie.radius_lifecycle.packet_id_available.return_value = True
+        self.chewie.radius_lifecycle.process_outbound.return_value = (0, Mock(), b'packed')
+        with patch.object(self.chewie, '_send_radius_packet') as send_radius_packet:
+            self.chewie._radius_packet_id_released()
+        self.assertEqual([call[0][0] for call in
+                          self.chewie.radius_lifecycle.process_outbound.call_args_list],
+                         ['first', 'second'])
+        self.assertEqual(send_radius_packet.call_count, 2)
+
+    @patch("chewie.asyncio_chewie.AsyncioChewie._send_eth_to_state_machine", Mock())
+    @patch("chewie.asyncio_chewie.AsyncioChewie._process_eap_frame")
+    def test_eap_frames_sent_and_received(self, process_eap_frame):
+        async def send_and_receive():
+            try:
+                await self.chewie.start()
+            except OSError as err:
+                self.skipTest("Unable to open a packet socket on lo: %s" % err)
+            self.chewie.eap_output_messages.put_nowait(
+                EapQueueMessage(IdentityMessage(self.SRC_MAC, 1, 1, ""),
+                                self.SRC_MAC, self.PORT_ID))
+            # lo hands the frame straight back to the EAP socket.
+            await asyncio.sleep(0.05)
+            self.chewie.shutdown()
+
+        run(send_and_receive())
+        packed_message, interface_name = process_eap_frame.call_args[0]
+        self.assertEqual(interface_name, 'lo')
+        self.assertEqual(packed_message[:12], self.SRC_MAC.address + self.PORT_ID.address)
+        for eap_socket in self.chewie._eap_sockets.values():
+            eap_socket.socket.close()
+        for mab_socket in self.chewie._mab_sockets.values():
+            mab_socket.socket.close()
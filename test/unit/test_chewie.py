@@ -9,7 +9,10 @@ from unittest.mock import patch
 import eventlet
 import sys
 from chewie.chewie import Chewie
+from chewie.eap import Eap
+from chewie.event import EventPreemptiveEAPResponseMessageReceived
 from chewie.mac_address import MacAddress
+from chewie.message_parser import IdentityMessage
 from chewie.state_machines.eap_state_machine import FullEAPStateMachine
 from chewie.state_machines.mab_state_machine import MacAuthenticationBypassStateMachine
 from eventlet.queue import Queue
@@ -110,7 +113,8 @@ RADIUS_REPLY_GENERATOR = None  # radius_replies()
 
 
 class FakeEapSocket:
-    def __init__(self, _interface_name, _log_prefix):
+    def __init__(self, _interface_name, _log_prefix, rx_ring=False,
+                 fanout_group=None, fanout_mode=None):
         # TODO inject queues in constructor instead of using globals
         pass
 
@@ -124,6 +128,14 @@ class FakeEapSocket:
         got = FROM_SUPPLICANT.get()
         return got
 
+    def send_batch(self, frames):
+        for frame in frames:
+            self.send(frame)
+
+    def send_nowait(self, frame):
+        self.send(frame)
+        return True
+
     def send(self, data=None):  # pylint: disable=unused-argument
         global TO_SUPPLICANT
         global FROM_SUPPLICANT
@@ -141,7 +153,8 @@ class FakeEapSocket:
 
 
 class FakeMabSocket:
-    def __init__(self, _interface_name, _log_prefix):
+    def __init__(self, _interface_name, _log_prefix, rx_ring=False,
+                 fanout_group=None, fanout_mode=None):
         # TODO inject queues in constructor instead of using globals
         pass
 
@@ -175,7 +188,10 @@ class FakeRadiusSocket:
         print('got RADIUS', got)
         return got
 
-    def send(self, data):  # pylint: disable=unused-argument
+    def receive_batch(self):
+        return [self.receive()]
+
+    def send(self, data, server_address=None):  # pylint: disable=unused-argument
         global TO_RADIUS
         global FROM_RADIUS
         global RADIUS_REPLY_GENERATOR
@@ -328,6 +344,20 @@ class ChewieTestCase(unittest.TestCase):
         with self.assertRaises(KeyError):
             self.chewie._get_state_machine_from_radius_packet_id(20)
 
+    def test_response_reusing_preemptive_id(self):
+        """A supplicant's response with the id of the port's last preemptive identity
+        request does not restart its conversation"""
+        port_id = MacAddress.from_string('00:00:00:00:00:01')
+        src_mac = MacAddress.from_string('12:34:56:78:9a:bc')
+        self.chewie.port_up(str(port_id))
+        eapol_id = self.chewie._get_managed_port(port_id)._send_identity_request()
+        state_machine = self.chewie.get_state_machine(src_mac, port_id)
+        with patch.object(state_machine, 'event') as event:
+            self.chewie._send_eap_to_state_machine(
+                IdentityMessage(src_mac, eapol_id, Eap.RESPONSE, "user"), port_id)
+        self.assertNotIsInstance(event.call_args[0][0],
+                                 EventPreemptiveEAPResponseMessageReceived)
+
     @patch_things
     @setup_generators(sup_replies_success, radius_replies_success)
     def test_success_dot1x(self):
@@ -344,6 +374,27 @@ class ChewieTestCase(unittest.TestCase):
                                           '00:00:00:00:00:01').state,
             FullEAPStateMachine.SUCCESS2)
 
+    @patch_things
+    @setup_generators(sup_replies_success, radius_replies_success)
+    def test_success_dot1x_direct_dispatch(self):
+        """Test success api, sending output from the event handlers"""
+        self.chewie = Chewie('lo', logging.getLogger(),
+                             auth_handler, failure_handler, logoff_handler,
+                             '127.0.0.1', 1812, 'SECRET',
+                             '44:44:44:44:44:44', dispatch='direct')
+        self.chewie.timer_scheduler = self.fake_scheduler
+        FROM_SUPPLICANT.put_nowait(bytes.fromhex("0000000000010242ac17006f888e01010000"))
+
+        pool = eventlet.GreenPool()
+        pool.spawn(self.chewie.run)
+
+        eventlet.sleep(1)
+
+        self.assertEqual(
+            self.chewie.get_state_machine('02:42:ac:17:00:6f',
+                                          '00:00:00:00:00:01').state,
+            FullEAPStateMachine.SUCCESS2)
+
     @patch_things
     @setup_generators(sup_replies_success, radius_replies_success)
     def test_chewie_identity_response_dot1x(self):
@@ -26,6 +26,8 @@ FakeLogger = namedtuple('FakeLogger', ('name',)
                         )  # pylint: disable=invalid-name
 FakeEapMessage = namedtuple(
     'FakeEapMessage', ('src_mac',))  # pylint: disable=invalid-name
+FakeRadiusServer = namedtuple(
+    'FakeRadiusServer', ('address',))  # pylint: disable=invalid-name
 
 
 class ChewieWithMocksTestCase(unittest.TestCase):
@@ -44,8 +46,8 @@ class ChewieWithMocksTestCase(unittest.TestCase):
     def test_eap_packet_in_goes_to_new_state_machine(self, state_machine,
                                                      ethernet_parse):  # pylint: disable=invalid-name
         """test EAP packet creates a new state machine and is sent on"""
-        self.chewie._eap_socket = Mock(
-            **{'receive.return_value': 'message from socket'})
+        self.chewie._eap_sockets = {'lo': Mock(
+            **{'receive.return_value': 'message from socket'})}
         ethernet_parse.side_effect = return_if(
             ('message from socket',),
             (FakeEapMessage('fake src mac'), 'fake dst mac')
@@ -56,18 +58,35 @@ class ChewieWithMocksTestCase(unittest.TestCase):
                 'fake src mac'), 'fake dst mac')
         )
 
+    @patch("chewie.chewie.Chewie.running", Mock(side_effect=[True, False]))
+    @patch("chewie.chewie.Chewie._send_eth_to_state_machine")
+    @patch("chewie.chewie.Chewie._process_eap_frame")
+    @patch("chewie.chewie.sleep", Mock())
+    def test_captured_frames_dispatched_by_ethertype(self, process_eap_frame,
+                                                     send_eth_to_state_machine):  # pylint: disable=invalid-name
+        """test frames from the shared socket go to the EAP or MAB pipeline"""
+        eapol = bytes.fromhex("0180c200000302420a000001888e01010000")
+        dhcp = bytes.fromhex("ffffffffffff02420a0000010800") + bytes(40)
+        self.chewie._eap_sockets = {'lo': Mock(**{'receive_batch.return_value': [eapol, dhcp]})}
+        self.chewie._receive_captured_frames()
+        process_eap_frame.assert_called_once_with(eapol, 'lo')
+        send_eth_to_state_machine.assert_called_once_with(dhcp, 'lo')
+
     @patch("chewie.chewie.Chewie.running", Mock(side_effect=[True, False]))
     @patch("chewie.chewie.MessagePacker.ethernet_pack")
     @patch("chewie.chewie.sleep", Mock())
     def test_eap_output_packet_gets_packed_and_sent(self,
                                                     ethernet_pack):  # pylint: disable=invalid-name
         """test EAP packet creates a new state machine and is sent on"""
-        self.chewie._eap_socket = Mock()
+        self.chewie._eap_sockets = {'lo': Mock()}
         ethernet_pack.return_value = "packed ethernet"
+        self.chewie.eap_output_messages.put_nowait(
+            EapQueueMessage("output eap message", "src mac", "port mac"))
         self.chewie.eap_output_messages.put_nowait(
             EapQueueMessage("output eap message", "src mac", "port mac"))
         self.chewie._send_eap_messages()
-        self.chewie._eap_socket.send.assert_called_with("packed ethernet")
+        self.chewie._eap_sockets['lo'].send_batch.assert_called_once_with(
+            ["packed ethernet", "packed ethernet"])
 
     @patch("chewie.chewie.Chewie.running", Mock(side_effect=[True, False]))
     @patch("chewie.chewie.MessageParser.radius_parse")
@@ -77,16 +96,17 @@ class ChewieWithMocksTestCase(unittest.TestCase):
                                                     radius_parse):  # pylint: disable=invalid-name
         """test radius packet goes to a state machine"""
         # note that the state machine has to exist already - if not then we blow up
-        fake_radius = namedtuple('Radius', ('packet_id',))('fake packet id')
-        self.chewie._radius_socket = Mock(
-            **{'receive.return_value': 'message from socket'})
+        fake_radius = namedtuple('Radius', ('packet_id',))(56)
+        self.chewie._radius_sockets = [Mock(
+            **{'receive_batch.return_value': ['message from socket']})]
         self.chewie.radius_lifecycle = Mock(**{'build_event_radius_message_received.side_effect':
                                                return_if(
                                                    (fake_radius,),
                                                    'fake event'
-                                               )})
+                                               ),
+                                               'is_status_server_request.return_value': False})
         radius_parse.side_effect = return_if(
-            ('message from socket', 'SECRET', self.chewie.radius_lifecycle),
+            ('message from socket', 'SECRET', self.chewie.radius_lifecycle, 0),
             fake_radius
         )
         # not checking args as we can't mock the callback
@@ -94,19 +114,83 @@ class ChewieWithMocksTestCase(unittest.TestCase):
         state_machine().event.assert_called_with(
             'fake event'
         )
+        self.chewie.radius_lifecycle.reply_received.assert_called_with(56, conversation_over=False)
 
     @patch("chewie.chewie.Chewie.running", Mock(side_effect=[True, False]))
     @patch("chewie.chewie.sleep", Mock())
     def test_radius_output_packet_gets_packed_and_sent(self):  # pylint: disable=invalid-name
         """test EAP packet creates a new state machine and is sent on"""
-        self.chewie._radius_socket = Mock()
+        self.chewie._radius_sockets = [Mock(), Mock()]
 
         self.chewie.radius_output_messages.put_nowait(
             'fake radius output bits')
         self.chewie.radius_lifecycle = Mock(**{'process_outbound.side_effect':
                                                return_if(
                                                    ('fake radius output bits',),
-                                                   'packed radius'
+                                                   (1, FakeRadiusServer(('10.0.0.1', 1812)),
+                                                    'packed radius')
                                                )})
         self.chewie._send_radius_messages()
-        self.chewie._radius_socket.send.assert_called_with("packed radius")
+        self.chewie._radius_sockets[1].send.assert_called_with("packed radius",
+                                                               ('10.0.0.1', 1812))
+        self.chewie._radius_sockets[0].send.assert_not_called()
+
+    @patch("chewie.chewie.Chewie.running", Mock(side_effect=[True, False]))
+    @patch("chewie.chewie.MessagePacker.ethernet_pack")
+    @patch("chewie.chewie.sleep", Mock())
+    def test_eap_output_sent_on_port_interface(self,
+                                               ethernet_pack):  # pylint: disable=invalid-name
+        """test EAP packets go out of the interface their port was seen on"""
+        chewie = Chewie(['eth0', 'eth1'], FakeLogger('logger name'),
+                        None, None, None,
+                        '127.0.0.1', 1812, 'SECRET',
+                        '44:44:44:44:44:44')
+        chewie._eap_sockets = {'eth0': Mock(), 'eth1': Mock()}
+        ethernet_pack.side_effect = lambda message, port_mac, src_mac: message
+        chewie._get_managed_port("port mac 1", 'eth1')
+        chewie.eap_output_messages.put_nowait(
+            EapQueueMessage("to port 1", "src mac", "port mac 1"))
+        chewie.eap_output_messages.put_nowait(
+            EapQueueMessage("to port 2", "src mac", "port mac 2"))
+        chewie._send_eap_messages()
+        chewie._eap_sockets['eth1'].send_batch.assert_called_once_with(["to port 1"])
+        chewie._eap_sockets['eth0'].send_batch.assert_called_once_with(["to port 2"])
+
+    @patch("chewie.chewie.MessagePacker.ethernet_pack")
+    def test_direct_dispatch_sends_from_handler(self, ethernet_pack):  # pylint: disable=invalid-name
+        """test EAP and RADIUS output is sent as soon as it is put"""
+        chewie = Chewie('lo', FakeLogger('logger name'),
+                        None, None, None,
+                        '127.0.0.1', 1812, 'SECRET',
+                        '44:44:44:44:44:44', dispatch='direct')
+        chewie._eap_sockets = {'lo': Mock(**{'send_nowait.return_value': True})}
+        chewie._radius_sockets = [Mock()]
+        ethernet_pack.return_value = "packed ethernet"
+        chewie.eap_output_messages.put_nowait(
+            EapQueueMessage("output eap message", "src mac", "port mac"))
+        chewie._eap_sockets['lo'].send_nowait.assert_called_once_with("packed ethernet")
+
+        chewie.radius_lifecycle = Mock(**{'process_outbound.side_effect':
+                                          return_if(
+                                              ('fake radius output bits',),
+                                              (0, FakeRadiusServer(('10.0.0.1', 1812)),
+                                               'packed radius')
+                                          )})
+        chewie.radius_output_messages.put_nowait('fake radius output bits')
+        chewie._radius_sockets[0].send.assert_called_once_with("packed radius",
+                                                               ('10.0.0.1', 1812))
+
+    @patch("chewie.chewie.MabSocket")
+    @patch("chewie.chewie.EapSocket")
+    @patch("chewie.chewie.CaptureSocket")
+    def test_fanout_uses_one_socket_per_interface(self, capture_socket, eap_socket,
+                                                  mab_socket):  # pylint: disable=invalid-name
+        chewie = Chewie(['eth0', 'eth1'], FakeLogger('logger name'),
+                        None, None, None,
+                        '127.0.0.1', 1812, 'SECRET',
+                        '44:44:44:44:44:44', fanout_group=100)
+        chewie._setup_frame_sockets()
+        eap_socket.assert_not_called()
+        mab_socket.assert_not_called()
+        self.assertEqual([call[1]['fanout_group'] for call in capture_socket.call_args_list],
+                         [100, 101])
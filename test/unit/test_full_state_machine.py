@@ -12,6 +12,7 @@ from chewie.mac_address import MacAddress
 from chewie.message_parser import EapolStartMessage, IdentityMessage, Md5ChallengeMessage, \
     SuccessMessage, LegacyNakMessage, TtlsMessage, FailureMessage, EapolLogoffMessage
 from chewie.radius_attributes import State
+from chewie.radius_lifecycle import RadiusLifecycle
 from chewie.state_machines.eap_state_machine import FullEAPStateMachine
 
 from helpers import FakeTimerScheduler
@@ -194,6 +195,9 @@ class FullStateMachineStartTestCase(unittest.TestCase):
         self.test_md5_challenge_response()
         old_eap_count = self.eap_output_queue.qsize()
         old_radius_count = self.radius_output_queue.qsize()
+        # RadiusLifecycle must give up on the request first.
+        self.assertGreater(max(job.timeout for job in self.timer_scheduler.jobs),
+                           RadiusLifecycle.REQUEST_TTL)
 
         self.timer_scheduler.run_jobs()
 
@@ -256,6 +260,14 @@ class FullStateMachineStartTestCase(unittest.TestCase):
         self.assertEqual(self.radius_output_queue.qsize(), 1)
         self.assertIsInstance(self.radius_output_queue.get_nowait()[0], IdentityMessage)
 
+    @check_counters
+    def test_superseded_retransmit_timer_cancelled(self):
+        self.test_eap_start()
+        first_timer = self.sm.retransmit_timer_job
+        self.test_identity_response()
+        self.assertTrue(first_timer.cancelled())
+        self.assertFalse(self.sm.retransmit_timer_job.cancelled())
+
     @check_counters
     def test_md5_challenge_request(self):
         self.test_identity_response()
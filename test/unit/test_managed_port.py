@@ -34,6 +34,13 @@ class ManagedPortTestCase(unittest.TestCase):
                                         self.radius_output_messages)
         self.assertIsNotNone(self.managed_port)
 
+    def test_managed_port_interface(self):
+        port_id = MacAddress.from_string('02:42:ac:17:00:6f')
+        self.managed_port = ManagedPort(port_id, self.logger.name, self.timer_scheduler,
+                                        self.eap_output_messages,
+                                        self.radius_output_messages, 'eth1')
+        self.assertEqual(self.managed_port.interface_name, 'eth1')
+
     def test_successful_managed_port_change_status(self):
         self.test_successful_managed_port_smoke()
 
@@ -8,8 +8,10 @@ from chewie.message_parser import EapolStartMessage, EapolLogoffMessage, \
     SuccessMessage, FailureMessage
 from chewie.message_parser import MessageParser, MessagePacker, IdentityMessage, \
     Md5ChallengeMessage, TtlsMessage, \
-    LegacyNakMessage, TlsMessage, PeapMessage
-from chewie.radius_attributes import State, CalledStationId, NASPortType
+    LegacyNakMessage, TlsMessage, PeapMessage, RadiusRequestTemplate
+from chewie.radius import RadiusAccessRequest, RadiusAttributesList
+from chewie.radius_attributes import State, CalledStationId, NASPortType, UserName, \
+    CallingStationId, NASPort, EAPMessage, MessageAuthenticator
 from chewie.utils import MessageParseError
 
 
@@ -241,6 +243,21 @@ class MessageParserTestCase(unittest.TestCase):
                                                      MacAddress.from_string("01:80:c2:00:00:03"))
         self.assertEqual(expected_packed_message, packed_message)
 
+    def test_legacy_nak_message_with_several_types_packs(self):  # pylint: disable=invalid-name
+        expected_packed_message = bytes.fromhex("0180c2000003000000111101888e"
+                                                "01000007026800070315" "19")
+        message = LegacyNakMessage(src_mac=MacAddress.from_string("00:00:00:11:11:01"),
+                                   message_id=104,
+                                   code=Eap.RESPONSE,
+                                   desired_auth_types=[(21).to_bytes(length=1, byteorder='big'),
+                                                       (25).to_bytes(length=1, byteorder='big')])
+        packed_message = MessagePacker.ethernet_pack(message,
+                                                     MacAddress.from_string("00:00:00:11:11:01"),
+                                                     MacAddress.from_string("01:80:c2:00:00:03"))
+        self.assertEqual(expected_packed_message, packed_message)
+        self.assertEqual(MessageParser.ethernet_parse(packed_message)[0].desired_auth_types,
+                         (bytes.fromhex("1519"),))
+
     def test_radius_with_extra_attributes_packs(self):  # pylint: disable=invalid-name
 
         packed_message = bytes.fromhex("010a0073"
@@ -306,6 +323,22 @@ class MessageParserTestCase(unittest.TestCase):
                                                   request_authenticator, state, secret)
         self.assertEqual(packed_message, packed_radius)
 
+    def test_radius_request_template_packs(self):
+        src_mac = MacAddress.from_string("02:42:ac:17:00:6f")
+        extra_attributes = [CalledStationId.create("44-44-44-44-44-44:"),
+                            NASPortType.create(15)]
+        template = RadiusRequestTemplate(src_mac, "host1user", 0x00010001, extra_attributes)
+        eap_message = TtlsMessage(src_mac, 3, Eap.RESPONSE, 0x00, bytes(range(256)) * 2)
+        for state in (None, State.create(b"random state")):
+            attr_list = [UserName.create("host1user"), CallingStationId.create(str(src_mac)),
+                         NASPort.create(0x00010001)] + extra_attributes + \
+                [EAPMessage.create(eap_message)] + ([state] if state else []) + \
+                [MessageAuthenticator.create(bytes(16))]
+            expected_packed_message = RadiusAccessRequest(
+                17, bytes(range(16)), RadiusAttributesList(attr_list)).build("SECRET")
+            self.assertEqual(expected_packed_message,
+                             template.pack(eap_message, 17, bytes(range(16)), state, "SECRET"))
+
     def test_unicode_decode_error_converts_to_message_parse_error(
             self):  # pylint: disable=invalid-name
         data = bytes.fromhex("0163bf130103bf1301")
@@ -354,3 +387,57 @@ class MessageParserTestCase(unittest.TestCase):
     #     self.assertEqual(packed_message, packed_radius,
     #                      "Did not match\nActual: {}\nExpected: {}".format(
     #                          binascii.hexlify(packed_radius), binascii.hexlify(packed_message)))
+
+
+class EthernetParseFastPathTestCase(unittest.TestCase):
+    """ethernet_parse() must give the same results as layered_ethernet_parse()"""
+
+    HEADER = bytes.fromhex("0180c2000003001906eab88c888e")
+
+    def eapol(self, packet_type, body, length=None):
+        if length is None:
+            length = len(body)
+        return self.HEADER + struct.pack("!BBH", 2, packet_type, length) + body
+
+    def eap(self, code, eap_type, type_data, length=None):
+        if length is None:
+            length = 5 + len(type_data)
+        return self.eapol(0, struct.pack("!BBHB", code, 7, length, eap_type) + type_data)
+
+    def frames(self):
+        frames = [self.eapol(1, b""), self.eapol(2, b""), self.eapol(3, b""),
+                  self.eapol(0, bytes.fromhex("03070004")),
+                  self.eapol(0, bytes.fromhex("04070004")),
+                  self.eapol(0, bytes.fromhex("0507000401")),
+                  self.eapol(0, bytes.fromhex("02070005")),
+                  self.eapol(0, bytes.fromhex("0207000519"), length=4),
+                  self.HEADER[:20], b""]
+        for code in (Eap.REQUEST, Eap.RESPONSE):
+            for eap_type in (Eap.IDENTITY, Eap.LEGACY_NAK, Eap.MD5_CHALLENGE, Eap.TLS,
+                             Eap.TTLS, Eap.PEAP, 2, 99):
+                for type_data in (b"", b"\x01", b"\x10" + bytes(16), b"user\xff",
+                                  b"\x20" + bytes(8), b"John.McGuirk" + bytes(4)):
+                    frames.append(self.eap(code, eap_type, type_data))
+                    frames.append(self.eap(code, eap_type, type_data, length=3))
+                    frames.append(self.eap(code, eap_type, type_data, length=6))
+                    frames.append(self.eap(code, eap_type, type_data)[:-1])
+        return frames
+
+    @staticmethod
+    def parse(parser, packed_message):
+        try:
+            message, dst_mac = parser(packed_message)
+        except MessageParseError as exception:
+            return MessageParseError, str(exception)
+        return type(message), vars(message), dst_mac
+
+    def test_same_as_layered_parse(self):
+        for packed_message in self.frames():
+            self.assertEqual(self.parse(MessageParser.layered_ethernet_parse, packed_message),
+                             self.parse(MessageParser.ethernet_parse, packed_message),
+                             packed_message.hex())
+
+    def test_parses_memoryview(self):
+        packed_message = self.eap(Eap.RESPONSE, Eap.IDENTITY, b"John.McGuirk")
+        self.assertEqual(self.parse(MessageParser.ethernet_parse, packed_message),
+                         self.parse(MessageParser.ethernet_parse, memoryview(packed_message)))
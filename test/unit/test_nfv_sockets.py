@@ -0,0 +1,195 @@
+"""Unittests for chewie/nfv_sockets.py"""
+# pylint: disable=missing-docstring
+
+import socket
+import struct
+import unittest
+
+import eventlet
+from eventlet.green import socket as green_socket
+
+from chewie.nfv_sockets import EapSocket, MabSocket, CaptureSocket
+
+
+def dhcp_frame(src_port=68, dst_port=67, ip_protocol=17, vlan=None, ip_options=b''):
+    ethernet = bytes.fromhex("ffffffffffff02420a000001")
+    if vlan is not None:
+        ethernet += struct.pack("!HH", MabSocket.VLAN_ETHERTYPE, vlan)
+    ethernet += struct.pack("!H", MabSocket.IP_ETHERTYPE)
+    ip_header = bytes([0x45 + len(ip_options) // 4]) + bytes(8) + bytes([ip_protocol]) + \
+        bytes(10) + ip_options
+    udp_header = struct.pack("!HHHH", src_port, dst_port, 8, 0)
+    return ethernet + ip_header + udp_header
+
+
+class MabSocketTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.mab_socket = MabSocket('lo', 'MabSocket')
+
+    def test_is_dhcp_request(self):
+        self.assertTrue(self.mab_socket.is_dhcp_request(dhcp_frame()))
+        self.assertTrue(self.mab_socket.is_dhcp_request(memoryview(dhcp_frame())))
+        self.assertTrue(self.mab_socket.is_dhcp_request(dhcp_frame(vlan=100)))
+        self.assertTrue(self.mab_socket.is_dhcp_request(dhcp_frame(ip_options=bytes(8))))
+        self.assertFalse(self.mab_socket.is_dhcp_request(dhcp_frame(src_port=67, dst_port=68)))
+        self.assertFalse(self.mab_socket.is_dhcp_request(dhcp_frame(ip_protocol=6)))
+        self.assertFalse(self.mab_socket.is_dhcp_request(dhcp_frame()[:30]))
+
+    def receive_from_kernel(self, rx_ring):
+        mab_socket = MabSocket('lo', 'MabSocket', rx_ring=rx_ring)
+        try:
+            mab_socket.setup()
+        except OSError as err:
+            self.skipTest("Unable to open a packet socket on lo: %s" % err)
+        if rx_ring and mab_socket.rx_ring is None:
+            self.skipTest("PACKET_MMAP is not supported")
+        sender = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        sender.bind(('lo', 0))
+        try:
+            sender.send(dhcp_frame(ip_protocol=6))
+            sender.send(dhcp_frame(dst_port=68))
+            sender.send(dhcp_frame(vlan=100, ip_options=bytes(4)))
+            sender.send(dhcp_frame(vlan=100, src_port=67))
+            sender.send(dhcp_frame())
+            # lo delivers each frame twice, outgoing and then incoming with the VLAN tag
+            # moved out of the frame.
+            expected = [dhcp_frame(vlan=100, ip_options=bytes(4)),
+                        dhcp_frame(ip_options=bytes(4)),
+                        dhcp_frame()]
+            received = []
+            while dhcp_frame() not in received:
+                received.append(mab_socket.receive())
+            self.assertEqual(received[0], expected[0])
+            for frame in received:
+                self.assertIn(frame, expected)
+        finally:
+            sender.close()
+            mab_socket.socket.close()
+
+    def test_receive(self):
+        self.receive_from_kernel(rx_ring=False)
+
+    def test_rx_ring_receive(self):
+        self.receive_from_kernel(rx_ring=True)
+
+    def test_kernel_filter(self):
+        mab_socket = MabSocket('lo', 'MabSocket')
+        try:
+            mab_socket.setup()
+        except OSError as err:
+            self.skipTest("Unable to open a packet socket on lo: %s" % err)
+        sender = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        sender.bind(('lo', 0))
+        try:
+            sender.send(dhcp_frame(ip_protocol=6))
+            sender.send(dhcp_frame(vlan=7, dst_port=68))
+            sender.send(dhcp_frame(vlan=7))
+            # read past the userspace check, only the kernel filter applies here.
+            self.assertEqual(mab_socket.socket.recv(4096), dhcp_frame(vlan=7))
+            self.assertEqual(mab_socket.socket.recv(4096), dhcp_frame())
+        finally:
+            sender.close()
+            mab_socket.socket.close()
+
+
+class CaptureSocketTestCase(unittest.TestCase):
+
+    EAPOL_START = bytes.fromhex("0180c200000302420a000001888e01010000")
+
+    def receive_batch_from_kernel(self, rx_ring):
+        capture_socket = CaptureSocket('lo', 'CaptureSocket', rx_ring=rx_ring)
+        try:
+            capture_socket.setup()
+        except OSError as err:
+            self.skipTest("Unable to open a packet socket on lo: %s" % err)
+        sender = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        sender.bind(('lo', 0))
+        try:
+            sender.send(dhcp_frame(ip_protocol=6))
+            sender.send(self.EAPOL_START)
+            sender.send(dhcp_frame())
+            eventlet.sleep(0.05)
+            received = []
+            while dhcp_frame() not in received:
+                received.extend(capture_socket.receive_batch())
+            # lo delivers each frame twice.
+            self.assertEqual(set(received), {self.EAPOL_START, dhcp_frame()})
+            self.assertGreater(len(received), 1)
+        finally:
+            sender.close()
+            capture_socket.socket.close()
+
+    def test_is_eapol(self):
+        self.assertTrue(CaptureSocket.is_eapol(self.EAPOL_START))
+        self.assertFalse(CaptureSocket.is_eapol(dhcp_frame()))
+        self.assertTrue(CaptureSocket.is_wanted(dhcp_frame(vlan=3)))
+
+    def test_receive_batch(self):
+        self.receive_batch_from_kernel(rx_ring=False)
+
+    def test_rx_ring_receive_batch(self):
+        self.receive_batch_from_kernel(rx_ring=True)
+
+
+class EapSocketTestCase(unittest.TestCase):
+
+    def test_send_backlog(self):
+        eap_socket = EapSocket('lo', 'EapSocket')
+        eap_socket.socket, receiver = green_socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM)
+        try:
+            sent = 0
+            while eap_socket.send_nowait(b'x' * 1000):
+                sent += 1
+            self.assertFalse(eap_socket.send_nowait(b'y'))
+            self.assertEqual(list(eap_socket.send_backlog), [b'x' * 1000, b'y'])
+            self.assertFalse(eap_socket.flush_send_backlog())
+
+            received = [receiver.recv(4096) for _ in range(sent)]
+            self.assertTrue(eap_socket.flush_send_backlog())
+            received += [receiver.recv(4096), receiver.recv(4096)]
+            self.assertEqual(received, [b'x' * 1000] * (sent + 1) + [b'y'])
+        finally:
+            eap_socket.socket.close()
+            receiver.close()
+
+
+class FanoutTestCase(unittest.TestCase):
+
+    def test_source_mac_fanout(self):
+        eap_sockets = [EapSocket('lo', 'EapSocket', fanout_group=4321) for _ in range(3)]
+        try:
+            for eap_socket in eap_sockets:
+                eap_socket.setup()
+        except OSError as err:
+            self.skipTest("Unable to join a fanout group on lo: %s" % err)
+        sender = socket.socket(socket.AF_PACKET, socket.SOCK_RAW)
+        sender.bind(('lo', 0))
+        frames = [bytes.fromhex("0180c2000003020000000a") + bytes([i]) +
+                  bytes.fromhex("888e01010000") for i in range(30)]
+        try:
+            for frame in frames:
+                sender.send(frame)
+            eventlet.sleep(0.05)
+            received = []
+            for eap_socket in eap_sockets:
+                frames_received = set()
+                while True:
+                    try:
+                        frames_received.add(eap_socket.socket.fd.recv(4096))
+                    except BlockingIOError:
+                        break
+                received.append(frames_received)
+            # every frame is received, and by one socket only.
+            self.assertEqual(set.union(*received), set(frames))
+            self.assertEqual(sum(len(frames_received) for frames_received in received), 30)
+            self.assertTrue(all(received))
+        finally:
+            sender.close()
+            for eap_socket in eap_sockets:
+                if eap_socket.socket:
+                    eap_socket.socket.close()
+
+    def test_unknown_fanout_mode(self):
+        with self.assertRaises(ValueError):
+            EapSocket('lo', 'EapSocket', fanout_group=1, fanout_mode='random')
@@ -3,15 +3,18 @@
 # pylint: disable=missing-docstring
 
 import binascii
+import hashlib
+import hmac
 import unittest
 from collections import namedtuple
 
-from chewie.message_parser import SuccessMessage
+from chewie.message_parser import SuccessMessage, MessagePacker
 from chewie.radius import Radius, RadiusAccessAccept, RadiusAttributesList, \
-    InvalidResponseAuthenticatorError, RadiusAccessChallenge, RadiusAccessRequest
+    InvalidResponseAuthenticatorError, RadiusAccessChallenge, RadiusAccessRequest, \
+    RadiusStatusServer, RadiusSigner
 from chewie.radius_attributes import UserName, ServiceType, FramedMTU, CalledStationId,\
     AcctSessionId, NASPortType, ConnectInfo, EAPMessage, MessageAuthenticator, State,\
-    VendorSpecific, CallingStationId, UserPassword
+    VendorSpecific, CallingStationId, UserPassword, NASIdentifier
 from chewie.radius_datatypes import Vsa, String, Enum, Text, Integer, Concat
 from chewie.utils import MessageParseError
 
@@ -128,6 +131,43 @@ class RadiusTestCase(unittest.TestCase):
                             0: bytes.fromhex("982a0ba06d3557f0dbc8ba6e823822f1")
                           }))
 
+    def test_radius_access_challenge_short_fragments_validates(self):  # pylint: disable=invalid-name
+        # Fragments shorter than chewie would pack them, so validation must hash the
+        # received bytes rather than a re-packed packet.
+        request_authenticator = bytes.fromhex("982a0ba06d3557f0dbc8ba6e823822f1")
+        eap_message = bytes.fromhex("0102012c15") + bytes(range(256)) + bytes(39)
+        attributes = b"".join(bytes([79, 2 + len(chunk)]) + chunk for chunk in
+                              (eap_message[i:i + 100] for i in range(0, len(eap_message), 100)))
+        attributes += bytes([80, 18]) + bytes(16) + bytes([24, 8]) + b"state1"
+        header = bytes([Radius.ACCESS_CHALLENGE, 0]) + (20 + len(attributes)).to_bytes(2, 'big')
+        ma_position = attributes.index(bytes([80, 18])) + 2
+        message_authenticator = hmac.new(b"SECRET", header + request_authenticator + attributes,
+                                         'md5').digest()
+        attributes = attributes[:ma_position] + message_authenticator + \
+            attributes[ma_position + 16:]
+        response_authenticator = hashlib.md5(header + request_authenticator + attributes +
+                                             b"SECRET").digest()
+        packed_message = header + response_authenticator + attributes
+        radius_lifecycle = namedtuple('RadiusLifecycle', 'packet_id_to_request_authenticator')(
+            {0: request_authenticator})
+
+        message = Radius.parse(packed_message, secret="SECRET", radius_lifecycle=radius_lifecycle)
+        self.assertEqual(message.attributes.find(EAPMessage.DESCRIPTION).bytes_data, eap_message)
+        self.assertEqual(message.attributes.find(State.DESCRIPTION).bytes_data, b"state1")
+
+        self.assertRaises(MessageParseError, Radius.parse, packed_message, secret="SECRET1",
+                          radius_lifecycle=radius_lifecycle)
+
+    def test_radius_signer(self):
+        signer = RadiusSigner.for_secret("SECRET")
+        self.assertIs(RadiusSigner.for_secret("SECRET"), signer)
+        self.assertIs(RadiusSigner.for_secret(signer), signer)
+        self.assertIsNot(RadiusSigner.for_secret("SECRET1"), signer)
+        self.assertEqual(signer.encoded_secret, b"SECRET")
+        for data in (b"", b"packet", b"packet" * 100):
+            self.assertEqual(signer.hmac_md5(data).digest(),
+                             hmac.new(b"SECRET", data, 'md5').digest())
+
     def test_radius_access_challenge_parses(self):
         packed_message = bytes.fromhex(
             "0b00005056d9280d3e4fed327eb31cf1823f8c244f1801020016041074d3db089b727d9cc5774599e4a32a295012ecc840b316217c851bd6708afb554b24181219ddf6d119dff272fa2fe16c34990c7d")
@@ -245,6 +285,21 @@ class RadiusTestCase(unittest.TestCase):
         self.assertEqual(len(expected_packed_message), len(packed_message))
         self.assertEqual(expected_packed_message, packed_message)
 
+    def test_radius_status_server_packs(self):
+        request_authenticator = bytes.fromhex("a0b4ace0b367114b1a16d76e2bfed5d8")
+        packed_message = MessagePacker.radius_status_server_pack(
+            7, request_authenticator, "SECRET", [NASIdentifier.create("44-44-44-44-44-44:")])
+        self.assertEqual(packed_message[0], Radius.STATUS_SERVER)
+        self.assertNotEqual(packed_message[-16:], bytes(16))
+
+        message = Radius.parse(bytes(packed_message), secret="SECRET")
+        self.assertIsInstance(message, RadiusStatusServer)
+        self.assertEqual(message.packet_id, 7)
+        self.assertEqual(message.attributes.find(NASIdentifier.DESCRIPTION).data(),
+                         "44-44-44-44-44-44:")
+        with self.assertRaises(MessageParseError):
+            Radius.parse(bytes(packed_message), secret="WRONG")
+
     def test_parse_illegal_radius_datatype_lengths(self):
 
         self.assertRaises(MessageParseError, Integer.parse, (1500).to_bytes(3, byteorder='big'))
@@ -305,27 +360,45 @@ class RadiusTestCase(unittest.TestCase):
         # Cannot test Concat datatype, it does not check length
         # Cannot test VSA datatype, Nothing is using it at the moment.
 
-    def test_radius_extract_attributes(self):
+    def test_radius_attributes_parse(self):
 
         # This list of radius AVP, contains multiple VSA attributes.
-        attributes = []
         attributes_data = bytes.fromhex("1a3a000001371134904a76cd1ffff59a3e1365e09441c41d83454aedafc1d9099d32ade23714a4d2c0898ff23997c89f59f1149bcb709fb889dc1a3a0000013710349e92efe66d278d977e3fe87faa650b391c43103d3d8e662bb3881807f1b3313ed975d3cfa85d45a6f3b83f6b98364a99135e4f06032a0004501256aef88d10224c30e6b3563acf963758010b686f73743175736572")
-        attributes_to_concat = {}
-        RadiusAttributesList.extract_attributes(attributes_data, attributes, attributes_to_concat)
+        attributes = RadiusAttributesList.parse(attributes_data).attributes
         self.assertEqual(len(attributes), 5)
-        self.assertEqual(len(attributes_to_concat), 1)
-        self.assertEqual(list(attributes_to_concat.values())[0][0][1], 2)
-        # check that the concated EAPMessage is marked position 2
+        # check that the concated EAPMessage is at position 2
+        self.assertIsInstance(attributes[2], EAPMessage)
 
         # This list of radius AVP contains multiple EAPMessages.
-        attributes = []
         attributes_data = bytes.fromhex("4fff012802bc158000000a76130101ff040530030101ff30360603551d1f042f302d302ba029a0278625687474703a2f2f7777772e6578616d706c652e6f72672f6578616d706c655f63612e63726c300d06092a864886f70d01010b05000382010100139e9c2b1e9bf30c6567759ffb57af9f031a59b6a8adb1702a55de2e51f2286715ef1399ebdc593d38db3ad4794c3e78037d3de5612cba33cefc5b830c3a2118bfc0572d201c07105b7c0ef5bb64225d959afef6a4527a88d1e5fd552fd16775a5c90802d11ad793da157441f7a181f85a2908ebcb87a86960c6d3ae631019bc73f850bc5be494a97084ccaea1cc13c44a4fdf0ef123c067b688e47a4fff4d223c15fd56798051ff4912c721f15c96061ef683b1ade02b5449b06184f59d4218f2287d35cfa0a3a4f65e40c8750d0c70dc00d65a8981e0a2cf6961b1355c10d399ce583a426e211b0feef37da67a57bbbc81d912d5379668cfdc3666bacf5e9d9c7d160303014d0c0001490300174104b275c284c5c067b9c3104305ba6704b4b0e083f0e285d9b205a8d7307e503907478f314679d084a0f1ccbc3ceaa6b6d56c588654d223fd16514bba463c5f8d7006010100bca760ef9aab5f1cf9239bab7d0bbf585e12f9c6440b9dd36affc87ff8f334b0dbea94686edbcff9143bd40a5136b065d5599742665fa27d5ec5e86898b7c8cc2c375d190646c64fc444df7911f41a12a7219f667527cfc4ba99b684fb763a01f4dc361a891906e3ade0c6e787c096f868726a5aafafb76ce71ce896b50015c9db89e9c3d13c90e90b5d82a1327941404298c1e358cbc7bbbf8e4fe2e1ecafbcbddfbe0b1a7d3f0769306f16f3ed4972b14b8af0f51761053754ec73a1a41b294fe0d00a9281e3d9c0175651d2bbaf28df32a25bfbae85983a3935891f0a955b636b3540cde3aba4ec20d62988a81a608b450e87b3eefcb66f50cf3104a4b367122d16030300040e00000050125f3ac1f2c8e65dab1bf90b9604cd65aa1812cefe6083cad675dd64722c274ec35372")
-        attributes_to_concat = {}
-        RadiusAttributesList.extract_attributes(attributes_data, attributes, attributes_to_concat)
-        self.assertEqual(len(attributes), 5)
-        self.assertEqual(len(attributes_to_concat), 1)
-        # check that the concated EAPMessage is marked position 0
-        self.assertEqual(list(attributes_to_concat.values())[0][0][1], 0)
+        attributes = RadiusAttributesList.parse(attributes_data).attributes
+        self.assertEqual([type(attribute) for attribute in attributes],
+                         [EAPMessage, MessageAuthenticator, State])
+        # check that the concated EAPMessage is at position 0, with every fragment's value
+        self.assertEqual(len(attributes[0].bytes_data), 2 * 253 + 194)
+        self.assertEqual(attributes[0].bytes_data[:2], bytes.fromhex("0128"))
+        self.assertEqual(RadiusAttributesList(attributes).pack(), attributes_data)
+
+    def test_radius_attributes_list_lookups(self):
+        attributes = RadiusAttributesList([UserName.create("host1user"),
+                                           State.create(b"state1"),
+                                           State.create(b"state2")])
+        self.assertEqual(len(attributes), 11 + 8 + 8)
+        self.assertEqual(attributes.indexof(State.DESCRIPTION), 11)
+        self.assertEqual(attributes.find(State.DESCRIPTION).bytes_data, b"state1")
+        self.assertIsNone(attributes.find(MessageAuthenticator.DESCRIPTION))
+        self.assertRaises(ValueError, attributes.indexof, MessageAuthenticator.DESCRIPTION)
+        self.assertEqual(attributes.to_dict(), {UserName.DESCRIPTION: "host1user",
+                                                State.DESCRIPTION: b"state2"})
+
+        attributes.append(MessageAuthenticator.create(bytes(16)))
+        self.assertEqual(len(attributes), 27 + 18)
+        self.assertEqual(attributes.indexof(MessageAuthenticator.DESCRIPTION), 27)
+        self.assertIn(MessageAuthenticator.DESCRIPTION, attributes.to_dict())
+
+    def test_radius_attributes_parse_bad_length(self):
+        self.assertRaises(MessageParseError, RadiusAttributesList.parse, bytes.fromhex("0100"))
+        self.assertRaises(MessageParseError, RadiusAttributesList.parse, bytes.fromhex("01"))
 
     def test_concat_when_length_multiple_of_max_data_length(self):
         expected_packed = bytes.fromhex("4fff013d03f419c00000144f160303004a020000460303eb4b5ca844e4929c67df4a32d7b0afd05a589cd5bf959dc418b49d91637ace992005c3b271553df564fce2c69100d3fa9db4308cd1a829597b555839afebee02d8003d0016030313f20b0013ee0013eb0008633082085f30820647a00302010202142162b97e20bcdf02f0961f5a34e80ebb682828d9300d06092a864886f70d01010b0500304d310b300906035504061302424d31193017060355040a131051756f5661646973204c696d69746564312330210603550403131a51756f566164697320476c6f62616c2053534c20494341204733301e170d3138313030323233303432375a170d324fff30313030323233313430305a308189310b3009060355040613024e5a3113301106035504080c0a57656c6c696e67746f6e3113301106035504070c0a57656c6c696e67746f6e312a3028060355040a0c21566963746f72696120556e6976657273697479206f662057656c6c696e67746f6e310c300a060355040b0c034954533116301406035504030c0d6973652e7675772e61632e6e7a30820122300d06092a864886f70d01010105000382010f003082010a0282010100ea13ab1ff3d0494bc3aabd994b1aac55877f185bbb11721f39f894f0cebf3fa9a7b4e03d81f6e635b8383146230a4e9e0f81913783edb9a8c47d8adbf5ccb565944fb0d54fffdfc8481b1e43ae4edda80cc3d445b77aa82adc011da13a9f255aa85d8d58bd079f2744d6765b05382acbc51b88bbd54043349b198ba66d82ce50bfa84e75a6d93f9e110099eae544b2aa4fbb22a8d5bffdc578d729ab2550ee73adda13e9eee968dfdf76cd0e70ceaf8977d9a7e575b9b35a83a55b68543d9e1311d02edd3a45b29cd5aa1cb363d4afbcfa4905f06661fb8fe804b99b1ef850ca102054a5ac25bd0069466187a463de736070452e2b75bc3950b420a9bd3fe2dc58e90203010001a38203f8308203f430090603551d1304023000301f0603551d23041830168014b31289b5a94b35bc1500f080e9d87887f1137c76307306082b0601054fff0507010104673065303706082b06010505073002862b687474703a2f2f74727573742e71756f7661646973676c6f62616c2e636f6d2f717673736c67332e637274302a06082b06010505073001861e687474703a2f2f6f6373702e71756f7661646973676c6f62616c2e636f6d3081f20603551d110481ea3081e7820d6973652e7675772e61632e6e7a8219767577766170636f69736570616e312e7675772e61632e6e7a8219767577766170647269736573616e312e7675772e61632e6e7a8219767577766170636f6973656d6f6e312e7675772e61632e6e7a821976757776617064726973656d6f6e312e7675772e61632e6e7a82197675777661")
@@ -0,0 +1,239 @@
+"""Unittests for chewie/radius_lifecycle.py"""
+# pylint: disable=missing-docstring
+
+import logging
+import unittest
+from unittest.mock import patch
+
+from helpers import FakeTimerScheduler
+
+from chewie.mac_address import MacAddress
+from chewie.message_parser import IdentityMessage
+from chewie.radius import radius_request_id, Radius
+from chewie.radius_lifecycle import RadiusLifecycle
+from chewie.radius_attributes import State
+from chewie.radius_servers import RadiusServer, RadiusServerPool
+from chewie.utils import RadiusQueueMessage
+
+
+class RadiusLifecycleTestCase(unittest.TestCase):
+
+    SRC_MAC = MacAddress.from_string("02:42:ac:17:00:6f")
+    PORT_ID = MacAddress.from_string("00:00:00:00:00:01")
+
+    def setUp(self):
+        self.released = 0
+        self.sent = []
+        self.timer_scheduler = FakeTimerScheduler()
+        self.radius_lifecycle = RadiusLifecycle("SECRET", "44-44-44-44-44-44:",
+                                                logging.getLogger(), max_client_ports=2,
+                                                packet_id_released_handler=self.id_released,
+                                                timer_scheduler=self.timer_scheduler,
+                                                send_handler=self.send)
+
+    def id_released(self):
+        self.released += 1
+
+    def send(self, client_port, _server, packed_message):
+        self.sent.append((client_port, packed_message))
+
+    def send_identity(self):
+        message = IdentityMessage(self.SRC_MAC, 1, 2, "host1user")
+        return self.radius_lifecycle.process_outbound(
+            RadiusQueueMessage(message, self.SRC_MAC, "host1user", None, self.PORT_ID))
+
+    def test_process_outbound_records_request(self):
+        client_port, _, packed_message = self.send_identity()
+        packet_id = packed_message[1]
+        request_id = radius_request_id(packet_id, client_port)
+        self.assertEqual(self.radius_lifecycle.packet_id_to_mac[request_id],
+                         {'src_mac': self.SRC_MAC, 'port_id': self.PORT_ID})
+        self.assertEqual(self.radius_lifecycle.packet_id_to_request_authenticator[request_id],
+                         bytes(packed_message[4:20]))
+
+    def test_request_template_reused(self):
+        self.send_identity()
+        template = self.radius_lifecycle.request_templates[self.SRC_MAC]
+        self.send_identity()
+        self.assertIs(self.radius_lifecycle.request_templates[self.SRC_MAC], template)
+        self.assertIsNot(self.radius_lifecycle.get_request_template(self.SRC_MAC, "host2user",
+                                                                    self.PORT_ID), template)
+
+    def test_request_template_dropped_when_conversation_ends(self):
+        client_port, _, packed_message = self.send_identity()
+        self.radius_lifecycle.reply_received(radius_request_id(packed_message[1], client_port))
+        self.assertIn(self.SRC_MAC, self.radius_lifecycle.request_templates)
+        client_port, _, packed_message = self.send_identity()
+        self.radius_lifecycle.reply_received(radius_request_id(packed_message[1], client_port),
+                                             conversation_over=True)
+        self.assertNotIn(self.SRC_MAC, self.radius_lifecycle.request_templates)
+        self.assertNotIn(self.SRC_MAC, self.radius_lifecycle.server_pool.conversation_servers)
+
+        client_port, _, packed_message = self.send_identity()
+        self.radius_lifecycle.expire_request(radius_request_id(packed_message[1], client_port))
+        self.assertNotIn(self.SRC_MAC, self.radius_lifecycle.request_templates)
+
+        self.send_identity()
+        self.radius_lifecycle.end_conversation(self.SRC_MAC)
+        self.assertEqual(self.radius_lifecycle.request_templates, {})
+        self.assertEqual(self.radius_lifecycle.server_pool.conversation_servers, {})
+
+    def test_client_ports_added_on_demand(self):
+        allocated = [self.radius_lifecycle.get_next_radius_packet_id() for _ in range(256)]
+        self.assertEqual(allocated, [(0, packet_id) for packet_id in range(256)])
+        self.assertEqual(self.radius_lifecycle.get_next_radius_packet_id(), (1, 0))
+
+    def test_ids_in_flight_are_not_reused(self):
+        first_client_port, _, first_packed = self.send_identity()
+        first_request_id = radius_request_id(first_packed[1], first_client_port)
+        for _ in range(511):
+            client_port, _, packed_message = self.send_identity()
+            self.assertNotEqual(radius_request_id(packed_message[1], client_port),
+                                first_request_id)
+
+        self.assertFalse(self.radius_lifecycle.packet_id_available())
+        with self.assertRaises(RuntimeError):
+            self.send_identity()
+
+        self.radius_lifecycle.release_packet_id(first_request_id)
+        self.assertEqual(self.released, 1)
+        self.assertNotIn(first_request_id, self.radius_lifecycle.packet_id_to_mac)
+        self.assertTrue(self.radius_lifecycle.packet_id_available())
+        client_port, _, packed_message = self.send_identity()
+        self.assertEqual(radius_request_id(packed_message[1], client_port), first_request_id)
+
+    def test_release_unknown_request_id(self):
+        self.radius_lifecycle.release_packet_id(radius_request_id(5, 1))
+        self.assertEqual(self.released, 0)
+
+    def test_outstanding_request_count(self):
+        client_port, _, packed_message = self.send_identity()
+        self.send_identity()
+        self.assertEqual(self.radius_lifecycle.outstanding_request_count, 2)
+        self.radius_lifecycle.release_packet_id(radius_request_id(packed_message[1], client_port))
+        self.assertEqual(self.radius_lifecycle.outstanding_request_count, 1)
+
+    def test_unanswered_request_expires(self):
+        client_port, _, packed_message = self.send_identity()
+        request_id = radius_request_id(packed_message[1], client_port)
+        self.assertEqual(self.timer_scheduler.jobs[0].timeout, RadiusLifecycle.REQUEST_TTL)
+
+        self.timer_scheduler.run_jobs()
+        self.assertEqual(len(self.sent), RadiusLifecycle.MRC)
+        self.assertEqual(self.radius_lifecycle.outstanding_request_count, 0)
+        self.assertNotIn(request_id, self.radius_lifecycle.packet_id_to_request_authenticator)
+        self.assertEqual(self.radius_lifecycle.expired_request_count, 1)
+        self.assertEqual(self.released, 1)
+
+    def test_reply_cancels_expiry(self):
+        client_port, _, packed_message = self.send_identity()
+        self.radius_lifecycle.reply_received(radius_request_id(packed_message[1], client_port))
+        self.assertTrue(all(job.cancelled() for job in self.timer_scheduler.jobs))
+        self.timer_scheduler.run_jobs()
+        self.assertEqual(self.sent, [])
+        self.assertEqual(self.radius_lifecycle.expired_request_count, 0)
+        self.assertEqual(self.released, 1)
+
+    def test_retransmits_identical_packet_with_backoff(self):
+        client_port, _, packed_message = self.send_identity()
+        retransmit_timeouts = []
+        while len(self.sent) < RadiusLifecycle.MRC:
+            job = min(self.timer_scheduler.jobs, key=lambda job: job.timeout)
+            self.timer_scheduler.jobs.remove(job)
+            retransmit_timeouts.append(job.timeout)
+            job.run()
+        self.assertEqual(self.sent, [(client_port, packed_message)] * RadiusLifecycle.MRC)
+
+        self.assertAlmostEqual(retransmit_timeouts[0], RadiusLifecycle.IRT,
+                               delta=RadiusLifecycle.IRT * RadiusLifecycle.RAND)
+        for previous, timeout in zip(retransmit_timeouts, retransmit_timeouts[1:]):
+            self.assertLessEqual(timeout, RadiusLifecycle.MRT * (1 + RadiusLifecycle.RAND))
+            if timeout >= RadiusLifecycle.MRT * (1 - RadiusLifecycle.RAND):
+                # capped at MRT from here on.
+                break
+            self.assertGreater(timeout, previous * 1.8)
+        self.assertEqual(self.radius_lifecycle.retransmitted_request_count,
+                         RadiusLifecycle.MRC)
+
+    @patch("chewie.radius_lifecycle.time")
+    def test_reply_to_last_retransmission(self, fake_time):
+        now = [0]
+        fake_time.time.side_effect = lambda: now[0]
+        client_port, _, packed_message = self.send_identity()
+        request_id = radius_request_id(packed_message[1], client_port)
+        expiry_job = self.timer_scheduler.jobs[0]
+        retransmit_jobs = self.timer_scheduler.jobs[1:]
+        while retransmit_jobs:
+            job = retransmit_jobs[0]
+            self.timer_scheduler.jobs.remove(job)
+            now[0] += job.timeout
+            job.run()
+            retransmit_jobs = self.timer_scheduler.jobs[1:]
+        self.assertLessEqual(now[0], RadiusLifecycle.MRD)
+
+        # the reply to the last retransmission can take up to MRT to arrive.
+        now[0] += RadiusLifecycle.MRT
+        self.assertLessEqual(now[0], expiry_job.timeout)
+        self.radius_lifecycle.reply_received(request_id)
+        self.assertEqual(self.radius_lifecycle.expired_request_count, 0)
+        self.assertEqual(self.released, 1)
+
+    def test_rtt_measured_from_unretransmitted_requests(self):
+        client_port, _, packed_message = self.send_identity()
+        self.radius_lifecycle.reply_received(radius_request_id(packed_message[1], client_port))
+        self.assertIsNotNone(self.radius_lifecycle.server_pool.servers[0].rtt_estimator.srtt)
+
+        self.radius_lifecycle.server_pool.servers[0].rtt_estimator.srtt = 1000
+        client_port, _, packed_message = self.send_identity()
+        request_id = radius_request_id(packed_message[1], client_port)
+        self.radius_lifecycle.retransmit_request(request_id)
+        self.radius_lifecycle.reply_received(request_id)
+        self.assertEqual(self.radius_lifecycle.server_pool.servers[0].rtt_estimator.srtt, 1000)
+
+    def test_requests_with_state_stick_to_server(self):
+        servers = [RadiusServer('10.0.0.1'), RadiusServer('10.0.0.2')]
+        self.radius_lifecycle.server_pool = RadiusServerPool(servers, logging.getLogger())
+        message = IdentityMessage(self.SRC_MAC, 1, 2, "host1user")
+        _, first_server, _ = self.send_identity()
+        for _ in range(3):
+            _, server, _ = self.radius_lifecycle.process_outbound(
+                RadiusQueueMessage(message, self.SRC_MAC, "host1user",
+                                   State.create(b"state"), self.PORT_ID))
+            self.assertIs(server, first_server)
+        _, server, _ = self.send_identity()
+        self.assertIsNot(server, first_server)
+        self.assertEqual(first_server.outstanding_request_count, 4)
+
+    def test_status_server_probes_need_handlers(self):
+        radius_lifecycle = RadiusLifecycle("SECRET", "44-44-44-44-44-44:", logging.getLogger())
+        with self.assertRaises(ValueError):
+            radius_lifecycle.start_status_server_probes(10)
+        radius_lifecycle.send_status_server(radius_lifecycle.server_pool.servers[0])
+        self.assertEqual(radius_lifecycle.outstanding_request_count, 0)
+
+    def test_status_server_probes(self):
+        servers = [RadiusServer('10.0.0.1'), RadiusServer('10.0.0.2')]
+        self.radius_lifecycle.server_pool = RadiusServerPool(servers, logging.getLogger())
+        self.radius_lifecycle.start_status_server_probes(10)
+        self.assertEqual([packed_message[0] for _, packed_message in self.sent],
+                         [Radius.STATUS_SERVER] * 2)
+        self.assertEqual(sorted(job.timeout for job in self.timer_scheduler.jobs),
+                         [RadiusLifecycle.STATUS_SERVER_TIMEOUT] * 2 + [10] * 2)
+
+        client_port, packed_message = self.sent[0]
+        request_id = radius_request_id(packed_message[1], client_port)
+        self.assertTrue(self.radius_lifecycle.is_status_server_request(request_id))
+        self.radius_lifecycle.reply_received(request_id)
+        self.assertIsNotNone(servers[0].rtt_estimator.srtt)
+
+        client_port, packed_message = self.sent[1]
+        request_id = radius_request_id(packed_message[1], client_port)
+        for _ in range(RadiusServerPool.MAX_FAILURES - 1):
+            self.radius_lifecycle.send_status_server(servers[1])
+            self.radius_lifecycle.expire_request(
+                radius_request_id(self.sent[-1][1][1], self.sent[-1][0]))
+        self.radius_lifecycle.expire_request(request_id)
+        self.assertFalse(servers[1].alive)
+        self.assertTrue(servers[0].alive)
+        self.assertEqual(self.radius_lifecycle.expired_request_count, 0)
+        self.assertEqual(self.radius_lifecycle.outstanding_request_count, 0)
@@ -0,0 +1,117 @@
+"""Unittests for chewie/radius_servers.py"""
+# pylint: disable=missing-docstring
+
+import logging
+import unittest
+
+from helpers import FakeTimerScheduler
+
+from chewie.mac_address import MacAddress
+from chewie.radius_servers import RadiusRttEstimator, RadiusServer, RadiusServerPool
+
+
+class RadiusServerPoolTestCase(unittest.TestCase):
+
+    SRC_MAC = MacAddress.from_string("02:42:ac:17:00:6f")
+
+    def setUp(self):
+        self.timer_scheduler = FakeTimerScheduler()
+        self.servers = [RadiusServer('10.0.0.1', weight=2), RadiusServer('10.0.0.2', 1813)]
+        self.server_pool = RadiusServerPool(self.servers, logging.getLogger(),
+                                            timer_scheduler=self.timer_scheduler)
+
+    def new_conversations(self, count):
+        return [self.server_pool.select_server(MacAddress.from_string("02:00:00:00:00:%02x" % i),
+                                               True)
+                for i in range(count)]
+
+    def test_weighted_round_robin(self):
+        chosen = self.new_conversations(6)
+        self.assertEqual(chosen.count(self.servers[0]), 4)
+        self.assertEqual(chosen.count(self.servers[1]), 2)
+        self.assertEqual(chosen[:3], [self.servers[0], self.servers[1], self.servers[0]])
+
+    def test_least_outstanding(self):
+        server_pool = RadiusServerPool(self.servers, logging.getLogger(),
+                                       algorithm='least_outstanding')
+        for _ in range(3):
+            server_pool.request_sent(self.servers[0])
+        server_pool.request_sent(self.servers[1])
+        self.assertIs(server_pool.select_server(self.SRC_MAC, True), self.servers[1])
+
+    def test_conversation_sticks_to_server(self):
+        server = self.server_pool.select_server(self.SRC_MAC, True)
+        self.new_conversations(5)
+        for _ in range(3):
+            self.assertIs(self.server_pool.select_server(self.SRC_MAC, False), server)
+
+    def test_conversation_released(self):
+        self.new_conversations(5)
+        self.assertEqual(len(self.server_pool.conversation_servers), 5)
+        for i in range(5):
+            self.server_pool.end_conversation(MacAddress.from_string("02:00:00:00:00:%02x" % i))
+        self.assertEqual(self.server_pool.conversation_servers, {})
+        self.server_pool.end_conversation(self.SRC_MAC)
+
+    def test_dead_server_taken_out_of_rotation(self):
+        server = self.server_pool.select_server(self.SRC_MAC, True)
+        for _ in range(RadiusServerPool.MAX_FAILURES):
+            self.server_pool.request_sent(server)
+            self.server_pool.request_finished(server, answered=False)
+        self.assertFalse(server.alive)
+        self.assertEqual(server.outstanding_request_count, 0)
+
+        self.assertNotIn(server, self.new_conversations(4))
+
+        self.timer_scheduler.run_jobs()
+        self.assertTrue(server.alive)
+        self.assertIn(server, self.new_conversations(4))
+
+    def test_conversation_stays_on_dead_server(self):
+        server = self.server_pool.select_server(self.SRC_MAC, True)
+        self.server_pool.mark_dead(server)
+        # the request carries the dead server's State, another server would reject it.
+        self.assertIs(self.server_pool.select_server(self.SRC_MAC, False), server)
+        self.assertIsNot(self.server_pool.select_server(self.SRC_MAC, True), server)
+
+    def test_reply_revives_server(self):
+        server = self.servers[1]
+        self.server_pool.mark_dead(server)
+        self.server_pool.request_finished(server, answered=True)
+        self.assertTrue(server.alive)
+        self.assertTrue(self.timer_scheduler.jobs[0].cancelled())
+
+    def test_all_servers_dead(self):
+        for server in self.servers:
+            self.server_pool.mark_dead(server)
+        self.assertIn(self.server_pool.select_server(self.SRC_MAC, True), self.servers)
+
+    def test_server_status(self):
+        self.servers[0].rtt_estimator.update(0.5)
+        self.server_pool.mark_dead(self.servers[1])
+        status = self.server_pool.server_status()
+        self.assertEqual(status[0]['server'], '10.0.0.1:1812')
+        self.assertEqual(status[0]['srtt'], 0.5)
+        self.assertTrue(status[0]['alive'])
+        self.assertEqual(status[1]['server'], '10.0.0.2:1813')
+        self.assertIsNone(status[1]['srtt'])
+        self.assertFalse(status[1]['alive'])
+
+    def test_bad_config(self):
+        with self.assertRaises(ValueError):
+            RadiusServerPool([], logging.getLogger())
+        with self.assertRaises(ValueError):
+            RadiusServerPool(self.servers, logging.getLogger(), algorithm='random')
+
+
+class RadiusRttEstimatorTestCase(unittest.TestCase):
+
+    def test_retransmit_timeout(self):
+        rtt_estimator = RadiusRttEstimator()
+        self.assertIsNone(rtt_estimator.retransmit_timeout())
+        rtt_estimator.update(0.2)
+        self.assertAlmostEqual(rtt_estimator.retransmit_timeout(), 0.2 + 4 * 0.1)
+        for _ in range(100):
+            rtt_estimator.update(1)
+        self.assertAlmostEqual(rtt_estimator.srtt, 1, places=3)
+        self.assertLess(rtt_estimator.retransmit_timeout(), 1.1)
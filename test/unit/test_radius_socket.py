@@ -0,0 +1,34 @@
+"""Unittests for chewie/radius_socket.py"""
+# pylint: disable=missing-docstring
+
+import socket
+import unittest
+
+import eventlet
+
+from chewie.radius_socket import RadiusSocket
+
+
+class RadiusSocketTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.radius_socket = RadiusSocket('127.0.0.1', 0, '127.0.0.1', 1812, 'RadiusSocket')
+        self.radius_socket.setup()
+        self.address = self.radius_socket.socket.getsockname()
+        self.sender = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+
+    def tearDown(self):
+        self.sender.close()
+        self.radius_socket.socket.close()
+
+    def test_receive_batch_drains_queued_datagrams(self):
+        datagrams = [bytes([i]) * (i + 20) for i in range(5)]
+        for datagram in datagrams:
+            self.sender.sendto(datagram, self.address)
+        eventlet.sleep(0.05)
+        self.assertEqual(self.radius_socket.receive_batch(max_messages=3), datagrams[:3])
+        self.assertEqual(self.radius_socket.receive_batch(), datagrams[3:])
+
+    def test_receive_batch_waits_for_first_datagram(self):
+        eventlet.spawn_after(0.05, self.sender.sendto, b'late', self.address)
+        self.assertEqual(self.radius_socket.receive_batch(), [b'late'])
@@ -0,0 +1,162 @@
+"""Unittests for chewie/sharding.py"""
+# pylint: disable=missing-docstring,protected-access
+
+import logging
+import unittest
+from unittest.mock import patch, Mock
+
+from chewie.mac_address import MacAddress
+from chewie.message_parser import IdentityMessage
+from chewie.sharding import shard_for_mac, run_shard_worker, ShardedChewie, ShardEapSocket, \
+    ShardLink, ShardWorker
+from chewie.utils import EapQueueMessage
+
+
+def eap_frame(src_mac):
+    return (bytes.fromhex("0180c2000003") + MacAddress.from_string(src_mac).address
+            + bytes.fromhex("888e01010000"))
+
+
+class ShardForMacTestCase(unittest.TestCase):
+
+    def test_shards_spread_and_stable(self):
+        macs = [bytes([2, 0, 0, 0, i // 256, i % 256]) for i in range(1000)]
+        shards = [shard_for_mac(mac, 4) for mac in macs]
+        self.assertEqual(shards, [shard_for_mac(mac, 4) for mac in macs])
+        for shard_index in range(4):
+            self.assertGreater(shards.count(shard_index), 150)
+
+
+class ShardedChewieTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.auth_handler = Mock()
+        self.chewie = ShardedChewie(['eth0', 'eth1'], logging.getLogger(), self.auth_handler,
+                                    None, None, '127.0.0.1', 1812, 'SECRET', shard_count=3)
+
+    def tearDown(self):
+        for front_end_link, worker_link in self.chewie._shard_links:
+            front_end_link.close()
+            worker_link.close()
+
+    @patch("chewie.sharding.ShardWorker")
+    def test_workers_get_logger_name(self, shard_worker):
+        self.assertEqual(self.chewie._worker_args[:2], (['eth0', 'eth1'], 'root'))
+        run_shard_worker(0, 'link', *self.chewie._worker_args)
+        shard_worker.assert_called_once_with(0, 'link', ['eth0', 'eth1'], logging.getLogger(),
+                                             '127.0.0.1', 1812, 'SECRET')
+        shard_worker().run.assert_called_once_with()
+
+    def test_frames_go_to_owning_shard(self):
+        src_mac = "02:42:ac:17:00:6f"
+        frame = eap_frame(src_mac)
+        self.chewie._process_eap_frame(frame, 'eth1')
+        self.chewie._send_eth_to_state_machine(frame)
+        shard_index = shard_for_mac(MacAddress.from_string(src_mac).address, 3)
+        worker_link = self.chewie._shard_links[shard_index][1]
+        self.assertEqual(worker_link.receive(), ('eap', 'eth1', frame))
+        self.assertEqual(worker_link.receive(), ('mab', 'eth0', frame))
+
+    def test_port_events_go_to_all_shards(self):
+        self.chewie.port_up("00:00:00:00:00:01", 'eth1')
+        for _, worker_link in self.chewie._shard_links:
+            self.assertEqual(worker_link.receive(), ('port_up', "00:00:00:00:00:01", 'eth1'))
+
+    @patch("chewie.chewie.Chewie.running", Mock(side_effect=[True, True, False]))
+    def test_worker_messages_handled(self):
+        self.chewie._eap_sockets = {'eth0': Mock(), 'eth1': Mock()}
+        worker_link = self.chewie._shard_links[1][1]
+        src_mac = MacAddress.from_string("02:42:ac:17:00:6f")
+        port_id = MacAddress.from_string("00:00:00:00:00:01")
+        worker_link.send('eap', 'eth1', [b'frame'])
+        worker_link.send('auth', src_mac, port_id, ('vlan',), {'filter_id': 'acl'})
+        self.chewie._receive_shard_messages(1)
+        self.chewie._eap_sockets['eth1'].send_batch.assert_called_once_with([b'frame'])
+        self.auth_handler.assert_called_once_with(src_mac, port_id, 'vlan', filter_id='acl')
+
+    @patch("chewie.chewie.Chewie.running", Mock(side_effect=[True, False]))
+    def test_reauth_routed_to_port_owner(self):
+        self.chewie._shard_links[2][1].send('reauth', "00:00:00:00:00:01")
+        self.chewie._receive_shard_messages(2)
+        self.assertEqual(self.chewie._shard_links[0][1].receive(),
+                         ('reauth', "00:00:00:00:00:01"))
+
+
+class ShardWorkerTestCase(unittest.TestCase):
+
+    def setUp(self):
+        self.front_end_link, worker_link = ShardLink.pair()
+        self.worker = ShardWorker(1, worker_link, 'eth0', logging.getLogger(),
+                                  radius_server_ip='127.0.0.1', radius_server_secret='SECRET')
+
+    def tearDown(self):
+        self.front_end_link.close()
+        self.worker.shard_link.close()
+
+    @patch("chewie.chewie.Chewie.running", Mock(side_effect=[True, True, False]))
+    @patch("chewie.sharding.ShardWorker._process_eap_frame")
+    def test_front_end_messages_handled(self, process_eap_frame):
+        self.front_end_link.send('eap', 'eth0', b'frame')
+        self.front_end_link.send('port_up', "00:00:00:00:00:01", 'eth0')
+        self.worker._receive_front_end_messages()
+        process_eap_frame.assert_called_once_with(b'frame', 'eth0')
+        managed_port = self.worker._get_managed_port("00:00:00:00:00:01")
+        self.assertTrue(managed_port.status)
+        self.assertIsNone(managed_port.identity_job)
+
+    def test_only_port_owner_sends_identity_requests(self):
+        owner_link, owner_worker_link = ShardLink.pair()
+        owner = ShardWorker(0, owner_worker_link, 'eth0', logging.getLogger(),
+                            radius_server_ip='127.0.0.1', radius_server_secret='SECRET')
+        port_id = "00:00:00:00:00:01"
+        for worker in (owner, self.worker):
+            worker.port_up(port_id)
+        owner_port = owner._get_managed_port(port_id)
+        self.assertIsNotNone(owner_port.identity_job)
+        self.assertIsNone(self.worker._get_managed_port(port_id).identity_job)
+
+        # A supplicant on another shard reauthenticates through the port owner.
+        self.worker._get_managed_port(port_id).reauth_handler(port_id)
+        self.assertIsNone(self.worker._get_managed_port(port_id).identity_job)
+        self.assertEqual(self.front_end_link.receive(), ('reauth', port_id))
+        owner_port.identity_job.cancel()
+        owner._reauth_port(port_id)
+        self.assertFalse(owner_port.identity_job.cancelled())
+        owner_link.close()
+        owner_worker_link.close()
+
+    def test_callbacks_forwarded(self):
+        src_mac = MacAddress.from_string("02:42:ac:17:00:6f")
+        port_id = MacAddress.from_string("00:00:00:00:00:01")
+        self.worker.auth_handler(src_mac, port_id, 'vlan')
+        self.worker.failure_handler(src_mac, port_id)
+        self.assertEqual(self.front_end_link.receive(), ('auth', src_mac, port_id, ('vlan',), {}))
+        self.assertEqual(self.front_end_link.receive(), ('failure', src_mac, port_id))
+
+    def test_eap_frames_sent_through_front_end(self):
+        eap_socket = ShardEapSocket(self.worker.shard_link, 'eth0')
+        frames = [bytes([i]) for i in range(ShardEapSocket.MAX_FRAMES_PER_MESSAGE + 1)]
+        eap_socket.send_batch(frames)
+        self.assertEqual(self.front_end_link.receive(),
+                         ('eap', 'eth0', frames[:ShardEapSocket.MAX_FRAMES_PER_MESSAGE]))
+        self.assertEqual(self.front_end_link.receive(), ('eap', 'eth0', frames[-1:]))
+
+    def test_direct_dispatch(self):
+        worker = ShardWorker(1, self.worker.shard_link, 'eth0', logging.getLogger(),
+                             radius_server_ip='127.0.0.1', radius_server_secret='SECRET',
+                             dispatch='direct')
+        eap_socket = ShardEapSocket(worker.shard_link, 'eth0')
+        worker._eap_sockets = {'eth0': eap_socket}
+        src_mac = MacAddress.from_string("02:42:ac:17:00:6f")
+        port_id = MacAddress.from_string("00:00:00:00:00:01")
+        worker.eap_output_messages.put_nowait(
+            EapQueueMessage(IdentityMessage(src_mac, 1, 1, ""), src_mac, port_id))
+        kind, interface_name, frames = self.front_end_link.receive()
+        self.assertEqual((kind, interface_name, len(frames)), ('eap', 'eth0', 1))
+        self.assertEqual(frames[0][:12], src_mac.address + port_id.address)
+
+        eap_socket.send_backlog.extend([b'frame1', b'frame2'])
+        self.assertFalse(eap_socket.send_nowait(b'frame3'))
+        self.assertTrue(eap_socket.flush_send_backlog())
+        self.assertEqual(self.front_end_link.receive(),
+                         ('eap', 'eth0', [b'frame1', b'frame2', b'frame3']))
@@ -0,0 +1,214 @@
+"""Unittests for chewie/timer_scheduler.py"""
+# pylint: disable=missing-docstring
+
+import logging
+import random
+import time
+import unittest
+
+import eventlet
+
+from chewie.timer_scheduler import TimerScheduler, TimerJob, HeapTimerQueue, \
+    TimingWheelTimerQueue
+
+
+class TimerSchedulerTestCase(unittest.TestCase):
+
+    BACKEND = 'heap'
+
+    def setUp(self):
+        self.logger = logging.getLogger()
+        self.timer_scheduler = TimerScheduler(self.logger, backend=self.BACKEND)
+        self.calls = []
+
+    def record(self, name):
+        self.calls.append(name)
+
+    def test_run_pending_runs_all_due_jobs(self):
+        self.timer_scheduler.call_later(-2, self.record, 'second')
+        self.timer_scheduler.call_later(-3, self.record, 'first')
+        self.timer_scheduler.call_later(60, self.record, 'later')
+
+        delay = self.timer_scheduler.run_pending()
+        self.assertEqual(self.calls, ['first', 'second'])
+        self.assertGreater(delay, 0)
+        self.assertLessEqual(delay, 60)
+        self.assertEqual(self.timer_scheduler.live_job_count, 1)
+
+    def test_run_pending_skips_cancelled_jobs(self):
+        job = self.timer_scheduler.call_later(-1, self.record, 'cancelled')
+        self.timer_scheduler.call_later(-1, self.record, 'not cancelled')
+        job.cancel()
+
+        self.assertIsNone(self.timer_scheduler.run_pending())
+        self.assertEqual(self.calls, ['not cancelled'])
+
+    def test_run_pending_survives_job_exception(self):
+        def explode():
+            raise ValueError('boom')
+
+        self.timer_scheduler.call_later(-1, explode)
+        self.timer_scheduler.call_later(-1, self.record, 'after')
+        self.timer_scheduler.run_pending()
+        self.assertEqual(self.calls, ['after'])
+
+    def test_call_later_wakes_run(self):
+        thread = eventlet.spawn(self.timer_scheduler.run)
+        try:
+            # let run() block with an empty heap.
+            eventlet.sleep(0.05)
+            start = time.time()
+            self.timer_scheduler.call_later(0.1, self.record, 'woken')
+            while not self.calls and time.time() - start < 2:
+                eventlet.sleep(0.01)
+            self.assertEqual(self.calls, ['woken'])
+            self.assertLess(time.time() - start, 0.5)
+        finally:
+            thread.kill()
+
+    def test_polling_mode(self):
+        sleeps = []
+        timer_scheduler = TimerScheduler(self.logger, sleep=sleeps.append, wakeup=False)
+        timer_scheduler.call_later(30, self.record, 'later')
+        timer_scheduler._wait(timer_scheduler.run_pending())  # pylint: disable=protected-access
+        self.assertEqual(sleeps, [TimerScheduler.POLL_INTERVAL])
+        self.assertEqual(self.calls, [])
+
+    def test_cancel_counters(self):
+        job = self.timer_scheduler.call_later(30, self.record, 'cancelled')
+        self.timer_scheduler.call_later(30, self.record, 'live')
+        job.cancel()
+        job.cancel()
+        self.assertEqual(self.timer_scheduler.live_job_count, 1)
+        self.assertEqual(self.timer_scheduler.cancelled_job_count, 1)
+
+    def test_cancel_after_run_does_not_count(self):
+        job = self.timer_scheduler.call_later(-1, self.record, 'ran')
+        self.timer_scheduler.run_pending()
+        job.cancel()
+        self.assertEqual(self.timer_scheduler.cancelled_job_count, 0)
+
+    def test_unknown_backend(self):
+        with self.assertRaises(ValueError):
+            TimerScheduler(self.logger, backend='calendar')
+
+
+class HeapTimerQueueTestCase(unittest.TestCase):
+
+    def test_compacts_cancelled_jobs(self):
+        timer_queue = HeapTimerQueue()
+        jobs = [TimerJob(3600, print, []) for _ in range(HeapTimerQueue.COMPACT_MIN_JOBS * 2)]
+        for job in jobs:
+            timer_queue.push(job)
+        for job in jobs[:-1]:
+            job.cancel()
+
+        self.assertLessEqual(len(timer_queue), HeapTimerQueue.COMPACT_MIN_JOBS + 1)
+        self.assertEqual(timer_queue.live_job_count, 1)
+        self.assertEqual(len(timer_queue), timer_queue.cancelled_job_count + 1)
+
+
+class TimingWheelTimerSchedulerTestCase(TimerSchedulerTestCase):
+
+    BACKEND = 'wheel'
+
+    def test_cancel_counters(self):
+        job = self.timer_scheduler.call_later(30, self.record, 'cancelled')
+        self.timer_scheduler.call_later(30, self.record, 'live')
+        job.cancel()
+        self.assertEqual(self.timer_scheduler.live_job_count, 1)
+        self.assertEqual(self.timer_scheduler.cancelled_job_count, 0)
+
+
+class TimingWheelTimerQueueTestCase(unittest.TestCase):
+
+    START = 1000000.0
+
+    def setUp(self):
+        self.timer_queue = TimingWheelTimerQueue(start_time=self.START)
+
+    def push(self, expiry_time):
+        job = TimerJob(expiry_time, print, [])
+        self.timer_queue.push(job)
+        return job
+
+    def test_jobs_never_run_early(self):
+        expiry_times = [self.START + offset for offset in
+                        (0.05, 1, 5, 25.6, 25.8, 60, 3600, 7 * 24 * 3600)]
+        jobs = [self.push(expiry_time) for expiry_time in expiry_times]
+
+        for job in jobs:
+            self.assertEqual(self.timer_queue.pop_expired(job.when() - 0.01), [])
+            self.assertEqual(self.timer_queue.pop_expired(job.when() + self.timer_queue.tick),
+                             [job])
+        self.assertEqual(len(self.timer_queue), 0)
+
+    def test_next_expiry(self):
+        self.assertIsNone(self.timer_queue.next_expiry())
+        job = self.push(self.START + 3600)
+        # the queue wakes up to cascade the job before it is due, but never after.
+        while self.timer_queue.pop_expired(self.timer_queue.next_expiry()) != [job]:
+            self.assertLessEqual(self.timer_queue.next_expiry(),
+                                 job.when() + self.timer_queue.tick)
+        self.assertIsNone(self.timer_queue.next_expiry())
+
+    def test_cancel_removes_job(self):
+        job = self.push(self.START + 60)
+        self.push(self.START + 60)
+        job.cancel()
+        self.assertEqual(len(self.timer_queue), 1)
+        self.assertNotIn(job, self.timer_queue.pop_expired(self.START + 61))
+
+    def test_next_expiry_on_slot_boundary(self):
+        # pop_expired() skips ahead to the next level 1 slot boundary, which it has not
+        # cascaded yet, so next_expiry() must not skip that slot.
+        start = (256 * 40000 - 100) * self.timer_queue.tick
+        self.timer_queue = TimingWheelTimerQueue(start_time=start)
+        job = self.push(start + 30)
+        self.assertEqual(self.timer_queue.pop_expired(start + 9.95), [])
+        self.assertLessEqual(self.timer_queue.next_expiry(), job.when())
+        while self.timer_queue.pop_expired(self.timer_queue.next_expiry()) != [job]:
+            self.assertLessEqual(self.timer_queue.next_expiry(),
+                                 job.when() + self.timer_queue.tick)
+
+    def test_same_as_heap(self):
+        # Drive both queues the way TimerScheduler.run() does, with random jobs.
+        rand = random.Random(1)
+        heap_queue = HeapTimerQueue()
+        heap_run = set()
+        wheel_run = set()
+        expiry_times = {}
+        now = self.START
+        for job_id in range(3000):
+            expiry_time = now + rand.choice((0.3, 30, 3000, 70000)) * rand.random()
+            expiry_times[job_id] = expiry_time
+            jobs = [TimerJob(expiry_time, print, [job_id]) for _ in range(2)]
+            heap_queue.push(jobs[0])
+            self.timer_queue.push(jobs[1])
+            if rand.random() < 0.2:
+                for job in jobs:
+                    job.cancel()
+
+            wheel_expiry = self.timer_queue.next_expiry()
+            heap_expiry = min((job.when() for _, _, job in heap_queue.timer_heap
+                               if not job.cancelled()), default=None)
+            if heap_expiry is None:
+                self.assertIsNone(wheel_expiry)
+            else:
+                # the wheel never sleeps past a job that is due.
+                self.assertLessEqual(wheel_expiry, heap_expiry + self.timer_queue.tick)
+            if wheel_expiry is not None and rand.random() < 0.7:
+                now = max(now, wheel_expiry)
+            else:
+                now += rand.random()
+
+            heap_run.update(job.args[0] for job in heap_queue.pop_expired(now))
+            for job in self.timer_queue.pop_expired(now):
+                self.assertLessEqual(job.when(), now)
+                wheel_run.add(job.args[0])
+            self.assertTrue(wheel_run <= heap_run)
+            # jobs run by the heap but not yet the wheel are due within the last tick.
+            for job_id in heap_run - wheel_run:
+                self.assertGreater(expiry_times[job_id], now - self.timer_queue.tick)
+        self.assertEqual(len(self.timer_queue), heap_queue.live_job_count +
+                         len(heap_run - wheel_run))